@@ -0,0 +1,39 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""TPU capacity that tests in this environment may use at the same time."""
+
+from dags.vm_resource import Project, TpuVersion, Zone
+
+
+# Maps (project, zone, TPU version, reserved) to the number of TPU cores that
+# tests may hold at once. Each entry backs one Airflow pool that is shared by
+# every DAG, so tests beyond the capacity queue in Airflow rather than in
+# WAITING_FOR_RESOURCES. TPUs without an entry are not limited.
+TPU_CORES = {
+    # Largest tests: 8x v4-8 in mxla_collective_nightly and mxla_maxtext_nightly
+    (
+        Project.CLOUD_ML_AUTO_SOLUTIONS.value,
+        Zone.US_CENTRAL2_B.value,
+        TpuVersion.V4,
+        False,
+    ): 64,
+    # Largest test: 8x v5p-8 in mxla_maxtext_nightly
+    (
+        Project.TPU_PROD_ENV_AUTOMATED.value,
+        Zone.US_EAST5_A.value,
+        TpuVersion.V5P,
+        True,
+    ): 64,
+}
@@ -52,7 +52,13 @@ with models.DAG(
       "docker_image": DockerImage.MAXTEXT_TPU_JAX_NIGHTLY.value,
   }
 
-  tests = []
+  # Run name prefix, extra setup commands and quantization of each variant
+  variants = [
+      ("bf16", [], ""),
+      ("int8-aqtp061", ["pip install aqtp==0.6.1"], "int8"),
+      ("int8-aqpt062", ["pip install aqtp==0.6.2"], "int8"),
+  ]
+
   for tpu, models in sweep_model_configs.items():
     for model_size, num_cores in models:
       run_cmds = [
@@ -60,48 +66,12 @@ with models.DAG(
           f"bash MaxText/configs/{tpu}/{model_size}.sh EXECUTABLE=train.py OUTPUT_PATH={base_output_directory} PLATFORM=gke",
       ]
 
-      tests.extend(
-          maxtext_sweep_gke_config.get_maxtext_sweep_gke_config(
-              **shared_task_config,
-              tpu_cores=num_cores,
-              run_name_prefix=f"bf16-{model_size}",
-              base_run_model_cmds=run_cmds,
-              sweep_params={
-                  "M_QUANTIZATION": [
-                      "",
-                  ]
-              },
-          )
-      )
-
-      tests.extend(
-          maxtext_sweep_gke_config.get_maxtext_sweep_gke_config(
-              **shared_task_config,
-              tpu_cores=num_cores,
-              run_name_prefix=f"int8-aqtp061-{model_size}",
-              base_run_model_cmds=["pip install aqtp==0.6.1"] + run_cmds,
-              sweep_params={
-                  "M_QUANTIZATION": [
-                      "int8",
-                  ]
-              },
-          )
-      )
-
-      tests.extend(
-          maxtext_sweep_gke_config.get_maxtext_sweep_gke_config(
-              **shared_task_config,
-              tpu_cores=num_cores,
-              run_name_prefix=f"int8-aqpt062-{model_size}",
-              base_run_model_cmds=["pip install aqtp==0.6.2"] + run_cmds,
-              sweep_params={
-                  "M_QUANTIZATION": [
-                      "int8",
-                  ]
-              },
-          )
-      )
-
-  # Run jobs
-  for test in tests:
-    test.run_with_run_name_generation()
+      for prefix, install_cmds, quantization in variants:
+        tests = maxtext_sweep_gke_config.get_maxtext_sweep_gke_config(
+            **shared_task_config,
+            tpu_cores=num_cores,
+            run_name_prefix=f"{prefix}-{model_size}",
+            base_run_model_cmds=install_cmds + run_cmds,
+        )
+        for test in tests:
+          test.run_sweep(sweep_params={"M_QUANTIZATION": [quantization]})
@@ -0,0 +1,74 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+An example DAG to search for the MaxText learning rate and batch size of a 16B
+model on 1xv4-128 with successive halving. Each round trains the best third of
+the previous round's configs for three times as many steps.
+"""
+
+import datetime
+from airflow import models
+from dags import test_owner
+from dags.vm_resource import TpuVersion, Zone, Project, ClusterName, DockerImage
+from dags.multipod.configs import gke_config
+from xlml.apis import metric_config
+
+with models.DAG(
+    dag_id="maxtext_halving_gke_example_dag",
+    schedule=None,
+    tags=["multipod_team", "maxtext"],
+    start_date=datetime.datetime(2024, 1, 10),
+    catchup=False,
+    concurrency=2,
+) as dag:
+  # MaxText set up and run commands. The number of steps is set by the search
+  # through `M_STEPS`.
+  base_output_directory = "gs://maxtext-experiments-multipod"
+  base_run_model_cmds = [
+      f"python3 MaxText/train.py MaxText/configs/base.yml base_output_directory={base_output_directory} dataset_path=gs://max-datasets-rogue enable_checkpointing=false global_parameter_scale=16",
+  ]
+
+  maxtext_halving_gke_test = gke_config.get_gke_config(
+      test_owner=test_owner.RAYMOND_Z,
+      project_name=Project.TPU_PROD_ENV_MULTIPOD.value,
+      cluster_name=ClusterName.V4_128_MULTISLICE_CLUSTER.value,
+      tpu_zone=Zone.US_CENTRAL2_B.value,
+      time_out_in_min=60,
+      base_output_directory=base_output_directory,
+      tpu_version=TpuVersion.V4,
+      tpu_cores=128,
+      num_slices=1,
+      docker_image=DockerImage.MAXTEXT_TPU_JAX_STABLE.value,
+      test_name="maxtext-16b-halving",
+      run_model_cmds=base_run_model_cmds,
+      dataset_name=metric_config.DatasetOption.BENCHMARK_DATASET,
+      dataset_project=Project.TPU_PROD_ENV_MULTIPOD.value,
+      composer_project=Project.TPU_PROD_ENV_MULTIPOD.value,
+      metric_aggregation_strategy=metric_config.AggregationStrategy.LAST,
+  )
+
+  # 9 configs for 10 steps, then the best 3 for 30 steps, then the best one
+  # for 90 steps. Configs that run out of memory are dropped.
+  maxtext_halving_gke_test.run_successive_halving(
+      sweep_params={
+          "M_LEARNING_RATE": [1e-4, 3e-4, 1e-3],
+          "M_PER_DEVICE_BATCH_SIZE": [4, 8, 16],
+      },
+      metric_key="learning/loss",
+      budget_param="M_STEPS",
+      min_budget=10,
+      maximize=False,
+      max_active_tis_per_dagrun=2,
+  )
@@ -22,7 +22,8 @@ import datetime
 from airflow import models
 from dags import test_owner
 from dags.vm_resource import TpuVersion, Zone, Project, ClusterName, DockerImage
-from dags.multipod.configs import maxtext_sweep_gke_config
+from dags.multipod.configs import gke_config
+from xlml.apis import metric_config
 
 # Set concurrency to number of workers otherwise tasks may time out
 # if there are more concurrent tasks running at a time than number of workers
@@ -40,25 +41,28 @@ with models.DAG(
       f"python3 MaxText/train.py MaxText/configs/base.yml base_output_directory={base_output_directory} dataset_path=gs://max-datasets-rogue enable_checkpointing=false global_parameter_scale=16 steps=10",
   ]
 
-  # Get list of MaxText GKE XPK jobs
-  maxtext_sweep_gke_test = (
-      maxtext_sweep_gke_config.get_maxtext_sweep_gke_config(
-          test_owner=test_owner.RAYMOND_Z,
-          project_name=Project.TPU_PROD_ENV_MULTIPOD.value,
-          cluster_name=ClusterName.V4_128_MULTISLICE_CLUSTER.value,
-          tpu_zone=Zone.US_CENTRAL2_B.value,
-          time_out_in_min=60,
-          base_output_directory=base_output_directory,
-          tpu_version=TpuVersion.V4,
-          tpu_cores=128,
-          num_slices=[1],
-          docker_image=DockerImage.MAXTEXT_TPU_JAX_STABLE.value,
-          run_name_prefix="maxtext-16b",
-          base_run_model_cmds=base_run_model_cmds,
-          sweep_params={"M_PER_DEVICE_BATCH_SIZE": [2, 4, 8]},
-      )
+  # Get the MaxText GKE XPK job to sweep over
+  maxtext_sweep_gke_test = gke_config.get_gke_config(
+      test_owner=test_owner.RAYMOND_Z,
+      project_name=Project.TPU_PROD_ENV_MULTIPOD.value,
+      cluster_name=ClusterName.V4_128_MULTISLICE_CLUSTER.value,
+      tpu_zone=Zone.US_CENTRAL2_B.value,
+      time_out_in_min=60,
+      base_output_directory=base_output_directory,
+      tpu_version=TpuVersion.V4,
+      tpu_cores=128,
+      num_slices=1,
+      docker_image=DockerImage.MAXTEXT_TPU_JAX_STABLE.value,
+      test_name="maxtext-16b",
+      run_model_cmds=base_run_model_cmds,
+      dataset_name=metric_config.DatasetOption.BENCHMARK_DATASET,
+      dataset_project=Project.TPU_PROD_ENV_MULTIPOD.value,
+      composer_project=Project.TPU_PROD_ENV_MULTIPOD.value,
+      metric_aggregation_strategy=metric_config.AggregationStrategy.MEDIAN,
   )
 
-  # Run jobs
-  for test in maxtext_sweep_gke_test:
-    test.run_with_run_name_generation()
+  # Run one mapped job per sweep param combination
+  maxtext_sweep_gke_test.run_sweep(
+      sweep_params={"M_PER_DEVICE_BATCH_SIZE": [2, 4, 8]},
+      max_active_tis_per_dagrun=2,
+  )
@@ -24,3 +24,12 @@ AXLEARN_DIR = "gs://axlearn-public/tensorflow_datasets"
 
 # GCS bucket for output
 BASE_OUTPUT_DIR = "gs://ml-auto-solutions/output"
+
+# GCS bucket for environments saved after test setup
+SETUP_CACHE_DIR = "gs://ml-auto-solutions/setup-cache"
+
+# GCS bucket for Python wheels and apt packages shared by test setups
+WHEELHOUSE_DIR = "gs://ml-auto-solutions/wheelhouse"
+
+# GCS bucket for content-addressed files staged on test hosts
+STAGING_DIR = "gs://ml-auto-solutions/staging"
@@ -18,6 +18,7 @@ import datetime
 import json
 from typing import Dict
 from xlml.apis import gcp_config, metric_config, task, test_config
+from xlml.utils import probe, wheelhouse
 from dags import test_owner
 from dags.multipod.configs import common
 from dags.vm_resource import TpuVersion, Project, RuntimeVersion
@@ -26,6 +27,9 @@ PROJECT_NAME = Project.CLOUD_ML_AUTO_SOLUTIONS.value
 RUNTIME_IMAGE = RuntimeVersion.TPU_UBUNTU2204_BASE.value
 GCS_SUBFOLDER_PREFIX = test_owner.Team.INFERENCE.value
 
+# Port that the JetStream server listens on and the benchmark connects to.
+JETSTREAM_PORT = 9000
+
 
 def get_maxtext_inference_nightly_config(
     tpu_version: TpuVersion,
@@ -64,6 +68,9 @@ def get_maxtext_inference_nightly_config(
       "cd JetStream && pip install -e . && cd benchmarks && pip install -r requirements.in",
       "pip install torch --index-url https://download.pytorch.org/whl/cpu",
   )
+  set_up_cmds = wheelhouse.wrap_set_up_cmds(
+      set_up_cmds, groups=("jax", "torch-cpu")
+  )
 
   additional_metadata_dict = {
       "model_mode": f"{model_configs['model_mode']}",
@@ -119,8 +126,11 @@ def get_maxtext_inference_nightly_config(
         weight_dtype=${WEIGHT_DTYPE} \
         per_device_batch_size=${PER_DEVICE_BATCH_SIZE} > /dev/null 2>&1 &""",
       "cd ..",
-      # Give server time to start
-      f"sleep {model_configs['sleep_time']}",
+      # Wait for the server to start
+      probe.wait_for_port_cmd(
+          JETSTREAM_PORT,
+          datetime.timedelta(seconds=model_configs["server_start_timeout"]),
+      ),
       # Run benchmark, run eval, save benchmark and eval results, and save predictions to /tmp/request-outputs.json
       f"""python JetStream/benchmarks/benchmark_serving.py \
       --tokenizer maxtext/assets/{model_configs['tokenizer']} \
@@ -37,7 +37,7 @@ with models.DAG(
   test_name_prefix = "maxtext-inference"
   test_models = {
       "llama2-7b": {
-          "sleep_time": 120,
+          "server_start_timeout": 600,
           "tpu_version_cores": [(TpuVersion.V5E, 8), (TpuVersion.V5P, 8)],
           "checkpoint": "gs://inference-benchmarks/models/llama2-7b/2024-04-25-14-01/param-only-decode-ckpt-maxtext/checkpoints/0/items",
           "model_mode": "base",
@@ -56,7 +56,7 @@ with models.DAG(
           "max_output_length": 1024,
       },
       "llama2-13b": {
-          "sleep_time": 120,
+          "server_start_timeout": 600,
           "tpu_version_cores": [(TpuVersion.V5E, 8), (TpuVersion.V5P, 8)],
           "checkpoint": "gs://inference-benchmarks/models/llama2-13b/2024-04-25-14-01/param-only-decode-ckpt-maxtext/checkpoints/0/items",
           "model_mode": "base",
@@ -75,7 +75,7 @@ with models.DAG(
           "max_output_length": 1024,
       },
       "llama2-70b": {
-          "sleep_time": 240,
+          "server_start_timeout": 600,
           "tpu_version_cores": [(TpuVersion.V5P, 8)],
           "per_device_batch_sizes": [12, 16, 20, 24],
           "checkpoint": "gs://inference-benchmarks/models/llama2-70b-chat/2024-05-08-23-16/param-only-decode-ckpt-maxtext/checkpoints/0/items",
@@ -94,7 +94,7 @@ with models.DAG(
           "max_output_length": 1024,
       },
       "gemma-7b": {
-          "sleep_time": 120,
+          "server_start_timeout": 600,
           "tpu_version_cores": [(TpuVersion.V5E, 8), (TpuVersion.V5P, 8)],
           "checkpoint": "gs://inference-benchmarks/models/gemma-7b/2024-04-25-14-01/param-only-decode-ckpt-maxtext/checkpoints/0/items",
           "model_mode": "base",
@@ -123,7 +123,9 @@ with models.DAG(
           model_configs = {}
           model_configs["model_name"] = model
           model_configs["model_mode"] = sweep_model_configs["model_mode"]
-          model_configs["sleep_time"] = sweep_model_configs["sleep_time"]
+          model_configs["server_start_timeout"] = sweep_model_configs[
+              "server_start_timeout"
+          ]
           model_configs["checkpoint"] = sweep_model_configs["checkpoint"]
           model_configs["maxtext_logs"] = sweep_model_configs["maxtext_logs"]
           model_configs["scan_layers"] = sweep_model_configs["scan_layers"]
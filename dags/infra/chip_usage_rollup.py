@@ -0,0 +1,43 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A DAG to roll up the accelerator chip-hours that tests used each day."""
+
+import datetime
+from airflow import models
+from dags import composer_env
+from dags.vm_resource import Project
+from xlml.apis import metric_config
+from xlml.utils import chip_usage
+
+
+# Run once a day at 1 am UTC, to roll up the previous day
+SCHEDULED_TIME = "0 1 * * *" if composer_env.is_prod_env() else None
+
+
+with models.DAG(
+    dag_id="chip_usage_rollup",
+    schedule=SCHEDULED_TIME,
+    tags=["solutions_team", "infra"],
+    start_date=datetime.datetime(2024, 6, 1),
+    catchup=False,
+) as dag:
+  for project in (
+      Project.CLOUD_ML_AUTO_SOLUTIONS,
+      Project.TPU_PROD_ENV_MULTIPOD,
+  ):
+    for dataset in metric_config.DatasetOption:
+      chip_usage.rollup_chip_usage.override(
+          task_id=f"rollup_{project.value}_{dataset.value}".replace("-", "_")
+      )(project.value, dataset.value, day="{{ ds }}")
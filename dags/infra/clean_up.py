@@ -18,7 +18,7 @@ import datetime
 from airflow import models
 from dags import composer_env
 from dags.vm_resource import Project, Zone
-from xlml.utils import tpu
+from xlml.utils import lease, tpu
 
 
 # Run every 10min
@@ -61,6 +61,9 @@ with models.DAG(
       task_id="cleanup_qr_cloud-ml-auto-solutions"
   )(Project.CLOUD_ML_AUTO_SOLUTIONS.value, tpu_zones)
 
+  # Idle TPUs kept for tests to reuse
+  evict_leases = lease.evict_expired_leases()
+
   # Overview dependency
-  node_cloud_ml_auto_solutions >> qr_cloud_ml_auto_solutions
+  evict_leases >> node_cloud_ml_auto_solutions >> qr_cloud_ml_auto_solutions
   node_tpu_prod_env_automated
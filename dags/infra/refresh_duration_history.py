@@ -0,0 +1,45 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A DAG to refresh the test duration history used to schedule tests."""
+
+import datetime
+from airflow import models
+from dags import composer_env
+from dags.vm_resource import Project
+from xlml.apis import metric_config
+from xlml.utils import duration
+
+
+# Run once a day at 2 am UTC, before the nightly tests
+SCHEDULED_TIME = "0 2 * * *" if composer_env.is_prod_env() else None
+
+
+with models.DAG(
+    dag_id="refresh_duration_history",
+    schedule=SCHEDULED_TIME,
+    tags=["solutions_team", "infra"],
+    start_date=datetime.datetime(2024, 6, 1),
+    catchup=False,
+) as dag:
+  duration.refresh_duration_history(
+      [
+          (project.value, dataset.value)
+          for project in (
+              Project.CLOUD_ML_AUTO_SOLUTIONS,
+              Project.TPU_PROD_ENV_MULTIPOD,
+          )
+          for dataset in metric_config.DatasetOption
+      ]
+  )
@@ -0,0 +1,67 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A DAG to prefetch the wheels that test setups install into the wheelhouse."""
+
+import datetime
+from airflow import models
+from dags import composer_env
+from xlml.utils import wheelhouse
+
+
+# Run once a day at 5 am UTC, after most nightly wheels are published
+SCHEDULED_TIME = "0 5 * * *" if composer_env.is_prod_env() else None
+
+TORCH_CPU_INDEX_URL = "https://download.pytorch.org/whl/cpu"
+TORCH_NIGHTLY_CPU_INDEX_URL = "https://download.pytorch.org/whl/nightly/cpu"
+
+# `pip download` arguments of the requirements in each group of wheels.
+REQUIREMENTS = {
+    # Only CPU builds, since the default builds pull in several GB of CUDA
+    # libraries that every VM would copy. Each setup copies only the groups of
+    # the wheels it installs.
+    "torch-cpu": (("--index-url", TORCH_CPU_INDEX_URL, "torch"),),
+    "torch-nightly-cpu": (
+        (
+            "--pre",
+            "torch",
+            "torchvision",
+            "torchaudio",
+            "--index-url",
+            TORCH_NIGHTLY_CPU_INDEX_URL,
+        ),
+    ),
+    "jax": (
+        (
+            "jax[tpu]",
+            "-f",
+            "https://storage.googleapis.com/jax-releases/libtpu_releases.html",
+        ),
+    ),
+    "tensorflow": (("tensorflow-text-nightly",),),
+}
+
+
+with models.DAG(
+    dag_id="refresh_wheelhouse",
+    schedule=SCHEDULED_TIME,
+    tags=["solutions_team", "pytorch_xla", "inference", "infra"],
+    start_date=datetime.datetime(2024, 6, 1),
+    catchup=False,
+) as dag:
+  for group, requirements in REQUIREMENTS.items():
+    wheelhouse.refresh_wheelhouse.override(task_id=f"refresh_{group}")(
+        group, requirements
+    )
+  wheelhouse.delete_old_apt_packages()
@@ -0,0 +1,34 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A DAG to keep Airflow pools in sync with the TPU capacity config."""
+
+import datetime
+from airflow import models
+from dags import composer_env
+from xlml.utils import pool
+
+
+# Run every hour
+SCHEDULED_TIME = "0 * * * *" if composer_env.is_prod_env() else None
+
+
+with models.DAG(
+    dag_id="sync_pools",
+    schedule=SCHEDULED_TIME,
+    tags=["solutions_team", "infra"],
+    start_date=datetime.datetime(2024, 6, 1),
+    catchup=False,
+) as dag:
+  pool.sync_pools()
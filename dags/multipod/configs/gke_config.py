@@ -15,6 +15,7 @@
 """Utilities to construct configs for maxtext DAG on GKE."""
 
 from xlml.apis import gcp_config, metric_config, task, test_config
+from xlml.utils import name_format
 from dags import test_owner, gcs_bucket
 from dags.vm_resource import TpuVersion, Project, ClusterName, GpuVersion, CpuVersion
 from typing import Iterable
@@ -106,13 +107,8 @@ def get_gke_maxtext_nightly_config(
       composer_project=composer_project,
   )
 
-  current_time = datetime.datetime.now()
-  current_date = current_time.strftime("%Y-%m-%d")
-  current_datetime = current_time.strftime("%Y-%m-%d-%H-%M-%S")
-  base_output_directory = (
-      f"{gcs_bucket.BASE_OUTPUT_DIR}/maxtext/nightly/automated/{current_date}"
-  )
-  run_name = f"{num_slices}slice-V{tpu_version.value}_{tpu_cores}-maxtext-nightly-{current_datetime}"
+  base_output_directory = f"{gcs_bucket.BASE_OUTPUT_DIR}/maxtext/nightly/automated/{name_format.RUN_DATE}"
+  run_name = f"{num_slices}slice-V{tpu_version.value}_{tpu_cores}-maxtext-nightly-{name_format.RUN_DATETIME}"
 
   run_model_cmds = (
       "bash preflight.sh PLATFORM=GKE",
@@ -213,13 +209,8 @@ def get_gke_gpt3_6b_nightly_config(
       composer_project=composer_project,
   )
 
-  current_time = datetime.datetime.now()
-  current_date = current_time.strftime("%Y-%m-%d")
-  current_datetime = current_time.strftime("%Y-%m-%d-%H-%M-%S")
-  base_output_directory = (
-      f"{gcs_bucket.BASE_OUTPUT_DIR}/maxtext/nightly/automated/{current_date}"
-  )
-  run_name = f"{num_slices}slice-V{tpu_version.value}_{tpu_cores}-gpt3-6b-nightly-{current_datetime}"
+  base_output_directory = f"{gcs_bucket.BASE_OUTPUT_DIR}/maxtext/nightly/automated/{name_format.RUN_DATE}"
+  run_name = f"{num_slices}slice-V{tpu_version.value}_{tpu_cores}-gpt3-6b-nightly-{name_format.RUN_DATETIME}"
 
   run_model_cmds = (
       "bash preflight.sh PLATFORM=GKE",
@@ -17,11 +17,11 @@
 import datetime
 import os
 from xlml.apis import gcp_config, metric_config, task, test_config
-from base64 import b64encode
 from collections.abc import Iterable
 from dags import test_owner
 from dags.multipod.configs import common
 from dags.vm_resource import TpuVersion, Project, RuntimeVersion, ClusterName
+from xlml.utils import staging
 
 
 def get_legacy_unit_test_config(
@@ -54,11 +54,9 @@ def get_legacy_unit_test_config(
       'XLMLTEST_MULTIPOD_LEGACY_TEST_DIR',
       '/home/airflow/gcs/dags/dags/multipod/legacy_tests',
   )
-  with open(os.path.join(unit_test_folder, script_to_copy), 'rb') as f:
-    encoded_script = b64encode(f.read()).decode()
+  staged_script = staging.stage(os.path.join(unit_test_folder, script_to_copy))
 
   run_model_cmds = (
-      f'echo {encoded_script} | base64 -d > {script_to_copy}',
       'export TPU_STDERR_LOG_LEVEL=0 TPU_MIN_LOG_LEVEL=0 JAX_USE_PJRT_C_API_ON_TPU=1 TF_CPP_MIN_LOG_LEVEL=0',
       *test_cmd,
   )
@@ -76,6 +74,7 @@ def get_legacy_unit_test_config(
       num_slices=num_slices,
       cluster_name=cluster_name,
       docker_image=docker_image,
+      staged_files=(staged_script,),
   )
 
   return task.XpkTask(
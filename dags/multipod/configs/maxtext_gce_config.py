@@ -15,6 +15,7 @@
 """Utilities to construct configs for maxtext DAG."""
 
 from xlml.apis import gcp_config, metric_config, task, test_config
+from xlml.utils import name_format
 from dags import test_owner, gcs_bucket
 from dags.multipod.configs import common
 from dags.vm_resource import TpuVersion, Project, RuntimeVersion
@@ -45,14 +46,10 @@ def get_maxtext_nightly_config(
       dataset_name=metric_config.DatasetOption.XLML_DATASET,
   )
 
-  current_time = datetime.datetime.now()
-  current_date = current_time.strftime("%Y-%m-%d")
-  current_datetime = current_time.strftime("%Y-%m-%d-%H-%M-%S")
-
   trigger = "automated" if automated_test else "manual"
-  base_output_directory = f"{gcs_bucket.BASE_OUTPUT_DIR}/maxtext/{test_mode.value}/{trigger}/{current_date}"
+  base_output_directory = f"{gcs_bucket.BASE_OUTPUT_DIR}/maxtext/{test_mode.value}/{trigger}/{name_format.RUN_DATE}"
 
-  run_name = f"{num_slices}slice-V{tpu_version.value}_{tpu_cores}-maxtext-{test_mode.value}-{current_datetime}"
+  run_name = f"{num_slices}slice-V{tpu_version.value}_{tpu_cores}-maxtext-{test_mode.value}-{name_format.RUN_DATETIME}"
 
   test_platform = common.Platform.GCE
   set_up_cmds = common.setup_maxtext(test_mode, test_platform)
@@ -17,15 +17,13 @@
 import datetime
 from xlml.apis import gcp_config, metric_config, task, test_config
 from dags.vm_resource import TpuVersion
-import itertools
-from typing import List, Iterable, Dict, Any
+from typing import List, Iterable
 
 
 def get_maxtext_sweep_gke_config(
     test_owner: str,
     tpu_version: TpuVersion,
     num_slices: List[int],
-    sweep_params: Dict[str, List[Any]],
     tpu_cores: int,
     tpu_zone: str,
     time_out_in_min: int,
@@ -40,6 +38,12 @@ def get_maxtext_sweep_gke_config(
     dataset_project: str = None,
     composer_project: str = None,
 ) -> List[task.XpkTask]:
+  """Get one MaxText XPK task per number of slices to sweep over.
+
+  The number of slices sets the shape of the workload, so it can't be mapped
+  over at run time. Call `run_sweep` on each task to sweep over the other
+  parameters.
+  """
   if not dataset_project:
     dataset_project = project_name
   if not composer_project:
@@ -53,38 +57,24 @@ def get_maxtext_sweep_gke_config(
       composer_project=composer_project,
   )
 
-  # Add num_slices as a sweep param
-  sweep_params["NUM_SLICES"] = num_slices
-
-  # Convert sweep_params to a list of lists to generate sweep param combinations
-  sweep_params_list = []
-  for param, values in sweep_params.items():
-    sweep_params_list.append([(param, val) for val in values])
+  job_metric_config = metric_config.MetricConfig(
+      tensorboard_summary=metric_config.SummaryConfig(
+          file_location=base_output_directory,
+          aggregation_strategy=metric_aggregation_strategy,
+          use_regex_file_location=True,
+      ),
+  )
 
-  # Generate all combinations of sweep param configurations and create a XpkTask for each one
   xpk_task_list = []
-  for idx, config in enumerate(itertools.product(*sweep_params_list)):
-    config_dict = {key: value for (key, value) in config}
-
-    # Remove num_slices as a sweep param after combinations have been generated
-    curr_num_slices = config_dict["NUM_SLICES"]
-    del config_dict["NUM_SLICES"]
-
-    # Export sweep params as env variables for MaxText to read
-    run_model_cmds = [
-        f"export {key}={value}" for (key, value) in config_dict.items()
-    ]
-    for cmd in base_run_model_cmds:
-      run_model_cmds.append(cmd)
-
+  for curr_num_slices in num_slices:
     job_test_config = test_config.TpuGkeTest(
         test_config.Tpu(
             version=tpu_version,
             cores=tpu_cores,
         ),
-        test_name=f"{run_name_prefix}-{idx}",
+        test_name=run_name_prefix,
         set_up_cmds=None,
-        run_model_cmds=run_model_cmds,
+        run_model_cmds=base_run_model_cmds,
         timeout=datetime.timedelta(minutes=time_out_in_min),
         task_owner=test_owner,
         num_slices=curr_num_slices,
@@ -92,14 +82,6 @@ def get_maxtext_sweep_gke_config(
         docker_image=docker_image,
     )
 
-    job_metric_config = metric_config.MetricConfig(
-        tensorboard_summary=metric_config.SummaryConfig(
-            file_location=base_output_directory,
-            aggregation_strategy=metric_aggregation_strategy,
-            use_regex_file_location=True,
-        ),
-    )
-
     xpk_task = task.XpkTask(
         task_test_config=job_test_config,
         task_gcp_config=job_gcp_config,
@@ -15,6 +15,7 @@
 """Utilities to construct configs for maxtext DAG."""
 
 from xlml.apis import gcp_config, metric_config, task, test_config
+from xlml.utils import name_format
 from dags import test_owner, gcs_bucket
 from dags.multipod.configs import common
 from dags.vm_resource import TpuVersion, Project, RuntimeVersion
@@ -46,11 +47,7 @@ def get_mxla_collective_config(
       composer_project=project_name,
   )
 
-  current_time = datetime.datetime.now()
-  current_date = current_time.strftime("%Y-%m-%d")
-  current_datetime = current_time.strftime("%Y-%m-%d-%H-%M-%S")
-
-  base_output_directory = f"{gcs_bucket.BASE_OUTPUT_DIR}/multipod/mxla/nightly/automated/{current_date}/{num_slices}slice-V{tpu_version.value}_{tpu_cores}-mxla-collective-{bytes_to_transfer}transferBytes-{current_datetime}"
+  base_output_directory = f"{gcs_bucket.BASE_OUTPUT_DIR}/multipod/mxla/nightly/automated/{name_format.RUN_DATE}/{num_slices}slice-V{tpu_version.value}_{tpu_cores}-mxla-collective-{bytes_to_transfer}transferBytes-{name_format.RUN_DATETIME}"
 
   test_platform = common.Platform.GCE
   set_up_cmds = common.setup_mxla_collective()
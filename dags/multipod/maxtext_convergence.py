@@ -22,6 +22,7 @@ from dags.vm_resource import TpuVersion, Zone, DockerImage, ClusterName
 from dags.multipod.configs import gke_config
 from dags.multipod.configs.common import SetupMode
 from xlml.apis import gcp_config, metric_config, task, test_config
+from xlml.utils import name_format
 
 # Run once a day at 6 am UTC (10 pm PST)
 SCHEDULED_TIME = "0 6 * * *" if composer_env.is_prod_env() else None
@@ -34,11 +35,7 @@ with models.DAG(
     catchup=False,
     concurrency=2,
 ) as dag:
-  current_time = datetime.datetime.now()
-  current_date = current_time.strftime("%Y-%m-%d")
-  base_output_directory = (
-      f"{gcs_bucket.BASE_OUTPUT_DIR}/maxtext/stable/automated/{current_date}"
-  )
+  base_output_directory = f"{gcs_bucket.BASE_OUTPUT_DIR}/maxtext/stable/automated/{name_format.RUN_DATE}"
   dataset_path = gcs_bucket.MAXTEXT_DIR
 
   steps = 10200  # Half Chinchilla
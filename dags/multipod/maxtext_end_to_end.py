@@ -42,7 +42,7 @@ with models.DAG(
       "gpt3": "tpu/test_gpt3",
   }
 
-  timestamp = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")
+  timestamp = name_format.RUN_DATETIME
   train_base = (
       "XLA_PYTHON_CLIENT_MEM_FRACTION=0.65 TF_FORCE_GPU_ALLOW_GROWTH=true "
       "python3 MaxText/train.py MaxText/configs/base.yml "
@@ -64,8 +64,7 @@ with models.DAG(
           docker_image=image.value,
           run_name_prefix=f"maxtext-{model}-{mode.value}",
           base_run_model_cmds=base_run_model_cmds,
-          sweep_params=quantization_sweep,
       )
 
       for test in maxtext_sweep_gke_test:
-        test.run_with_run_name_generation()
+        test.run_sweep(sweep_params=quantization_sweep)
@@ -18,6 +18,7 @@ import datetime
 import enum
 from typing import Tuple
 from xlml.apis import gcp_config, metric_config, task, test_config
+from xlml.utils import wheelhouse
 import dags.vm_resource as resource
 from dags import test_owner
 
@@ -115,7 +116,7 @@ def set_up_torchbench_tpu(
       return f"python install.py --continue_on_fail {pipe_file_cmd}"
     return f"python install.py models {model_name} {pipe_file_cmd}"
 
-  return (
+  set_up_cmds = (
       "pip3 install -U setuptools",
       "sudo systemctl stop unattended-upgrades",
       "sudo apt-get -y update",
@@ -135,6 +136,9 @@ def set_up_torchbench_tpu(
       f"cd; git clone {version_mapping.TORCH_REPO_BRANCH.value} https://github.com/pytorch/pytorch.git",
       f"cd; git clone {version_mapping.TORCH_XLA_REPO_BRANCH.value} https://github.com/pytorch/xla.git",
   )
+  # Only nightly wheels are prefetched, releases are pinned to older versions.
+  groups = ("torch-nightly-cpu",) if test_version == VERSION.NIGHTLY else ()
+  return wheelhouse.wrap_set_up_cmds(set_up_cmds, groups=groups)
 
 
 def get_torchbench_tpu_config(
@@ -22,6 +22,9 @@ from dags.vm_resource import Project, Zone, V5_NETWORKS, V5E_SUBNETWORKS
 
 # Run once a day at 2 pm UTC (6 am PST)
 SCHEDULED_TIME = "0 14 * * *" if composer_env.is_prod_env() else None
+# v4-8 TPUs that stay idle this long after a test are released, unless a later
+# test with the same setup reuses them.
+V4_8_REUSE_TTL = datetime.timedelta(minutes=30)
 US_CENTRAL1_C = gcp_config.GCPConfig(
     Project.CLOUD_ML_AUTO_SOLUTIONS.value,
     Zone.US_CENTRAL1_C.value,
@@ -78,18 +81,20 @@ def torchvision():
           "pt-nightly-resnet50-pjrt-ddp-fake-v3-8-1vm",
       )
   ]
-  resnet_v4_8_tests = [
-      task.run_queued_resource_test(
-          test_config.JSonnetTpuVmTest.from_pytorch(test),
-          US_CENTRAL2_B,
-      )
-      for test in (
-          "pt-nightly-resnet50-pjrt-fake-v4-8-1vm",
-          "pt-nightly-resnet50-pjrt-ddp-fake-v4-8-1vm",
-          "pt-nightly-resnet50-spmd-batch-fake-v4-8-1vm",
-          "pt-nightly-resnet50-spmd-spatial-fake-v4-8-1vm",
-      )
-  ]
+  # These share one TPU, since they have the same setup.
+  resnet_v4_8_tests = task.run_queued_resource_test_group(
+      "pt-nightly-resnet50-fake-v4-8-1vm",
+      [
+          test_config.JSonnetTpuVmTest.from_pytorch(test)
+          for test in (
+              "pt-nightly-resnet50-pjrt-fake-v4-8-1vm",
+              "pt-nightly-resnet50-pjrt-ddp-fake-v4-8-1vm",
+              "pt-nightly-resnet50-spmd-batch-fake-v4-8-1vm",
+              "pt-nightly-resnet50-spmd-spatial-fake-v4-8-1vm",
+          )
+      ],
+      US_CENTRAL2_B,
+  )
   resnet_v4_32 = task.run_queued_resource_test(
       test_config.JSonnetTpuVmTest.from_pytorch(
           "pt-nightly-resnet50-pjrt-fake-v4-32-1vm"
@@ -106,7 +111,7 @@ def torchvision():
       US_EAST1_C,
   )
 
-  mnist_v2_8 >> (resnet_v2_8, *resnet_v4_8_tests, resnet_v4_32, resnet_v5lp_4)
+  mnist_v2_8 >> (resnet_v2_8, resnet_v4_8_tests, resnet_v4_32, resnet_v5lp_4)
   resnet_v2_8 >> resnet_v3_8_tests
 
   resnet_v100_2x2 = task.GpuGkeTask(
@@ -159,12 +164,14 @@ def huggingface():
           "pt-nightly-accelerate-smoke-v4-8-1vm"
       ),
       US_CENTRAL2_B,
+      reuse_ttl=V4_8_REUSE_TTL,
   )
   diffusers_v4_8 = task.run_queued_resource_test(
       test_config.JSonnetTpuVmTest.from_pytorch(
           "pt-nightly-hf-diffusers-func-v4-8-1vm"
       ),
       US_CENTRAL2_B,
+      reuse_ttl=V4_8_REUSE_TTL,
   )
 
   accelerate_v4_8 >> diffusers_v4_8
@@ -174,6 +181,7 @@ def huggingface():
           "pt-nightly-hf-bert-pjrt-func-v4-8-1vm"
       ),
       US_CENTRAL2_B,
+      reuse_ttl=V4_8_REUSE_TTL,
   )
 
 
@@ -184,12 +192,14 @@ def llama():
           "pt-nightly-llama2-infer-func-v4-8-1vm"
       ),
       US_CENTRAL2_B,
+      reuse_ttl=V4_8_REUSE_TTL,
   )
   llama_train_v4_8 = task.run_queued_resource_test(
       test_config.JSonnetTpuVmTest.from_pytorch(
           "pt-nightly-llama2-train-spmd-func-v4-8-1vm"
       ),
       US_CENTRAL2_B,
+      reuse_ttl=V4_8_REUSE_TTL,
   )
 
 
@@ -20,6 +20,7 @@ from typing import Tuple
 import uuid
 from absl import logging
 from xlml.apis import gcp_config, metric_config, task, test_config
+from xlml.utils import name_format
 from dags import test_owner
 from dags.solutions_team.configs.pax import common
 from dags.vm_resource import TpuVersion, RuntimeVersion, Project
@@ -43,7 +44,7 @@ def get_setup_cmds(
     return common.set_up_google_pax() + (ckp_cmds,)
   elif pax_version is PaxVersion.NIGHTLY:
     logging.info("Running nightly Pax version.")
-    build_date = datetime.datetime.today().strftime("%Y%m%d")
+    build_date = name_format.RUN_DATE_NODASH
     ckp_cmds = (
         f"gsutil -m cp -r {ckp_path} {job_log_dir}" if ckp_path else "echo"
     )
@@ -16,6 +16,8 @@
 
 from __future__ import annotations
 
+from xlml.utils import wheelhouse
+
 
 # Keras API
 AAA_CONNECTION = "aaa_connection"
@@ -114,10 +116,13 @@ def install_tf(
       "sudo cp /home/ml-auto-solutions/.local/lib/python3.10/site-packages/libtpu/libtpu.so /lib/libtpu.so",
   )
 
-  return (
-      "pip install tensorflow-text-nightly",
-      *cmds_install_tf_team_tf_whl,
-      CMD_PRINT_TF_VERSION,
+  return wheelhouse.wrap_set_up_cmds(
+      (
+          "pip install tensorflow-text-nightly",
+          *cmds_install_tf_team_tf_whl,
+          CMD_PRINT_TF_VERSION,
+      ),
+      groups=("tensorflow",),
   )
 
 
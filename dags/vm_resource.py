@@ -14,8 +14,8 @@
 
 """The file for common projects, zone, and runtime versions."""
 
-import datetime
 import enum
+from xlml.utils.name_format import RUN_DATE, RUN_DATE_NODASH
 
 
 V5_NETWORKS_PREFIX = "projects/tpu-prod-env-automated"
@@ -154,34 +154,33 @@ class ClusterName(enum.Enum):
 
 
 class DockerImage(enum.Enum):
-  """Common docker images."""
+  """Common docker images.
+
+  Dated tags are templates for the day the DAG run started, so they only
+  resolve when passed as task arguments.
+  """
 
   XPK_JAX_TEST = "gcr.io/cloud-ml-auto-solutions/xpk_jax_test:latest"
   PYTORCH_NIGHTLY = (
       "us-central1-docker.pkg.dev/tpu-pytorch-releases/docker/"
-      f"xla:nightly_3.10_tpuvm_{datetime.datetime.today().strftime('%Y%m%d')}"
+      f"xla:nightly_3.10_tpuvm_{RUN_DATE_NODASH}"
   )
   MAXTEXT_TPU_JAX_STABLE = (
-      "gcr.io/tpu-prod-env-multipod/maxtext_jax_stable:"
-      f"{datetime.datetime.today().strftime('%Y-%m-%d')}"
+      f"gcr.io/tpu-prod-env-multipod/maxtext_jax_stable:{RUN_DATE}"
   )
   MAXTEXT_TPU_JAX_NIGHTLY = (
-      "gcr.io/tpu-prod-env-multipod/maxtext_jax_nightly:"
-      f"{datetime.datetime.today().strftime('%Y-%m-%d')}"
+      f"gcr.io/tpu-prod-env-multipod/maxtext_jax_nightly:{RUN_DATE}"
   )
   MAXTEXT_GPU_JAX_PINNED = (
-      "gcr.io/tpu-prod-env-multipod/maxtext_gpu_jax_pinned:"
-      f"{datetime.datetime.today().strftime('%Y-%m-%d')}"
+      f"gcr.io/tpu-prod-env-multipod/maxtext_gpu_jax_pinned:{RUN_DATE}"
   )
   MAXTEXT_GPU_JAX_STABLE = (
-      "gcr.io/tpu-prod-env-multipod/maxtext_gpu_jax_stable:"
-      f"{datetime.datetime.today().strftime('%Y-%m-%d')}"
+      f"gcr.io/tpu-prod-env-multipod/maxtext_gpu_jax_stable:{RUN_DATE}"
   )
   MAXTEXT_GPU_JAX_NIGHTLY = (
-      "gcr.io/tpu-prod-env-multipod/maxtext_gpu_jax_nightly:"
-      f"{datetime.datetime.today().strftime('%Y-%m-%d')}"
+      f"gcr.io/tpu-prod-env-multipod/maxtext_gpu_jax_nightly:{RUN_DATE}"
   )
   CLOUD_HYBRIDSIM_NIGHTLY = (
       "us-docker.pkg.dev/cloud-tpu-v2-images-dev/hybridsim/cloud_hybridsim_gcloud_python:"
-      f"{datetime.datetime.today().strftime('%Y-%m-%d')}"
+      f"{RUN_DATE}"
   )
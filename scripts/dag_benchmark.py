@@ -0,0 +1,247 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark how expensive each DAG file is for the Airflow scheduler.
+
+Every file under `dags/` is loaded through `DagBag` in a fresh interpreter, the
+same way the DAG processor parses it, and the results are written as JSON:
+
+  - `import_sec`: time to execute the file, including DAG construction.
+  - `parse_sec`: `import_sec` plus serializing the resulting DAGs.
+  - `peak_memory_mb`: growth of the peak RSS while parsing the file.
+  - `task_count` and `task_group_depth` for each DAG in the file.
+
+If `--baseline` points at a previous report, files that got slower or gained
+tasks beyond the configured tolerances are reported and the script exits with
+a non-zero status.
+
+Usage: scripts/dag-benchmark.sh [--baseline=old.json] [--output=new.json]
+"""
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+from absl import app
+from absl import flags
+from absl import logging
+
+_DAG_FOLDER = flags.DEFINE_string(
+    "dag_folder", "dags", "Directory to search for DAG files."
+)
+_EXCLUDE = flags.DEFINE_list(
+    "exclude",
+    [os.environ.get("XLMLTEST_MULTIPOD_LEGACY_TEST_DIR", "")],
+    "Directories under `dag_folder` to skip.",
+)
+_OUTPUT = flags.DEFINE_string(
+    "output", None, "Path to write the JSON report. Defaults to stdout."
+)
+_BASELINE = flags.DEFINE_string(
+    "baseline", None, "Previous report to check for regressions against."
+)
+_REPEATS = flags.DEFINE_integer(
+    "repeats", 3, "Parse each file this many times and keep the fastest run."
+)
+_TIME_TOLERANCE = flags.DEFINE_float(
+    "time_tolerance",
+    0.25,
+    "Allowed relative increase of `parse_sec` over the baseline.",
+)
+_MIN_TIME_DELTA_SEC = flags.DEFINE_float(
+    "min_time_delta_sec",
+    0.5,
+    "Ignore `parse_sec` increases smaller than this, to absorb noise.",
+)
+_TASK_COUNT_TOLERANCE = flags.DEFINE_float(
+    "task_count_tolerance",
+    0.1,
+    "Allowed relative increase of the task count over the baseline.",
+)
+_WORKER = flags.DEFINE_string(
+    "worker", None, "Internal: parse a single file and print its stats."
+)
+
+
+def task_group_depth(task_group: Any) -> int:
+  """Get the nesting depth of TaskGroups below `task_group`."""
+  depths = [
+      1 + task_group_depth(child)
+      for child in task_group.children.values()
+      if hasattr(child, "children")
+  ]
+  return max(depths, default=0)
+
+
+def parse_file(path: str) -> Dict[str, Any]:
+  """Parse one DAG file in this process and collect its stats."""
+  # Keep Airflow's own imports out of the measurement, since the DAG processor
+  # already has them loaded.
+  from airflow.models.dagbag import DagBag
+  from airflow.serialization.serialized_objects import SerializedDAG
+
+  rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  start = time.perf_counter()
+  dagbag = DagBag(dag_folder=path)
+  import_sec = time.perf_counter() - start
+  for dag in dagbag.dags.values():
+    SerializedDAG.to_dict(dag)
+  parse_sec = time.perf_counter() - start
+  rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+  dags = [
+      {
+          "dag_id": dag.dag_id,
+          "task_count": len(dag.tasks),
+          "task_group_depth": task_group_depth(dag.task_group),
+      }
+      for dag in sorted(dagbag.dags.values(), key=lambda d: d.dag_id)
+  ]
+  return {
+      "file": path,
+      "import_sec": import_sec,
+      "parse_sec": parse_sec,
+      "peak_memory_mb": (rss_after - rss_before) / 1024,
+      "task_count": sum(d["task_count"] for d in dags),
+      "task_group_depth": max((d["task_group_depth"] for d in dags), default=0),
+      "dags": dags,
+      "import_errors": {
+          file: str(error) for file, error in dagbag.import_errors.items()
+      },
+  }
+
+
+def benchmark_file(path: str, repeats: int) -> Dict[str, Any]:
+  """Parse `path` in fresh interpreters and keep the fastest run."""
+  env = {**os.environ, "AIRFLOW__CORE__LOAD_EXAMPLES": "False"}
+  runs = []
+  for _ in range(repeats):
+    result = subprocess.run(
+        [sys.executable, __file__, f"--worker={path}"],
+        capture_output=True,
+        check=True,
+        env=env,
+        text=True,
+    )
+    runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+  return min(runs, key=lambda r: r["parse_sec"])
+
+
+def find_dag_files(dag_folder: str, exclude: List[str]) -> List[str]:
+  """List Python files under `dag_folder`, skipping `exclude`."""
+  exclude = [os.path.normpath(e) for e in exclude if e]
+  paths = []
+  for root, dirs, files in os.walk(dag_folder):
+    dirs[:] = sorted(
+        d
+        for d in dirs
+        if os.path.normpath(os.path.join(root, d)) not in exclude
+    )
+    paths.extend(
+        os.path.join(root, f) for f in sorted(files) if f.endswith(".py")
+    )
+  return paths
+
+
+def find_regressions(
+    report: Dict[str, Any],
+    baseline: Dict[str, Any],
+    time_tolerance: float,
+    min_time_delta_sec: float,
+    task_count_tolerance: float,
+) -> List[str]:
+  """Compare `report` against `baseline` file by file.
+
+  Files that only exist in one of the reports are not compared.
+
+  Returns:
+    A description of each regression, or an empty list.
+  """
+  baseline_files = {f["file"]: f for f in baseline["files"]}
+  regressions = []
+  for current in report["files"]:
+    previous = baseline_files.get(current["file"])
+    if not previous:
+      continue
+
+    allowed_sec = max(
+        previous["parse_sec"] * (1 + time_tolerance),
+        previous["parse_sec"] + min_time_delta_sec,
+    )
+    if current["parse_sec"] > allowed_sec:
+      regressions.append(
+          f"{current['file']}: parse time {previous['parse_sec']:.2f}s ->"
+          f" {current['parse_sec']:.2f}s"
+      )
+    if current["task_count"] > previous["task_count"] * (
+        1 + task_count_tolerance
+    ):
+      regressions.append(
+          f"{current['file']}: task count {previous['task_count']} ->"
+          f" {current['task_count']}"
+      )
+    if current["import_errors"] and not previous["import_errors"]:
+      regressions.append(f"{current['file']}: new import errors")
+  return regressions
+
+
+def main(argv):
+  del argv
+
+  if _WORKER.value:
+    print(json.dumps(parse_file(_WORKER.value)))
+    return 0
+
+  files = []
+  for path in find_dag_files(_DAG_FOLDER.value, _EXCLUDE.value):
+    logging.info(f"Benchmarking {path}")
+    files.append(benchmark_file(path, _REPEATS.value))
+
+  report = {
+      "files": files,
+      "total": {
+          "parse_sec": sum(f["parse_sec"] for f in files),
+          "task_count": sum(f["task_count"] for f in files),
+          "dag_count": sum(len(f["dags"]) for f in files),
+      },
+  }
+  if _OUTPUT.value:
+    with open(_OUTPUT.value, "w") as f:
+      json.dump(report, f, indent=2)
+  else:
+    print(json.dumps(report, indent=2))
+
+  if not _BASELINE.value:
+    return 0
+
+  with open(_BASELINE.value) as f:
+    baseline = json.load(f)
+  regressions = find_regressions(
+      report,
+      baseline,
+      _TIME_TOLERANCE.value,
+      _MIN_TIME_DELTA_SEC.value,
+      _TASK_COUNT_TOLERANCE.value,
+  )
+  for regression in regressions:
+    logging.error(regression)
+  return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+  app.run(main)
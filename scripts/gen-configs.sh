@@ -16,3 +16,6 @@
 
 rm -rf dags/jsonnet
 jsonnet -J ./dags/legacy_test --create-output-dirs --multi dags/jsonnet dags/legacy_test/tests/all_tests.jsonnet
+
+# Also write every config into one index, so DAGs can load them all at once
+jsonnet -J ./dags/legacy_test -o dags/jsonnet/_index.json dags/legacy_test/tests/all_tests.jsonnet
@@ -0,0 +1,432 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Simulate a day of scheduled DAG runs against the TPU capacity config.
+
+The DAGs under `dags/` are parsed as in the prod environment, so tasks get the
+same pools, pool slots and priority weights as they would in Composer. Each
+DAG is started at its first scheduled time of the day, and its tasks are
+replayed with the durations from a duration history file, written by the
+`refresh_duration_history` DAG. Nothing is read from the cloud.
+
+A test is the top-level task group of a DAG, named after its benchmark ID.
+The P50 duration of each of its phases is split evenly over the tasks of the
+phase. Tasks without history take `--default_task_sec`. All tasks are assumed
+to succeed, and mapped tasks run once.
+
+A test holds its pool slots from the start of its first pooled task until its
+last task ends, since its TPU exists for that whole span, even though Airflow
+gives the slots back between tasks. Queue waits and utilization therefore both
+describe the TPU capacity rather than Airflow's pool accounting.
+
+The report lists, per DAG, the projected makespan and whether the run ends
+before the next one starts; per test, how long it queued for its pool; and per
+pool, how much of the capacity was held by tests.
+
+Usage: scripts/schedule-simulator.sh --history=duration_history.json
+"""
+
+import collections
+import dataclasses
+import datetime
+import heapq
+import json
+import os
+from typing import Any, Dict, List, Optional, Set
+
+from absl import app
+from absl import flags
+from absl import logging
+
+_DAG_FOLDER = flags.DEFINE_string(
+    "dag_folder", "dags", "Directory to search for DAG files."
+)
+_DAG_IDS = flags.DEFINE_list(
+    "dag_ids",
+    None,
+    "DAGs to simulate. Defaults to every DAG with a schedule. DAGs without a"
+    " schedule start at midnight.",
+)
+_HISTORY = flags.DEFINE_string(
+    "history", None, "Duration history file. Defaults to the one DAGs read."
+)
+_DAY = flags.DEFINE_string(
+    "day", None, "Day to simulate as YYYY-MM-DD. Defaults to tomorrow."
+)
+_DEFAULT_TASK_SEC = flags.DEFINE_float(
+    "default_task_sec", 60, "Duration of tasks without any history."
+)
+_PARALLELISM = flags.DEFINE_integer(
+    "parallelism", 64, "Maximum number of tasks running at once."
+)
+_OUTPUT = flags.DEFINE_string(
+    "output", None, "Path to write the JSON report. Defaults to stdout."
+)
+
+
+@dataclasses.dataclass
+class SimTask:
+  """A task instance to simulate."""
+
+  dag_id: str
+  task_id: str
+  test: str
+  duration: float
+  pool: Optional[str]
+  pool_slots: int
+  priority: int
+  upstream: Set[str]
+  downstream: Set[str]
+  ready_at: Optional[float] = None
+  start: Optional[float] = None
+  end: Optional[float] = None
+
+  @property
+  def key(self) -> str:
+    return f"{self.dag_id}.{self.task_id}"
+
+
+def get_run_times(
+    timetable: Any, day: datetime.datetime
+) -> Optional[Dict[str, float]]:
+  """Get the first run of a DAG's timetable on `day` and the run after it.
+
+  Args:
+    timetable: The `timetable` of the DAG.
+    day: Midnight of the day to simulate, in UTC.
+
+  Returns:
+    A dict with the `start` and `next_start` in seconds since midnight, or
+    None if the timetable has no run on `day`.
+  """
+  from airflow.timetables.base import TimeRestriction
+
+  try:
+    # Airflow 3 DAGs have SDK timetables, which the scheduler converts.
+    from airflow.serialization.encoders import coerce_to_core_timetable
+
+    timetable = coerce_to_core_timetable(timetable)
+  except ImportError:
+    pass
+
+  restriction = TimeRestriction(
+      earliest=day - datetime.timedelta(days=1), latest=None, catchup=True
+  )
+  runs = []
+  info = timetable.next_dagrun_info(
+      last_automated_data_interval=None, restriction=restriction
+  )
+  while info and len(runs) < 2:
+    if info.run_after >= day:
+      runs.append(info.run_after)
+    info = timetable.next_dagrun_info(
+        last_automated_data_interval=info.data_interval,
+        restriction=restriction,
+    )
+
+  if not runs or runs[0] >= day + datetime.timedelta(days=1):
+    return None
+  times = {"start": (runs[0] - day).total_seconds()}
+  if len(runs) > 1:
+    times["next_start"] = (runs[1] - day).total_seconds()
+  return times
+
+
+def get_priority(task: Any) -> int:
+  """Get the priority weight of a task as the scheduler computes it."""
+  # Only Airflow 2 operators compute it themselves.
+  if hasattr(task, "priority_weight_total"):
+    return task.priority_weight_total
+
+  rule = getattr(task.weight_rule, "value", task.weight_rule)
+  if rule == "absolute":
+    return task.priority_weight
+  relatives = task.get_flat_relatives(upstream=rule == "upstream")
+  return task.priority_weight + sum(t.priority_weight for t in relatives)
+
+
+def build_tasks(
+    dags: List[Any],
+    history: Dict[str, Dict[str, Dict[str, float]]],
+    default_task_sec: float,
+) -> Dict[str, SimTask]:
+  """Build the tasks to simulate with their durations from `history`."""
+  phase_sizes = collections.Counter()
+  for dag in dags:
+    for task_id in dag.task_ids:
+      parts = task_id.split(".")
+      phase_sizes[
+          (dag.dag_id, parts[0], parts[1] if len(parts) > 1 else "")
+      ] += 1
+
+  tasks = {}
+  for dag in dags:
+    for task in dag.tasks:
+      parts = task.task_id.split(".")
+      test = parts[0]
+      phase = parts[1] if len(parts) > 1 else ""
+      stats = history.get(test, {}).get(phase)
+      if stats:
+        duration = stats["p50"] / phase_sizes[(dag.dag_id, test, phase)]
+      else:
+        duration = default_task_sec
+
+      sim_task = SimTask(
+          dag_id=dag.dag_id,
+          task_id=task.task_id,
+          test=test,
+          duration=duration,
+          pool=task.pool,
+          pool_slots=task.pool_slots,
+          priority=get_priority(task),
+          upstream={f"{dag.dag_id}.{t}" for t in task.upstream_task_ids},
+          downstream={f"{dag.dag_id}.{t}" for t in task.downstream_task_ids},
+      )
+      tasks[sim_task.key] = sim_task
+  return tasks
+
+
+def simulate(
+    tasks: Dict[str, SimTask],
+    dag_starts: Dict[str, float],
+    dag_max_active_tasks: Dict[str, int],
+    pool_sizes: Dict[str, int],
+    parallelism: int,
+) -> None:
+  """Run every task, filling in its `ready_at`, `start` and `end` times.
+
+  Tasks start in order of priority once their upstream tasks are done, as long
+  as their DAG, their pool and the scheduler have room. A test takes its pool
+  slots when its first pooled task starts and gives them back when its last
+  task ends. Pools that are not in `pool_sizes` are unlimited.
+  """
+  remaining_upstream = {key: len(t.upstream) for key, t in tasks.items()}
+  remaining_in_test = collections.Counter(
+      (t.dag_id, t.test) for t in tasks.values()
+  )
+  ready = []
+  running = []
+  pool_used = collections.Counter()
+  # (DAG ID, test) -> (pool, slots) that the test holds.
+  test_holds = {}
+  dag_running = collections.Counter()
+
+  def make_ready(task: SimTask, now: float) -> None:
+    task.ready_at = max(now, dag_starts[task.dag_id])
+    ready.append(task)
+
+  for key, count in remaining_upstream.items():
+    if not count:
+      make_ready(tasks[key], 0)
+
+  now = 0.0
+  while ready or running:
+    ready.sort(key=lambda t: (-t.priority, t.ready_at, t.key))
+    for task in list(ready):
+      if task.ready_at > now or len(running) >= parallelism:
+        continue
+      if dag_running[task.dag_id] >= dag_max_active_tasks[task.dag_id]:
+        continue
+      test = (task.dag_id, task.test)
+      if task.pool in pool_sizes and test not in test_holds:
+        slots = min(task.pool_slots, pool_sizes[task.pool])
+        if pool_used[task.pool] + slots > pool_sizes[task.pool]:
+          continue
+        pool_used[task.pool] += slots
+        test_holds[test] = (task.pool, slots)
+
+      ready.remove(task)
+      task.start = now
+      dag_running[task.dag_id] += 1
+      heapq.heappush(running, (now + task.duration, task.key))
+
+    # Advance to the next task end or the next DAG run start.
+    next_times = [end for end, _ in running[:1]]
+    next_times += [t.ready_at for t in ready if t.ready_at > now]
+    if not next_times:
+      stuck = ", ".join(t.key for t in ready)
+      raise RuntimeError(f"Tasks can never be scheduled: {stuck}")
+    now = min(next_times)
+
+    while running and running[0][0] <= now:
+      end, key = heapq.heappop(running)
+      task = tasks[key]
+      task.end = end
+      dag_running[task.dag_id] -= 1
+      test = (task.dag_id, task.test)
+      remaining_in_test[test] -= 1
+      if not remaining_in_test[test] and test in test_holds:
+        pool_name, slots = test_holds.pop(test)
+        pool_used[pool_name] -= slots
+      for downstream in task.downstream:
+        remaining_upstream[downstream] -= 1
+        if not remaining_upstream[downstream]:
+          make_ready(tasks[downstream], end)
+
+
+def build_report(
+    tasks: Dict[str, SimTask],
+    dag_runs: Dict[str, Dict[str, float]],
+    pool_sizes: Dict[str, int],
+) -> Dict[str, Any]:
+  """Summarize the simulated runs by DAG, test and pool."""
+  by_dag = collections.defaultdict(list)
+  by_test = collections.defaultdict(list)
+  for task in tasks.values():
+    by_dag[task.dag_id].append(task)
+    by_test[(task.dag_id, task.test)].append(task)
+
+  dags = []
+  for dag_id, dag_tasks in sorted(by_dag.items()):
+    run = dag_runs[dag_id]
+    end = max(t.end for t in dag_tasks)
+    dags.append({
+        "dag_id": dag_id,
+        "start_sec": run["start"],
+        "end_sec": end,
+        "makespan_sec": end - run["start"],
+        "ends_before_next_run": (
+            end <= run["next_start"] if "next_start" in run else None
+        ),
+    })
+
+  tests = []
+  # Pool -> (start, end, slots) of each test that held capacity in it.
+  holds = collections.defaultdict(list)
+  for (dag_id, test), test_tasks in sorted(by_test.items()):
+    pooled = [t for t in test_tasks if t.pool in pool_sizes]
+    # The first pooled task takes the test's slots, as in `simulate`, so it is
+    # the only one that queues for the pool.
+    first = min(pooled, key=lambda t: (t.start, t.key), default=None)
+    tests.append({
+        "dag_id": dag_id,
+        "test": test,
+        "start_sec": min(t.start for t in test_tasks),
+        "end_sec": max(t.end for t in test_tasks),
+        "queue_wait_sec": first.start - first.ready_at if first else 0.0,
+    })
+    if first:
+      holds[first.pool].append((
+          first.start,
+          max(t.end for t in test_tasks),
+          min(first.pool_slots, pool_sizes[first.pool]),
+      ))
+
+  pools = []
+  for pool_name, size in sorted(pool_sizes.items()):
+    pool_holds = holds.get(pool_name, [])
+    if not pool_holds:
+      continue
+    window_start = min(start for start, _, _ in pool_holds)
+    window_end = max(end for _, end, _ in pool_holds)
+    held = sum((end - start) * slots for start, end, slots in pool_holds)
+
+    changes = sorted(
+        [(start, slots) for start, _, slots in pool_holds]
+        + [(end, -slots) for _, end, slots in pool_holds]
+    )
+    current = peak = 0
+    for _, change in changes:
+      current += change
+      peak = max(peak, current)
+
+    pools.append({
+        "pool": pool_name,
+        "slots": size,
+        "tests": len(pool_holds),
+        "utilization": held / (size * (window_end - window_start)),
+        "peak_slots_held": peak,
+    })
+
+  return {
+      "makespan_sec": (
+          max(d["end_sec"] for d in dags) - min(d["start_sec"] for d in dags)
+          if dags
+          else 0
+      ),
+      "dags": dags,
+      "tests": tests,
+      "pools": pools,
+  }
+
+
+def main(argv):
+  del argv
+
+  # Parse the DAGs with the prod pools and schedules.
+  from dags import capacity, composer_env
+
+  os.environ[
+      composer_env.COMPOSER_ENVIRONMENT
+  ] = composer_env.PROD_COMPOSER_ENV_NAME
+  from airflow.models.dagbag import DagBag
+  from xlml.utils import duration, pool
+
+  history_file = _HISTORY.value or duration.get_history_file()
+  with open(history_file) as f:
+    history = json.load(f)
+
+  if _DAY.value:
+    day = datetime.datetime.strptime(_DAY.value, "%Y-%m-%d")
+  else:
+    day = datetime.datetime.combine(
+        datetime.date.today() + datetime.timedelta(days=1), datetime.time()
+    )
+  day = day.replace(tzinfo=datetime.timezone.utc)
+
+  dagbag = DagBag(dag_folder=_DAG_FOLDER.value)
+  for file, error in dagbag.import_errors.items():
+    logging.warning(f"Skipping {file}: {error}")
+
+  dags = []
+  dag_runs = {}
+  for dag_id, dag in sorted(dagbag.dags.items()):
+    run = get_run_times(dag.timetable, day)
+    if _DAG_IDS.value:
+      if dag_id not in _DAG_IDS.value:
+        continue
+      run = run or {"start": 0.0}
+    elif not run:
+      continue
+    dags.append(dag)
+    dag_runs[dag_id] = run
+  logging.info(f"Simulating {len(dags)} DAGs on {day.date()}.")
+
+  tasks = build_tasks(dags, history, _DEFAULT_TASK_SEC.value)
+  pool_sizes = {
+      pool.get_tpu_pool_name(*key): cores
+      for key, cores in capacity.TPU_CORES.items()
+  }
+  simulate(
+      tasks,
+      {dag_id: run["start"] for dag_id, run in dag_runs.items()},
+      {dag.dag_id: dag.max_active_tasks for dag in dags},
+      pool_sizes,
+      _PARALLELISM.value,
+  )
+  report = build_report(tasks, dag_runs, pool_sizes)
+
+  for dag in report["dags"]:
+    if dag["ends_before_next_run"] is False:
+      logging.warning(f"{dag['dag_id']} ends after its next run starts.")
+
+  if _OUTPUT.value:
+    with open(_OUTPUT.value, "w") as f:
+      json.dump(report, f, indent=2)
+  else:
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+  app.run(main)
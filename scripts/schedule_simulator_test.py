@@ -0,0 +1,106 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for schedule_simulator.py."""
+
+import datetime
+from absl.testing import absltest
+import airflow
+from airflow.operators.empty import EmptyOperator
+from airflow.utils.task_group import TaskGroup
+import schedule_simulator
+
+_DAY = datetime.datetime(2024, 6, 3, tzinfo=datetime.timezone.utc)
+_POOL = "tpu-pool"
+
+# Each test takes 12 minutes in total.
+_HISTORY = {
+    test: {
+        "provision": {"p50": 60.0},
+        "run_model": {"p50": 600.0},
+        "clean_up": {"p50": 60.0},
+    }
+    for test in ("a", "b")
+}
+
+
+def _make_dag(pool_slots: int) -> airflow.DAG:
+  """Make a DAG with two tests whose tasks all take `pool_slots` slots."""
+  with airflow.DAG(
+      "test_dag", schedule="0 5 * * *", start_date=_DAY, catchup=False
+  ) as dag:
+    for test in ("a", "b"):
+      with TaskGroup(test):
+        provision, run_model, clean_up = (
+            EmptyOperator(task_id=phase, pool=_POOL, pool_slots=pool_slots)
+            for phase in ("provision", "run_model", "clean_up")
+        )
+        provision >> run_model >> clean_up
+  return dag
+
+
+class ScheduleSimulatorTest(absltest.TestCase):
+
+  def _simulate(self, pool_slots: int, pool_size: int):
+    dag = _make_dag(pool_slots)
+    run = schedule_simulator.get_run_times(dag.timetable, _DAY)
+    tasks = schedule_simulator.build_tasks([dag], _HISTORY, 60)
+    schedule_simulator.simulate(
+        tasks,
+        {dag.dag_id: run["start"]},
+        {dag.dag_id: dag.max_active_tasks},
+        {_POOL: pool_size},
+        parallelism=64,
+    )
+    return schedule_simulator.build_report(
+        tasks, {dag.dag_id: run}, {_POOL: pool_size}
+    )
+
+  def test_get_run_times(self):
+    dag = _make_dag(pool_slots=1)
+
+    self.assertEqual(
+        schedule_simulator.get_run_times(dag.timetable, _DAY),
+        {"start": 5 * 3600.0, "next_start": 29 * 3600.0},
+    )
+
+  def test_get_run_times_without_schedule(self):
+    dag = airflow.DAG("unscheduled", schedule=None, start_date=_DAY)
+
+    self.assertIsNone(schedule_simulator.get_run_times(dag.timetable, _DAY))
+
+  def test_tests_hold_pool_until_they_end(self):
+    # Each test needs the whole pool, so the second test can't start any task
+    # until the first one ends.
+    report = self._simulate(pool_slots=8, pool_size=8)
+
+    self.assertEqual(report["makespan_sec"], 2 * 720.0)
+    self.assertEqual(
+        [t["queue_wait_sec"] for t in report["tests"]], [0.0, 720.0]
+    )
+    (pool,) = report["pools"]
+    self.assertEqual(pool["peak_slots_held"], 8)
+    self.assertAlmostEqual(pool["utilization"], 1.0)
+
+  def test_tests_share_pool(self):
+    report = self._simulate(pool_slots=4, pool_size=8)
+
+    self.assertEqual(report["makespan_sec"], 720.0)
+    (pool,) = report["pools"]
+    self.assertEqual(pool["peak_slots_held"], 8)
+    self.assertAlmostEqual(pool["utilization"], 1.0)
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -18,12 +18,20 @@ import abc
 import dataclasses
 import datetime
 import shlex
-from typing import Optional, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 import airflow
+from airflow.decorators import task_group
+from airflow.operators.empty import EmptyOperator
 from airflow.models.taskmixin import DAGNode
 from airflow.utils.task_group import TaskGroup
+import attrs
 from xlml.apis import gcp_config, metric_config, test_config
-from xlml.utils import gpu, metric, name_format, ssh, tpu, xpk, gke
+from xlml.utils import duration, gpu, lease, metric, name_format, pool, ssh, staging, sweep, tpu, xpk, gke
+
+
+# Time that TPU capacity stays reserved beyond the provisioning and run
+# timeouts of a test, matching the buffer of the TPU's TTL label.
+RESERVATION_BUFFER = datetime.timedelta(hours=1)
 
 
 class BaseTask(abc.ABC):
@@ -47,6 +55,7 @@ def run_queued_resource_test(
     tpu_create_timeout: datetime.timedelta = datetime.timedelta(minutes=60),
     tpu_name_env_var: bool = False,
     all_workers: bool = True,
+    reuse_ttl: Optional[datetime.timedelta] = None,
 ):
   """This is a class to set up tasks for TPU provisioned by Queued Resource.
 
@@ -56,6 +65,16 @@ def run_queued_resource_test(
   2. Run the TPU test in `task_test_config` via SSH.
   3. Process metrics and metadata, then insert them into BigQuery tables.
   4. Clean up TPU resources created by for this test
+  5. Record how long the clean up took in BigQuery.
+
+  If `reuse_ttl` is set, step 1 checks out an idle TPU that another test with
+  the same TPU and setup script checked in, and skips creating and setting up
+  a new one. Step 4 then resets the TPU and checks it in for later tests,
+  unless the test failed.
+
+  If the TPU has capacity configured in `dags.capacity`, step 1 waits until
+  enough of it is free before the Queued Resource is created, and the capacity
+  stays reserved until step 4 deletes the TPU.
 
   Attributes:
     task_test_config: Test configs to run on this TPU.
@@ -65,14 +84,29 @@ def run_queued_resource_test(
     tpu_name_env_var: The flag to define if set up env variable for tpu name.
     all_workers: The flag to define if run commands on all workers or worker 0
       only.
+    reuse_ttl: How long the TPU may stay idle for other tests to reuse it. The
+      TPU is not reused if None.
 
   Returns:
       A task group with the following tasks chained: provision, run_model,
-      post_process and clean_up.
+      post_process, clean_up and record_phase_durations.
   """
-
+  if reuse_ttl and task_test_config.num_slices > 1:
+    raise ValueError("Multi-slice TPUs can't be reused.")
+
+  pool_args = pool.get_tpu_pool_args(
+      task_gcp_config.project_name,
+      task_gcp_config.zone,
+      task_test_config.accelerator,
+      task_test_config.num_slices,
+  )
   with TaskGroup(
-      group_id=task_test_config.benchmark_id, prefix_group_id=True
+      group_id=task_test_config.benchmark_id,
+      prefix_group_id=True,
+      default_args={
+          **duration.get_priority_args(task_test_config.benchmark_id),
+          **pool_args,
+      },
   ) as test:
     with TaskGroup(group_id="provision") as provision:
       with TaskGroup(group_id="initialize"):
@@ -98,17 +132,45 @@ def run_queued_resource_test(
           ssh_keys,
           all_workers,
       )
+      if pool_args:
+        (
+            pool.reserve_tpu_cores(
+                pool_args["pool"],
+                pool_args["pool_slots"],
+                tpu_name,
+                tpu_create_timeout
+                + (task_test_config.timeout or datetime.timedelta(0))
+                + RESERVATION_BUFFER,
+            )
+            >> queued_resource_op
+        )
+
+      if reuse_ttl:
+        checked_out = lease.check_out(
+            lease.get_lease_key(task_gcp_config, task_test_config),
+            tpu_name,
+            ssh_keys,
+            task_gcp_config,
+            tpu_create_timeout
+            + (task_test_config.timeout or datetime.timedelta(0)),
+        )
+        lease.should_provision(checked_out["reused"]) >> queued_resource_op
+        queued_resource_name = checked_out["qualified_name"]
+        ssh_keys = checked_out["ssh_keys"]
 
     run_model = tpu.ssh_tpu.override(
         task_id="run_model",
-        execution_timeout=task_test_config.timeout,
+        execution_timeout=duration.get_timeout(task_test_config),
         owner=task_test_config.task_owner,
+        # Setup is skipped when the TPU is reused.
+        trigger_rule="none_failed" if reuse_ttl else "all_success",
     )(
         queued_resource_name,
         task_test_config.test_script,
         ssh_keys,
         all_workers,
         env={metric_config.SshEnvVars.GCS_OUTPUT.name: output_location},
+        staged_files=task_test_config.staged_files,
     )
 
     with TaskGroup(group_id="post_process") as post_process:
@@ -121,15 +183,179 @@ def run_queued_resource_test(
           folder_location=output_location,
       )
 
-    clean_up = tpu.delete_queued_resource.override(group_id="clean_up")(
-        queued_resource_name
+    if reuse_ttl:
+      with TaskGroup(group_id="clean_up") as clean_up:
+        tpu.delete_queued_resource(
+            lease.check_in(queued_resource_name, ssh_keys, reuse_ttl)
+        )
+    else:
+      clean_up = tpu.delete_queued_resource.override(group_id="clean_up")(
+          queued_resource_name
+      )
+
+    record_clean_up = metric.record_phase_durations.override(retries=0)(
+        task_gcp_config,
+        ["clean_up"],
+        num_chips=task_test_config.accelerator.num_chips
+        * task_test_config.num_slices,
     )
 
-    provision >> run_model >> post_process >> clean_up
+    provision >> run_model >> post_process >> clean_up >> record_clean_up
+    if pool_args:
+      clean_up >> pool.release_tpu_cores(tpu_name)
 
   return test
 
 
+def run_queued_resource_test_group(
+    group_id: str,
+    task_test_configs: List[test_config.TestConfig[test_config.Tpu]],
+    task_gcp_config: gcp_config.GCPConfig,
+    task_metric_configs: Optional[
+        List[Optional[metric_config.MetricConfig]]
+    ] = None,
+    tpu_create_timeout: datetime.timedelta = datetime.timedelta(minutes=60),
+    all_workers: bool = True,
+):
+  """Set up tasks to run several tests one after another on one TPU.
+
+  The tests must have the same TPU and setup script.
+
+  Test steps:
+  1. Generates a random TPU name and SSH keys, creates a Queued Resource, and
+     runs the shared setup script on the TPU when it is ready.
+  2. For each test in order, stop processes left on the TPU, run the test via
+     SSH, and process its metrics. Every test runs and gets its own job
+     status, even if an earlier test failed.
+  3. Clean up TPU resources created for the tests.
+
+  Attributes:
+    group_id: ID of the task group of the tests, which also prefixes the TPU
+      name.
+    task_test_configs: Test configs to run on the TPU, in order.
+    task_gcp_config: Runtime TPU creation parameters.
+    task_metric_configs: Metric configs to process the metrics of each test.
+    tpu_create_timeout: Time to provision the machine.
+    all_workers: The flag to define if run commands on all workers or worker 0
+      only.
+
+  Returns:
+      A task group with provision, a task group for each test with run_model
+      and post_process, and clean_up chained.
+  """
+  first_config = task_test_configs[0]
+  for config in task_test_configs[1:]:
+    if (
+        config.accelerator != first_config.accelerator
+        or config.setup_script != first_config.setup_script
+        or config.num_slices != first_config.num_slices
+    ):
+      raise ValueError(
+          f"{config.benchmark_id} can't share a TPU with"
+          f" {first_config.benchmark_id}, since its TPU or setup differs."
+      )
+  task_metric_configs = task_metric_configs or [None] * len(task_test_configs)
+
+  run_timeout = sum(
+      (config.timeout for config in task_test_configs if config.timeout),
+      datetime.timedelta(0),
+  )
+  pool_args = pool.get_tpu_pool_args(
+      task_gcp_config.project_name,
+      task_gcp_config.zone,
+      first_config.accelerator,
+      first_config.num_slices,
+  )
+  with TaskGroup(
+      group_id=group_id,
+      default_args={
+          **duration.get_priority_args(first_config.benchmark_id),
+          **pool_args,
+      },
+  ) as group:
+    with TaskGroup(group_id="provision") as provision:
+      with TaskGroup(group_id="initialize"):
+        tpu_name = tpu.generate_tpu_name(group_id, False)
+        ssh_keys = ssh.generate_ssh_keys()
+
+      queued_resource_op, queued_resource_name = tpu.create_queued_resource(
+          tpu_name,
+          task_gcp_config,
+          ssh_keys,
+          tpu_create_timeout,
+          first_config,
+          run_timeout=run_timeout,
+      )
+      queued_resource_op >> tpu.ssh_tpu.override(task_id="setup")(
+          queued_resource_name,
+          first_config.setup_script,
+          ssh_keys,
+          all_workers,
+      )
+      if pool_args:
+        (
+            pool.reserve_tpu_cores(
+                pool_args["pool"],
+                pool_args["pool_slots"],
+                tpu_name,
+                tpu_create_timeout + run_timeout + RESERVATION_BUFFER,
+            )
+            >> queued_resource_op
+        )
+
+    previous_done = None
+    for task_test_config, task_metric_config in zip(
+        task_test_configs, task_metric_configs
+    ):
+      with TaskGroup(group_id=task_test_config.benchmark_id) as test:
+        output_location = name_format.generate_gcs_folder_location(
+            task_test_config.gcs_subfolder,
+            task_test_config.benchmark_id,
+        )
+        run_model = tpu.ssh_tpu.override(
+            task_id="run_model",
+            execution_timeout=duration.get_timeout(task_test_config),
+            owner=task_test_config.task_owner,
+        )(
+            queued_resource_name,
+            "\n".join((tpu.RESET_SCRIPT, task_test_config.test_script)),
+            ssh_keys,
+            all_workers,
+            env={metric_config.SshEnvVars.GCS_OUTPUT.name: output_location},
+            staged_files=task_test_config.staged_files,
+        )
+
+        with TaskGroup(group_id="post_process") as post_process:
+          process_id = metric.generate_process_id.override(retries=0)()
+          metric.process_metrics.override(retries=0)(
+              process_id,
+              task_test_config,
+              task_metric_config,
+              task_gcp_config,
+              folder_location=output_location,
+              test_group_id=test.group_id,
+              provision_group_id=provision.group_id,
+          )
+
+        # Lets the next test start whether or not this one passed.
+        done = EmptyOperator(task_id="done", trigger_rule="all_done")
+        run_model >> post_process >> done
+
+      provision >> run_model
+      if previous_done:
+        previous_done >> run_model
+      previous_done = done
+
+    clean_up = tpu.delete_queued_resource.override(group_id="clean_up")(
+        queued_resource_name
+    )
+    previous_done >> clean_up
+    if pool_args:
+      clean_up >> pool.release_tpu_cores(tpu_name)
+
+  return group
+
+
 @dataclasses.dataclass
 class XpkTask(BaseTask):
   """This is a class to set up tasks for TPU/GPU provisioned by XPK tool.
@@ -164,7 +390,12 @@ class XpkTask(BaseTask):
       A task group with the following tasks chained: run_model and
       post_process.
     """
-    with TaskGroup(group_id=self.task_test_config.benchmark_id) as group:
+    with TaskGroup(
+        group_id=self.task_test_config.benchmark_id,
+        default_args=duration.get_priority_args(
+            self.task_test_config.benchmark_id
+        ),
+    ) as group:
       run_model, gcs_path = self.run_model(gcs_location)
       run_model >> self.post_process(gcs_path)
 
@@ -179,7 +410,11 @@ class XpkTask(BaseTask):
       generate_tb_file_location, run provision, run_model, post_process.
     """
     with TaskGroup(
-        group_id=self.task_test_config.benchmark_id, prefix_group_id=True
+        group_id=self.task_test_config.benchmark_id,
+        prefix_group_id=True,
+        default_args=duration.get_priority_args(
+            self.task_test_config.benchmark_id
+        ),
     ) as group:
       run_name = name_format.generate_run_name(
           self.task_test_config.benchmark_id
@@ -203,14 +438,178 @@ class XpkTask(BaseTask):
 
     return group
 
+  def run_sweep(
+      self,
+      sweep_params: Dict[str, List[Any]],
+      max_active_tis_per_dagrun: Optional[int] = None,
+  ) -> DAGNode:
+    """Run the test once for every combination of `sweep_params`.
+
+    The sweep is a single task group mapped over the parameter grid, so the
+    size of the DAG doesn't grow with the number of combinations. Each
+    combination is exported as environment variables before `run_model_cmds`,
+    and recorded as metadata of its test run in BigQuery.
+
+    Attributes:
+      sweep_params: A dict that maps each environment variable to the values
+        to sweep over.
+      max_active_tis_per_dagrun: Maximum number of mapped instances of each
+        task in the sweep to run at the same time.
+
+    Returns:
+      A mapped task group with the following tasks chained for each
+      combination: generate_sweep_run, run_model, post_process.
+    """
+    run_sweep_point = self._sweep_point_group(max_active_tis_per_dagrun)
+    return run_sweep_point.expand(params=sweep.get_param_grid(sweep_params))
+
+  def run_successive_halving(
+      self,
+      sweep_params: Dict[str, List[Any]],
+      metric_key: str,
+      budget_param: str,
+      min_budget: int,
+      eta: int = 3,
+      maximize: bool = True,
+      max_active_tis_per_dagrun: Optional[int] = None,
+  ) -> DAGNode:
+    """Search `sweep_params` for the best config with successive halving.
+
+    The first round runs every combination with `min_budget`. Each following
+    round only keeps the best `1 / eta` of the previous trials and multiplies
+    their budget by `eta`, until a single config is left. Trials that fail,
+    e.g. because they run out of memory, or that don't report `metric_key` are
+    never promoted. Each round is a task group mapped over its trials, and
+    every trial is recorded in BigQuery like a regular sweep.
+
+    Attributes:
+      sweep_params: A dict that maps each environment variable to the values
+        to search over.
+      metric_key: TensorBoard tag of the metric to optimize. It is aggregated
+        with the strategy of the TensorBoard summary config.
+      budget_param: Environment variable that sets the budget of a trial, such
+        as the number of training steps.
+      min_budget: Budget of each trial in the first round.
+      eta: Factor by which each round shrinks the trials and grows the budget.
+      maximize: Whether higher values of the metric are better.
+      max_active_tis_per_dagrun: Maximum number of mapped instances of each
+        task in a round to run at the same time.
+
+    Returns:
+      The task that selects the best config, as a list with a single dict of
+      parameters, or an empty list if every trial failed.
+    """
+    summary_config = self.task_metric_config.tensorboard_summary
+    grid = sweep.get_param_grid(sweep_params)
+    trials = [{**params, budget_param: min_budget} for params in grid]
+    num_trials = len(grid)
+
+    num_rounds = sweep.get_num_halving_rounds(num_trials, eta)
+    for round_index in range(num_rounds):
+      round_task = dataclasses.replace(
+          self,
+          task_test_config=attrs.evolve(
+              self.task_test_config,
+              test_name=f"{self.task_test_config.test_name}-round{round_index}",
+          ),
+      )
+      run_sweep_point = round_task._sweep_point_group(
+          max_active_tis_per_dagrun,
+          objective=(metric_key, summary_config.aggregation_strategy),
+      )
+      results = run_sweep_point.expand(params=trials)
+
+      # Promote the best trials with a larger budget, or pick the best config
+      # after the last round.
+      is_last_round = round_index == num_rounds - 1
+      num_trials = max(1, num_trials // eta)
+      trials = sweep.select_trials.override(
+          task_id=f"{round_task.task_test_config.benchmark_id}-select"
+      )(
+          results,
+          num_trials,
+          maximize,
+          budget_param,
+          None if is_last_round else min_budget * eta ** (round_index + 1),
+      )
+
+    return trials
+
+  def _sweep_point_group(
+      self,
+      max_active_tis_per_dagrun: Optional[int] = None,
+      objective: Optional[Tuple[str, metric_config.AggregationStrategy]] = None,
+  ):
+    """Build the task group that runs a single point of a sweep.
+
+    Attributes:
+      max_active_tis_per_dagrun: Maximum number of mapped instances of each
+        task in the group to run at the same time.
+      objective: Metric key and aggregation strategy to read back from the
+        run's TensorBoard summary. If set, the group returns the result of
+        the trial.
+
+    Returns:
+      A task group factory to map over sweep parameters with `expand`.
+    """
+    default_args = duration.get_priority_args(
+        self.task_test_config.benchmark_id
+    )
+    if max_active_tis_per_dagrun:
+      default_args["max_active_tis_per_dagrun"] = max_active_tis_per_dagrun
+
+    summary_config = (
+        self.task_metric_config.tensorboard_summary
+        if self.task_metric_config
+        else None
+    )
+
+    @task_group(
+        group_id=self.task_test_config.benchmark_id, default_args=default_args
+    )
+    def run_sweep_point(params: Dict[str, Any]):
+      sweep_run = sweep.generate_sweep_run(
+          self.task_test_config.benchmark_id,
+          params,
+          self.task_test_config.test_script,
+          summary_config.file_location if summary_config else None,
+      )
+
+      run_model, gcs_path = self.run_model(run_cmds=sweep_run["run_cmds"])
+      (
+          sweep_run
+          >> run_model
+          >> self.post_process(
+              gcs_path,
+              extra_metadata=params,
+              tb_file_location=sweep_run["tb_file_location"],
+          )
+      )
+
+      if objective:
+        metric_key, aggregation_strategy = objective
+        result = sweep.get_trial_result(
+            params,
+            sweep_run["tb_file_location"],
+            metric_key,
+            aggregation_strategy,
+        )
+        run_model >> result
+        return result
+
+    return run_sweep_point
+
   def run_model(
       self,
       gcs_location: Optional[airflow.XComArg] = None,
+      run_cmds: Optional[airflow.XComArg] = None,
   ) -> DAGNode:
     """Run the TPU/GPU test in `task_test_config` using xpk.
 
     Attributes:
       gcs_location: GCS path for all artifacts of the test.
+      run_cmds: Script to run instead of the `test_script` of
+        `task_test_config`.
 
     Returns:
       A DAG node that executes the model test.
@@ -224,9 +623,11 @@ class XpkTask(BaseTask):
             self.task_test_config.gcs_subfolder,
             self.task_test_config.benchmark_id,
         )
-      launch_workload = self.launch_workload(workload_id, gcs_path)
+      launch_workload = self.launch_workload(workload_id, gcs_path, run_cmds)
       wait_for_workload_completion = xpk.wait_for_workload_completion.override(
-          timeout=int(self.task_test_config.timeout.total_seconds()),
+          timeout=int(
+              duration.get_timeout(self.task_test_config).total_seconds()
+          ),
       )(
           workload_id=workload_id,
           project_id=self.task_gcp_config.project_name,
@@ -235,10 +636,19 @@ class XpkTask(BaseTask):
       )
 
       (workload_id, gcs_path) >> launch_workload >> wait_for_workload_completion
+      if self.task_test_config.staged_files:
+        staging.upload(self.task_test_config.staged_files) >> launch_workload
       return group, gcs_path
 
-  def launch_workload(self, workload_id: str, gcs_path: str) -> DAGNode:
+  def launch_workload(
+      self,
+      workload_id: str,
+      gcs_path: str,
+      run_cmds: Optional[airflow.XComArg] = None,
+  ) -> DAGNode:
     """Create the workload and wait for it to provision."""
+    if run_cmds is None:
+      run_cmds = self.task_test_config.test_script
     with TaskGroup(group_id="launch_workload") as group:
       run_workload = xpk.run_workload.override(
           owner=self.task_test_config.task_owner
@@ -252,7 +662,7 @@ class XpkTask(BaseTask):
           gcs_path=gcs_path,
           docker_image=self.task_test_config.docker_image,
           accelerator_type=self.task_test_config.accelerator.name,
-          run_cmds=self.task_test_config.test_script,
+          run_cmds=run_cmds,
           num_slices=self.task_test_config.num_slices,
       )
       wait_for_workload_start = xpk.wait_for_workload_start.override(
@@ -266,9 +676,20 @@ class XpkTask(BaseTask):
       run_workload >> wait_for_workload_start
       return group
 
-  def post_process(self, result_location: Optional[str] = None) -> DAGNode:
+  def post_process(
+      self,
+      result_location: Optional[str] = None,
+      extra_metadata: Optional[Dict[str, Any]] = None,
+      tb_file_location: Optional[airflow.XComArg] = None,
+  ) -> DAGNode:
     """Process metrics and metadata, and insert them into BigQuery tables.
 
+    Attributes:
+      result_location: GCS path for all artifacts of the test.
+      extra_metadata: Additional metadata to record for the test run.
+      tb_file_location: TensorBoard file location that overrides the one in
+        `task_metric_config`.
+
     Returns:
       A DAG node that executes the post process.
     """
@@ -280,6 +701,8 @@ class XpkTask(BaseTask):
           self.task_metric_config,
           self.task_gcp_config,
           folder_location=result_location,
+          extra_metadata=extra_metadata,
+          tb_file_location=tb_file_location,
       )
 
       return group
@@ -311,12 +734,16 @@ class GpuCreateResourceTask(BaseTask):
 
     Returns:
       A task group with the following tasks chained: provision, run_model,
-      post_process, clean_up.
+      post_process, clean_up, record_phase_durations.
     """
     # piz: We skip the queued resource for GPU for now since there is no queued
     # resource command for GPU.
     with TaskGroup(
-        group_id=self.task_test_config.benchmark_id, prefix_group_id=True
+        group_id=self.task_test_config.benchmark_id,
+        prefix_group_id=True,
+        default_args=duration.get_priority_args(
+            self.task_test_config.benchmark_id
+        ),
     ) as group:
       (
           provision,
@@ -343,7 +770,12 @@ class GpuCreateResourceTask(BaseTask):
           self.task_gcp_config.project_name,
           self.task_gcp_config.zone,
       )
-      provision >> run_model >> post_process >> clean_up
+      record_clean_up = metric.record_phase_durations.override(retries=0)(
+          self.task_gcp_config,
+          ["clean_up"],
+          num_chips=self.task_test_config.accelerator.num_chips,
+      )
+      provision >> run_model >> post_process >> clean_up >> record_clean_up
     return group
 
   def provision(
@@ -412,13 +844,14 @@ class GpuCreateResourceTask(BaseTask):
     """
     return gpu.ssh_host.override(
         task_id="run_model",
-        execution_timeout=self.task_test_config.timeout,
+        execution_timeout=duration.get_timeout(self.task_test_config),
         owner=self.task_test_config.task_owner,
     )(
         resource,
         self.task_test_config.test_script,
         ssh_keys,
         env,
+        staged_files=self.task_test_config.staged_files,
     )
 
   def post_process(
@@ -486,7 +919,11 @@ class GpuGkeTask(BaseTask):
       A task group that runs the given test config on a GKE cluster.
     """
     with TaskGroup(
-        group_id=self.task_test_config.benchmark_id, prefix_group_id=True
+        group_id=self.task_test_config.benchmark_id,
+        prefix_group_id=True,
+        default_args=duration.get_priority_args(
+            self.task_test_config.benchmark_id
+        ),
     ) as group:
       gcs_location = name_format.generate_gcs_folder_location(
           self.task_test_config.gcs_subfolder,
@@ -0,0 +1,349 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for task.py."""
+
+import datetime
+import json
+import os
+import subprocess
+import sys
+import textwrap
+from unittest import mock
+from absl.testing import absltest
+import airflow
+from dags import capacity, composer_env
+from dags.vm_resource import CpuVersion, TpuVersion
+from xlml.apis import gcp_config, metric_config, task, test_config
+from xlml.utils import bigquery, metric, name_format, staging
+
+
+# Every DAG file imports `xlml.apis.task`, so the scheduler pays this cost on
+# every parse. Airflow itself is excluded since it is already loaded there.
+IMPORT_TIME_BUDGET_SEC = 3.0
+IMPORT_MEMORY_BUDGET_MB = 150
+
+# Packages that must only be loaded inside task callables.
+HEAVY_PACKAGES = (
+    "tensorflow",
+    "fabric",
+    "paramiko",
+    "kubernetes",
+    "google.cloud.compute_v1",
+    "google.cloud.container_v1",
+    "google.cloud.tpu_v2alpha1",
+    "google.cloud.bigquery",
+    "google.cloud.storage",
+)
+
+_MEASURE_SCRIPT = textwrap.dedent(
+    """
+    import json
+    import resource
+    import sys
+    import time
+
+    import airflow
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    import xlml.apis.task
+    elapsed = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(json.dumps({
+        "elapsed_sec": elapsed,
+        "memory_mb": (rss_after - rss_before) / 1024,
+        "modules": list(sys.modules),
+    }))
+"""
+)
+
+
+class TaskImportTest(absltest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    super().setUpClass()
+    repo_root = os.path.dirname(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", _MEASURE_SCRIPT],
+        capture_output=True,
+        check=True,
+        cwd=repo_root,
+        env={**os.environ, "PYTHONPATH": repo_root},
+        text=True,
+    )
+    cls.stats = json.loads(result.stdout.strip().splitlines()[-1])
+
+  def test_heavy_packages_not_loaded(self):
+    # Lazily imported packages are registered in `sys.modules`, but none of
+    # their submodules are until the package is first used.
+    loaded = [
+        package
+        for package in HEAVY_PACKAGES
+        if any(m.startswith(f"{package}.") for m in self.stats["modules"])
+    ]
+    self.assertEmpty(loaded)
+
+  def test_import_time_budget(self):
+    self.assertLess(self.stats["elapsed_sec"], IMPORT_TIME_BUDGET_SEC)
+
+  def test_import_memory_budget(self):
+    self.assertLess(self.stats["memory_mb"], IMPORT_MEMORY_BUDGET_MB)
+
+
+class RunQueuedResourceTestGroupTest(absltest.TestCase):
+
+  def test_rejects_tests_with_different_setup(self):
+    configs = [
+        test_config.TpuVmTest(
+            test_config.Tpu(version=TpuVersion.V4, cores=8),
+            test_name=f"test-{i}",
+            set_up_cmds=[f"pip install package-{i}"],
+            run_model_cmds=["python train.py"],
+        )
+        for i in range(2)
+    ]
+    gcp = gcp_config.GCPConfig(
+        project_name="project",
+        zone="zone",
+        dataset_name=metric_config.DatasetOption.XLML_DATASET,
+    )
+
+    with self.assertRaisesRegex(ValueError, "can't share a TPU"):
+      task.run_queued_resource_test_group("group", configs, gcp)
+
+
+class TpuPoolTest(absltest.TestCase):
+
+  def test_tasks_hold_pool_until_tpu_is_deleted(self):
+    config = test_config.TpuVmTest(
+        test_config.Tpu(version=TpuVersion.V4, cores=8, reserved=True),
+        test_name="test",
+        set_up_cmds=["pip install package"],
+        run_model_cmds=["python train.py"],
+    )
+    gcp = gcp_config.GCPConfig(
+        project_name="project",
+        zone="zone",
+        dataset_name=metric_config.DatasetOption.XLML_DATASET,
+    )
+    env = {
+        composer_env.COMPOSER_ENVIRONMENT: composer_env.PROD_COMPOSER_ENV_NAME
+    }
+    capacity_cores = {("project", "zone", TpuVersion.V4, True): 64}
+
+    with mock.patch.dict(os.environ, env), mock.patch.dict(
+        capacity.TPU_CORES, capacity_cores, clear=True
+    ), airflow.DAG("test_dag", schedule=None) as dag:
+      task.run_queued_resource_test(config, gcp)
+
+    create = "test-v4-8.provision.create_queued_resource"
+    for task_id in (
+        f"{create}.create_queued_resource_request",
+        "test-v4-8.provision.setup",
+        "test-v4-8.run_model",
+        "test-v4-8.post_process.process_metrics",
+        "test-v4-8.clean_up.wait_for_queued_resource_deletion",
+    ):
+      op = dag.get_task(task_id)
+      self.assertEqual(op.pool, "tpu-project-zone-v4-reserved", task_id)
+      self.assertEqual(op.pool_slots, 8, task_id)
+    sensor = dag.get_task(f"{create}.wait_for_ready_queued_resource")
+    self.assertEqual(sensor.pool, "tpu-project-zone-v4-reserved")
+    self.assertEqual(sensor.mode, "reschedule")
+
+    # Capacity is reserved before the queued resource is requested, and only
+    # released once the TPU is deleted.
+    reserve = dag.get_task("test-v4-8.provision.reserve_tpu_cores")
+    self.assertIn(
+        f"{create}.create_queued_resource_request", reserve.downstream_task_ids
+    )
+    self.assertEqual(reserve.pool, "default_pool")
+    release = dag.get_task("test-v4-8.release_tpu_cores")
+    self.assertIn(
+        "test-v4-8.clean_up.wait_for_queued_resource_deletion",
+        release.upstream_task_ids,
+    )
+    self.assertEqual(release.trigger_rule, "all_done")
+    self.assertEqual(release.pool, "default_pool")
+
+
+class StagedFilesTest(absltest.TestCase):
+  """Every test config can be built into a DAG, with or without staged files."""
+
+  def setUp(self):
+    super().setUp()
+    self.gcp = gcp_config.GCPConfig(
+        project_name="project",
+        zone="us-central2-b",
+        dataset_name=metric_config.DatasetOption.XLML_DATASET,
+    )
+    self.dag = self.enter_context(airflow.DAG("test_dag", schedule=None))
+
+  def test_jsonnet_tpu_vm_test(self):
+    config = test_config.JSonnetTpuVmTest(
+        test_config.Tpu(version=TpuVersion.V4, cores=8),
+        test_name="jsonnet-test",
+        setup="pip install torch",
+        exports="",
+        test_command=["python3", "test.py"],
+    )
+
+    task.run_queued_resource_test(config, self.gcp)
+
+    self.assertIn(
+        "jsonnet-test.run_model",
+        [t.task_id for t in self.dag.tasks],
+    )
+
+  def test_xpk_cpu_gke_test(self):
+    config = test_config.CpuGkeTest(
+        test_config.Cpu(device_type=CpuVersion.M1_MEGAMEM, machine_count=1),
+        test_name="cpu-test",
+        cluster_name="cluster",
+        docker_image="image",
+        set_up_cmds=(),
+        run_model_cmds=("python3 test.py",),
+        timeout=datetime.timedelta(minutes=10),
+    )
+
+    task.XpkTask(task_test_config=config, task_gcp_config=self.gcp).run()
+
+    task_ids = [t.task_id for t in self.dag.tasks]
+    self.assertIn(
+        "cpu-test-m1-megamem-96-1.run_model.wait_for_workload_completion",
+        task_ids,
+    )
+    self.assertNotIn("cpu-test-m1-megamem-96-1.run_model.upload", task_ids)
+
+  def test_xpk_uploads_staged_files(self):
+    config = test_config.TpuGkeTest(
+        test_config.Tpu(version=TpuVersion.V4, cores=8),
+        test_name="tpu-test",
+        cluster_name="cluster",
+        docker_image="image",
+        set_up_cmds=(),
+        run_model_cmds=("bash test.sh",),
+        timeout=datetime.timedelta(minutes=10),
+        staged_files=(staging.StagedFile("/dags/test.sh", "abc"),),
+    )
+
+    task.XpkTask(task_test_config=config, task_gcp_config=self.gcp).run()
+
+    upload = self.dag.get_task("tpu-test-v4-8.run_model.upload")
+    self.assertIn(
+        "tpu-test-v4-8.run_model.launch_workload.run_workload",
+        upload.downstream_task_ids,
+    )
+    self.assertIn("abc/test.sh", config.test_script)
+
+
+class SweepTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.config = test_config.TpuGkeTest(
+        test_config.Tpu(version=TpuVersion.V4, cores=8),
+        test_name="sweep-test",
+        cluster_name="cluster",
+        docker_image="image",
+        set_up_cmds=(),
+        run_model_cmds=("bash test.sh",),
+        timeout=datetime.timedelta(minutes=10),
+        staged_files=(staging.StagedFile("/dags/test.sh", "abc"),),
+    )
+    self.gcp = gcp_config.GCPConfig(
+        project_name="project",
+        zone="us-central2-b",
+        dataset_name=metric_config.DatasetOption.XLML_DATASET,
+    )
+    self.metric_config = metric_config.MetricConfig(
+        tensorboard_summary=metric_config.SummaryConfig(
+            file_location="gs://bucket/output",
+            aggregation_strategy=metric_config.AggregationStrategy.LAST,
+            use_regex_file_location=True,
+        )
+    )
+
+  def test_sweep_point_records_its_tensorboard_summary(self):
+    with airflow.DAG("test_dag", schedule=None) as dag:
+      task.XpkTask(self.config, self.gcp, self.metric_config).run_sweep(
+          {"A": [1, 2]}
+      )
+
+    generate_sweep_run = dag.get_task("sweep-test-v4-8.generate_sweep_run")
+    # Includes the download commands of the staged files.
+    self.assertIn(self.config.test_script, generate_sweep_run.op_args)
+    process_metrics = dag.get_task(
+        "sweep-test-v4-8.post_process.process_metrics"
+    )
+    tb_file_location = process_metrics.op_kwargs["tb_file_location"]
+    self.assertIsInstance(tb_file_location, airflow.XComArg)
+    self.assertEqual(tb_file_location.operator, generate_sweep_run)
+    self.assertEqual(tb_file_location.key, "tb_file_location")
+
+    # Run the post process of one point with its XComs resolved.
+    (
+        _,
+        test_config_arg,
+        metric_config_arg,
+        gcp_config_arg,
+    ) = process_metrics.op_args
+    point_location = "gs://bucket/output/run-0/tensorboard/events.out.*"
+    with mock.patch.multiple(
+        metric,
+        process_tensorboard_summary=mock.DEFAULT,
+        add_airflow_metadata=mock.DEFAULT,
+        get_phase_durations=mock.DEFAULT,
+        get_xpk_job_status=mock.DEFAULT,
+    ) as mocks, mock.patch.object(
+        bigquery, "BigQueryMetricClient"
+    ) as client, mock.patch.object(
+        name_format,
+        "get_current_context",
+        return_value={"task": process_metrics, "dag_run": mock.MagicMock()},
+    ):
+      mocks["process_tensorboard_summary"].return_value = ([[]], [[]])
+      mocks["add_airflow_metadata"].side_effect = lambda _, __, rows: rows
+      mocks["get_phase_durations"].return_value = {}
+      mocks["get_xpk_job_status"].return_value = bigquery.JobStatus.SUCCESS
+      process_metrics.python_callable(
+          "process-id",
+          test_config_arg,
+          metric_config_arg,
+          gcp_config_arg,
+          folder_location="gs://bucket/run-0",
+          extra_metadata={"A": 1},
+          tb_file_location=point_location,
+      )
+
+    summary_config = mocks["process_tensorboard_summary"].call_args.args[1]
+    self.assertEqual(summary_config.file_location, point_location)
+    (test_run,) = client.return_value.insert.call_args.args[0]
+    self.assertIn(
+        bigquery.MetadataHistoryRow(
+            job_uuid=metric.generate_row_uuid("process-id", 0),
+            metadata_key="A",
+            metadata_value="1",
+        ),
+        test_run.metadata_history,
+    )
+
+
+if __name__ == "__main__":
+  absltest.main()
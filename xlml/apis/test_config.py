@@ -47,11 +47,12 @@ import abc
 import json
 import os
 import shlex
-from typing import Any, Generic, Iterable, List, Optional, TypeVar
+from typing import Any, Dict, Generic, Iterable, List, Optional, Tuple, TypeVar
 
 import attrs
 import datetime
 from dags.vm_resource import TpuVersion, CpuVersion
+from xlml.utils import setup_cache, staging
 
 
 class Accelerator(abc.ABC):
@@ -90,6 +91,14 @@ class Tpu(Accelerator):
     """Name of this TPU type in the Cloud TPU API (e.g. 'v4-8')."""
     return f'v{self.version.value}-{self.cores}'
 
+  @property
+  def num_chips(self) -> int:
+    """Number of TPU chips in this TPU type."""
+    # v5e names count chips, other versions count TensorCores (2 per chip).
+    if self.version == TpuVersion.V5E:
+      return self.cores
+    return self.cores // 2
+
 
 @attrs.define
 class Gpu(Accelerator):
@@ -114,6 +123,11 @@ class Gpu(Accelerator):
     """Name of this GPU type in the Cloud GPU API (e.g. 'a2-highgpu-1g')."""
     return self.accelerator_type
 
+  @property
+  def num_chips(self) -> int:
+    """Number of GPU devices in this instance."""
+    return self.count
+
 
 @attrs.define
 class Cpu(Accelerator):
@@ -144,6 +158,9 @@ class TestConfig(abc.ABC, Generic[A]):
     timeout: Test timeout.
     task_owner: Task owner username or link.
     gcs_subfolder: Subfolder name for default GCS bucket.
+    staged_files: Files from `staging.stage` that `test_script` needs in its
+      working directory. Tasks that SSH into the hosts copy them over SFTP,
+      and xpk workloads download them from GCS.
   """
 
   accelerator: A
@@ -152,6 +169,9 @@ class TestConfig(abc.ABC, Generic[A]):
   )
   task_owner: str = attrs.field(default='unowned', kw_only=True)
   gcs_subfolder: str = attrs.field(default='unowned', kw_only=True)
+  staged_files: Tuple[staging.StagedFile, ...] = attrs.field(
+      default=(), kw_only=True
+  )
 
   @property
   @abc.abstractmethod
@@ -183,12 +203,16 @@ class TpuVmTest(TestConfig[Tpu]):
     set_up_cmds: List of commands to run once when TPU is created.
     run_model_cmds: List of commands to run the model under test.
     num_slices: Number of TPU slices.
+    cache_setup: Whether to save the environment that `set_up_cmds` create to
+      GCS and restore it in later runs. Only use it if the commands install
+      pinned versions, since nightly packages would not be updated.
   """
 
   test_name: str
   set_up_cmds: Iterable[str]
   run_model_cmds: Iterable[str]
   num_slices: int = attrs.field(default=1, kw_only=True)
+  cache_setup: bool = attrs.field(default=False, kw_only=True)
 
   @property
   def benchmark_id(self) -> str:
@@ -200,7 +224,12 @@ class TpuVmTest(TestConfig[Tpu]):
 
   @property
   def setup_script(self) -> Optional[str]:
-    return '\n'.join(('set -xue', *self.set_up_cmds))
+    setup_script = '\n'.join(('set -xue', *self.set_up_cmds))
+    if self.cache_setup:
+      return setup_cache.wrap_setup_script(
+          setup_script, self.accelerator.runtime_version
+      )
+    return setup_script
 
   @property
   def test_script(self) -> str:
@@ -266,7 +295,11 @@ class CpuGkeTest(TestConfig[Cpu]):
 
   @property
   def test_script(self) -> str:
-    return ';'.join(('set -xue', *self.run_model_cmds))
+    return ';'.join((
+        'set -xue',
+        *staging.get_download_cmds(self.staged_files),
+        *self.run_model_cmds,
+    ))
 
 
 @attrs.define
@@ -305,7 +338,42 @@ class TpuGkeTest(TestConfig[Tpu]):
 
   @property
   def test_script(self) -> str:
-    return ';'.join(('set -xue', *self.run_model_cmds))
+    return ';'.join((
+        'set -xue',
+        *staging.get_download_cmds(self.staged_files),
+        *self.run_model_cmds,
+    ))
+
+
+# Written by `scripts/gen-configs.sh` next to the per-test files. Maps each test
+# name to its compiled config.
+JSONNET_INDEX_FILE = '_index.json'
+
+# Parsed index and the `(path, mtime)` it was loaded from.
+_jsonnet_index: Optional[Dict[str, Any]] = None
+_jsonnet_index_source: Optional[Tuple[str, float]] = None
+
+
+def _load_jsonnet_index(config_dir: str) -> Optional[Dict[str, Any]]:
+  """Load the compiled config index once, reloading it if the file changes.
+
+  Returns:
+    The index, or None if `config_dir` has no index file.
+  """
+  global _jsonnet_index, _jsonnet_index_source
+
+  index_path = os.path.join(config_dir, JSONNET_INDEX_FILE)
+  try:
+    mtime = os.stat(index_path).st_mtime
+  except FileNotFoundError:
+    return None
+
+  if _jsonnet_index_source != (index_path, mtime):
+    with open(index_path, 'r') as f:
+      _jsonnet_index = json.load(f)
+    _jsonnet_index_source = (index_path, mtime)
+
+  return _jsonnet_index
 
 
 def _load_compiled_jsonnet(test_name: str) -> Any:
@@ -313,6 +381,10 @@ def _load_compiled_jsonnet(test_name: str) -> Any:
   config_dir = os.environ.get(
       'XLMLTEST_CONFIGS', '/home/airflow/gcs/dags/dags/jsonnet'
   )
+  index = _load_jsonnet_index(config_dir)
+  if index is not None and test_name in index:
+    return index[test_name]
+
   test_path = os.path.join(config_dir, test_name)
   with open(test_path, 'r') as f:
     test = json.load(f)
@@ -352,7 +424,10 @@ class GpuXpkTest(TestConfig[Gpu]):
 
   @property
   def test_script(self) -> str:
-    return ';'.join(self.run_model_cmds)
+    return ';'.join((
+        *staging.get_download_cmds(self.staged_files),
+        *self.run_model_cmds,
+    ))
 
 
 @attrs.define
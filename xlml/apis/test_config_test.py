@@ -0,0 +1,99 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for test_config.py."""
+
+import json
+import os
+import tempfile
+from unittest import mock
+from absl.testing import absltest
+from absl.testing import parameterized
+from dags.vm_resource import TpuVersion
+from xlml.apis import test_config
+
+
+class LoadCompiledJsonnetTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.config_dir = self.enter_context(tempfile.TemporaryDirectory())
+    self.enter_context(
+        mock.patch.dict(os.environ, {"XLMLTEST_CONFIGS": self.config_dir})
+    )
+    self.enter_context(
+        mock.patch.object(test_config, "_jsonnet_index_source", None)
+    )
+
+  def _write_index(self, index, mtime):
+    path = os.path.join(self.config_dir, test_config.JSONNET_INDEX_FILE)
+    with open(path, "w") as f:
+      json.dump(index, f)
+    os.utime(path, (mtime, mtime))
+
+  def test_loads_from_index_once(self):
+    self._write_index({"a": {"name": "a"}, "b": {"name": "b"}}, mtime=1)
+
+    with mock.patch.object(json, "load", wraps=json.load) as load:
+      self.assertEqual(test_config._load_compiled_jsonnet("a"), {"name": "a"})
+      self.assertEqual(test_config._load_compiled_jsonnet("b"), {"name": "b"})
+    load.assert_called_once()
+
+  def test_reloads_index_when_modified(self):
+    self._write_index({"a": {"version": 1}}, mtime=1)
+    self.assertEqual(test_config._load_compiled_jsonnet("a"), {"version": 1})
+
+    self._write_index({"a": {"version": 2}}, mtime=2)
+    self.assertEqual(test_config._load_compiled_jsonnet("a"), {"version": 2})
+
+  def test_falls_back_to_test_file(self):
+    with open(os.path.join(self.config_dir, "a"), "w") as f:
+      json.dump({"name": "a"}, f)
+
+    self.assertEqual(test_config._load_compiled_jsonnet("a"), {"name": "a"})
+
+
+class TpuTest(parameterized.TestCase):
+
+  @parameterized.named_parameters(
+      ("v4", TpuVersion.V4, 8, 4),
+      ("v5p", TpuVersion.V5P, 128, 64),
+      ("v5e", TpuVersion.V5E, 16, 16),
+  )
+  def test_num_chips(self, version, cores, expected):
+    tpu = test_config.Tpu(version=version, cores=cores)
+    self.assertEqual(tpu.num_chips, expected)
+
+
+class TpuVmTestTest(absltest.TestCase):
+
+  def test_cache_setup(self):
+    kwargs = dict(
+        accelerator=test_config.Tpu(
+            version=TpuVersion.V4, cores=8, runtime_version="runtime"
+        ),
+        test_name="test",
+        set_up_cmds=["pip install a==1.0"],
+        run_model_cmds=["python train.py"],
+    )
+    uncached = test_config.TpuVmTest(**kwargs)
+    cached = test_config.TpuVmTest(**kwargs, cache_setup=True)
+
+    self.assertEqual(uncached.setup_script, "set -xue\npip install a==1.0")
+    self.assertIn("gcloud storage cp", cached.setup_script)
+    self.assertIn("pip install a==1.0", cached.setup_script)
+
+
+if __name__ == "__main__":
+  absltest.main()
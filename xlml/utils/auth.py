@@ -0,0 +1,114 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Process-wide cache of Google credentials and API clients.
+
+Credentials and clients are created once per worker process and shared by all
+tasks that run in it. Clients hold their own gRPC channels or HTTP sessions, so
+reusing them avoids a new handshake for every API call.
+"""
+
+import os
+import threading
+from typing import Any, Dict, Optional, Sequence, Tuple, Type, TypeVar
+
+import google.auth
+import google.auth.credentials
+from xlml.utils import lazy
+
+transport_requests = lazy.import_module('google.auth.transport.requests')
+
+
+CLOUD_PLATFORM_SCOPE = 'https://www.googleapis.com/auth/cloud-platform'
+
+C = TypeVar('C')
+
+_lock = threading.RLock()
+_credentials: Dict[
+    Tuple[str, ...],
+    Tuple[google.auth.credentials.Credentials, Optional[str]],
+] = {}
+_clients: Dict[Tuple[Any, ...], Any] = {}
+
+
+def _reset() -> None:
+  """Drop all cached credentials and clients."""
+  with _lock:
+    _credentials.clear()
+    _clients.clear()
+
+
+# gRPC channels must not be shared across `fork`. Airflow forks a new process
+# for each task, so start every child with an empty cache.
+if hasattr(os, 'register_at_fork'):
+  os.register_at_fork(after_in_child=_reset)
+
+
+def get_default_credentials(
+    scopes: Optional[Sequence[str]] = None,
+) -> Tuple[google.auth.credentials.Credentials, Optional[str]]:
+  """Get the application default credentials for the given scopes.
+
+  Args:
+    scopes: OAuth scopes to request. Credentials are cached per set of scopes.
+
+  Returns:
+    A tuple of the cached credentials and the default project ID.
+  """
+  key = tuple(sorted(scopes or ()))
+  with _lock:
+    if key not in _credentials:
+      _credentials[key] = google.auth.default(scopes=list(key) or None)
+    return _credentials[key]
+
+
+def get_access_token(
+    scopes: Sequence[str] = (CLOUD_PLATFORM_SCOPE,),
+) -> str:
+  """Get an OAuth access token, refreshing it only when it is near expiry.
+
+  Args:
+    scopes: OAuth scopes to request.
+
+  Returns:
+    A valid bearer token.
+  """
+  creds, _ = get_default_credentials(scopes)
+  with _lock:
+    # `valid` is False when the token is missing or within the refresh
+    # threshold of its expiry.
+    if not creds.valid:
+      creds.refresh(transport_requests.Request())
+    return creds.token
+
+
+def get_client(client_cls: Type[C], **kwargs) -> C:
+  """Get a shared instance of a Google Cloud API client.
+
+  Clients are keyed by class and keyword arguments (e.g. `project`), and are
+  constructed with the cached default credentials.
+
+  Args:
+    client_cls: Client class to construct, e.g. `tpu_api.TpuClient`.
+    **kwargs: Extra keyword arguments passed to the client constructor.
+
+  Returns:
+    A cached client of type `client_cls`.
+  """
+  key = (client_cls, *sorted(kwargs.items()))
+  with _lock:
+    if key not in _clients:
+      creds, _ = get_default_credentials()
+      _clients[key] = client_cls(credentials=creds, **kwargs)
+    return _clients[key]
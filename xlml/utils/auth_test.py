@@ -0,0 +1,73 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for auth.py."""
+
+from unittest import mock
+from absl.testing import absltest
+import google.auth
+from xlml.utils import auth
+
+
+class AuthTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    auth._reset()
+    self.creds = mock.MagicMock()
+    self.enter_context(
+        mock.patch.object(
+            google.auth,
+            "default",
+            return_value=(self.creds, "mock_project"),
+        )
+    )
+
+  def tearDown(self):
+    auth._reset()
+    super().tearDown()
+
+  def test_get_default_credentials_cached(self):
+    first = auth.get_default_credentials([auth.CLOUD_PLATFORM_SCOPE])
+    second = auth.get_default_credentials([auth.CLOUD_PLATFORM_SCOPE])
+
+    self.assertIs(first, second)
+    google.auth.default.assert_called_once()
+
+  def test_get_access_token_refreshes_only_when_invalid(self):
+    self.creds.valid = True
+    self.creds.token = "token"
+
+    self.assertEqual(auth.get_access_token(), "token")
+    self.creds.refresh.assert_not_called()
+
+    self.creds.valid = False
+    auth.get_access_token()
+    self.creds.refresh.assert_called_once()
+
+  def test_get_client_cached_per_kwargs(self):
+    client_cls = mock.MagicMock(side_effect=lambda **_: mock.MagicMock())
+
+    first = auth.get_client(client_cls, project="a")
+    second = auth.get_client(client_cls, project="a")
+    other = auth.get_client(client_cls, project="b")
+
+    self.assertIs(first, second)
+    self.assertIsNot(first, other)
+    self.assertEqual(client_cls.call_count, 2)
+    client_cls.assert_any_call(credentials=self.creds, project="a")
+
+
+if __name__ == "__main__":
+  absltest.main()
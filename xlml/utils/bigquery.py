@@ -19,12 +19,14 @@ import dataclasses
 import datetime
 import enum
 import math
-from typing import Iterable, Optional
+from typing import Any, Iterable, List, Optional, Tuple
 
 from absl import logging
 import google.auth
-from google.cloud import bigquery
 from xlml.apis import metric_config
+from xlml.utils import lazy
+
+bigquery = lazy.import_module("google.cloud.bigquery")
 
 BENCHMARK_BQ_JOB_TABLE_NAME = "job_history"
 BENCHMARK_BQ_METRIC_TABLE_NAME = "metric_history"
@@ -143,15 +145,30 @@ class BigQueryMetricClient:
           (self.metric_history_table_id, metric_history_rows),
           (self.metadata_history_table_id, metadata_history_rows),
       ]:
-        if not rows:
-          continue
-        logging.info(
-            f"Inserting {len(rows)} rows into BigQuery table {table_id}."
-        )
-        table = self.client.get_table(table_id)
-        errors = self.client.insert_rows(table, rows)
-
-        if errors:
-          raise RuntimeError(f"Failed to add rows to Bigquery: {errors}.")
-        else:
-          logging.info("Successfully added rows to Bigquery.")
+        self._insert_rows(table_id, rows)
+
+  def insert_metric_history(self, rows: Iterable[MetricHistoryRow]) -> None:
+    """Insert metrics for test runs that are already in the job history.
+
+    Args:
+      rows: Metric rows to insert.
+    """
+    metric_history_rows = []
+    for each in rows:
+      if self.is_valid_metric(each.metric_value):
+        metric_history_rows.append(dataclasses.astuple(each))
+      else:
+        logging.error(f"Discarding metric as {each.metric_value} is invalid.")
+    self._insert_rows(self.metric_history_table_id, metric_history_rows)
+
+  def _insert_rows(self, table_id: str, rows: List[Tuple[Any, ...]]) -> None:
+    if not rows:
+      return
+    logging.info(f"Inserting {len(rows)} rows into BigQuery table {table_id}.")
+    table = self.client.get_table(table_id)
+    errors = self.client.insert_rows(table, rows)
+
+    if errors:
+      raise RuntimeError(f"Failed to add rows to Bigquery: {errors}.")
+    else:
+      logging.info("Successfully added rows to Bigquery.")
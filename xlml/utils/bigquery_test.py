@@ -85,6 +85,23 @@ class BenchmarkBigQueryMetricTest(parameterized.TestCase, absltest.TestCase):
     bq_metric = test_bigquery.BigQueryMetricClient()
     bq_metric.insert(self.test_runs)
 
+  @mock.patch.object(
+      google.auth, "default", return_value=["mock", "mock_project"]
+  )
+  @mock.patch.object(bigquery.Client, "get_table", return_value="mock_table")
+  @mock.patch.object(bigquery.Client, "insert_rows", return_value=[])
+  def test_insert_metric_history(self, insert_rows, get_table, default):
+    del get_table, default
+    bq_metric = test_bigquery.BigQueryMetricClient()
+    bq_metric.insert_metric_history([
+        self.metric_history_row,
+        test_bigquery.MetricHistoryRow(
+            job_uuid="job1", metric_key="metric2", metric_value=math.nan
+        ),
+    ])
+
+    insert_rows.assert_called_once_with("mock_table", [("job1", "metric1", 0)])
+
 
 if __name__ == "__main__":
   absltest.main()
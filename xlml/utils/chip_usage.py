@@ -0,0 +1,148 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Utilities to account for the accelerator time that tests use.
+
+Chip-seconds recorded by `metric.record_phase_durations` are summed per test
+and per DAG for each day by `rollup_chip_usage`.
+"""
+
+from typing import Any, Dict, List
+
+from absl import logging
+from airflow.decorators import task
+from xlml.utils import auth, lazy, metric
+
+bigquery = lazy.import_module("google.cloud.bigquery")
+
+
+ROLLUP_TABLE_NAME = "chip_usage_daily"
+
+# Number of tests with the most idle chip-hours to log after a rollup.
+NUM_TOP_IDLE = 10
+
+
+def query_chip_usage(
+    project: str, dataset: str, day: str
+) -> List[Dict[str, Any]]:
+  """Sum the chip-hours that tests held on one day.
+
+  Args:
+    project: Project of the metric dataset.
+    dataset: Name of the metric dataset.
+    day: Day to sum over, formatted as `YYYY-MM-DD`.
+
+  Returns:
+    A row for each benchmark ID and DAG ID, with the `runs` and the `total`,
+    `setup`, `run_model` and `idle` chip-hours.
+  """
+  query = f"""
+      SELECT
+        DATE(job.timestamp) AS day,
+        job.job_name AS benchmark_id,
+        IFNULL(meta.metadata_value, "") AS dag_id,
+        COUNT(DISTINCT job.uuid) AS runs,
+        SUM(IF(metric.metric_key = @total, metric.metric_value, 0)) / 3600
+          AS total_chip_hours,
+        SUM(IF(metric.metric_key = @setup, metric.metric_value, 0)) / 3600
+          AS setup_chip_hours,
+        SUM(IF(metric.metric_key = @run_model, metric.metric_value, 0)) / 3600
+          AS run_model_chip_hours,
+        SUM(IF(metric.metric_key = @idle, metric.metric_value, 0)) / 3600
+          AS idle_chip_hours
+      FROM `{project}.{dataset}.job_history` AS job
+      JOIN `{project}.{dataset}.metric_history` AS metric
+        ON job.uuid = metric.job_uuid
+      LEFT JOIN `{project}.{dataset}.metadata_history` AS meta
+        ON job.uuid = meta.job_uuid AND meta.metadata_key = "dag_id"
+      WHERE
+        DATE(job.timestamp) = @day
+        AND STARTS_WITH(metric.metric_key, @prefix)
+      GROUP BY day, benchmark_id, dag_id
+  """
+  prefix = metric.CHIP_USAGE_METRIC_PREFIX
+  job_config = bigquery.QueryJobConfig(
+      query_parameters=[
+          bigquery.ScalarQueryParameter("day", "DATE", day),
+          bigquery.ScalarQueryParameter("prefix", "STRING", f"{prefix}/"),
+          *(
+              bigquery.ScalarQueryParameter(key, "STRING", f"{prefix}/{key}")
+              for key in ("total", "setup", "run_model", "idle")
+          ),
+      ]
+  )
+  client = auth.get_client(bigquery.Client, project=project)
+  return [
+      dict(row.items())
+      for row in client.query(query, job_config=job_config).result()
+  ]
+
+
+def get_top_idle(
+    rows: List[Dict[str, Any]], num_rows: int = NUM_TOP_IDLE
+) -> List[Dict[str, Any]]:
+  """Get the rows with the most idle chip-hours, most idle first."""
+  idle_rows = [row for row in rows if row["idle_chip_hours"] > 0]
+  idle_rows.sort(key=lambda row: row["idle_chip_hours"], reverse=True)
+  return idle_rows[:num_rows]
+
+
+@task
+def rollup_chip_usage(project: str, dataset: str, day: str) -> None:
+  """Write the daily chip usage of every test to the rollup table.
+
+  The day's partition of the rollup table is replaced, so reruns for the same
+  day are idempotent.
+
+  Args:
+    project: Project of the metric dataset.
+    dataset: Name of the metric dataset.
+    day: Day to roll up, formatted as `YYYY-MM-DD`.
+  """
+  rows = query_chip_usage(project, dataset, day)
+  logging.info(
+      f"{len(rows)} tests in {dataset} used"
+      f" {sum(row['total_chip_hours'] for row in rows):.1f} chip-hours on"
+      f" {day}."
+  )
+  for row in get_top_idle(rows):
+    logging.info(
+        f"{row['benchmark_id']} in {row['dag_id']} idled"
+        f" {row['idle_chip_hours']:.1f} of {row['total_chip_hours']:.1f}"
+        " chip-hours."
+    )
+  if not rows:
+    return
+
+  for row in rows:
+    row["day"] = str(row["day"])
+  partition = day.replace("-", "")
+  table_id = f"{project}.{dataset}.{ROLLUP_TABLE_NAME}${partition}"
+  job_config = bigquery.LoadJobConfig(
+      schema=[
+          bigquery.SchemaField("day", "DATE"),
+          bigquery.SchemaField("benchmark_id", "STRING"),
+          bigquery.SchemaField("dag_id", "STRING"),
+          bigquery.SchemaField("runs", "INT64"),
+          bigquery.SchemaField("total_chip_hours", "FLOAT64"),
+          bigquery.SchemaField("setup_chip_hours", "FLOAT64"),
+          bigquery.SchemaField("run_model_chip_hours", "FLOAT64"),
+          bigquery.SchemaField("idle_chip_hours", "FLOAT64"),
+      ],
+      time_partitioning=bigquery.TimePartitioning(field="day"),
+      write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+  )
+  client = auth.get_client(bigquery.Client, project=project)
+  client.load_table_from_json(rows, table_id, job_config=job_config).result()
+  logging.info(f"Wrote {len(rows)} rows to {table_id}.")
@@ -14,9 +14,23 @@
 
 """Utilities get Composer configs."""
 
-from typing import Mapping
-import google.auth.transport.requests
+import datetime
+import os
+from typing import Mapping, Optional
+from absl import logging
+from airflow.configuration import conf
+from airflow.models import Variable
 import requests
+from xlml.utils import auth
+import google.auth.exceptions
+
+
+# Environment variable that overrides the Airflow web UI URL.
+AIRFLOW_URL_ENV_VAR = "XLMLTEST_AIRFLOW_URL"
+# Airflow Variable that caches the Airflow web UI URL across tasks.
+AIRFLOW_URL_VARIABLE = "xlml_airflow_url"
+# How long a cached Airflow web UI URL is used before it is looked up again.
+AIRFLOW_URL_TTL = datetime.timedelta(days=1)
 
 
 def get_headers() -> Mapping[str, str]:
@@ -25,11 +39,8 @@ def get_headers() -> Mapping[str, str]:
   Returns:
     A dict mapping credentials.
   """
-  creds, _ = google.auth.default(
-      scopes=["https://www.googleapis.com/auth/cloud-platform"]
-  )
-  creds.refresh(google.auth.transport.requests.Request())
-  return {"Authorization": f"Bearer {creds.token}"}
+  token = auth.get_access_token()
+  return {"Authorization": f"Bearer {token}"}
 
 
 def get_composer_data(project: str, region: str, env: str) -> Mapping[str, str]:
@@ -48,14 +59,35 @@ def get_composer_data(project: str, region: str, env: str) -> Mapping[str, str]:
       f"v1beta1/projects/{project}/locations/"
       f"{region}/environments/{env}"
   )
-  response = requests.get(request_endpoint, headers=get_headers())
-  print("response.json()", response.json())
+  response = requests.get(request_endpoint, headers=get_headers(), timeout=30)
+  response.raise_for_status()
+  logging.info(f"Fetched Composer metadata for {request_endpoint}.")
   return response.json()
 
 
+def _get_cached_airflow_url(key: str) -> Optional[Mapping[str, str]]:
+  cached = Variable.get(AIRFLOW_URL_VARIABLE, {}, deserialize_json=True)
+  return cached.get(key)
+
+
+def _set_cached_airflow_url(key: str, url: str) -> None:
+  cached = Variable.get(AIRFLOW_URL_VARIABLE, {}, deserialize_json=True)
+  cached[key] = {
+      "url": url,
+      "fetched_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+  }
+  Variable.set(AIRFLOW_URL_VARIABLE, cached, serialize_json=True)
+
+
 def get_airflow_url(project: str, region: str, env: str) -> str:
   """Get Airflow web UI.
 
+  The URL is resolved in order from the `XLMLTEST_AIRFLOW_URL` environment
+  variable, a cached value in the `xlml_airflow_url` Airflow Variable that is
+  younger than `AIRFLOW_URL_TTL`, and the Composer API. If the Composer API is
+  unavailable, including when credentials can't be refreshed, a stale cached
+  value or the `[webserver] base_url` config is used instead.
+
   Args:
    project: The project name of the composer.
    region: The region of the composer.
@@ -64,5 +96,30 @@ def get_airflow_url(project: str, region: str, env: str) -> str:
   Returns:
   The URL of Airflow.
   """
-  configs = get_composer_data(project, region, env)
-  return configs["config"]["airflowUri"]
+  override = os.environ.get(AIRFLOW_URL_ENV_VAR)
+  if override:
+    return override
+
+  key = f"{project}/{region}/{env}"
+  cached = _get_cached_airflow_url(key)
+  if cached:
+    fetched_at = datetime.datetime.fromisoformat(cached["fetched_at"])
+    age = datetime.datetime.now(datetime.timezone.utc) - fetched_at
+    if age < AIRFLOW_URL_TTL:
+      return cached["url"]
+
+  try:
+    configs = get_composer_data(project, region, env)
+    url = configs["config"]["airflowUri"]
+  except (
+      requests.RequestException,
+      google.auth.exceptions.GoogleAuthError,
+      KeyError,
+  ) as e:
+    logging.warning(f"Failed to get Airflow URL from Composer: {e}")
+    if cached:
+      return cached["url"]
+    return conf.get("webserver", "base_url", fallback="")
+
+  _set_cached_airflow_url(key, url)
+  return url
@@ -0,0 +1,105 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for composer.py."""
+
+import datetime
+import os
+from unittest import mock
+from absl.testing import absltest
+import google.auth.exceptions
+import requests
+from xlml.utils import composer
+
+
+def _cache_entry(url: str, age: datetime.timedelta):
+  fetched_at = datetime.datetime.now(datetime.timezone.utc) - age
+  return {
+      "project/region/env": {"url": url, "fetched_at": fetched_at.isoformat()}
+  }
+
+
+class ComposerTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.variable = self.enter_context(
+        mock.patch.object(composer, "Variable", autospec=True)
+    )
+    self.get_composer_data = self.enter_context(
+        mock.patch.object(
+            composer,
+            "get_composer_data",
+            return_value={"config": {"airflowUri": "http://fresh"}},
+        )
+    )
+    self.enter_context(mock.patch.dict(os.environ))
+    os.environ.pop(composer.AIRFLOW_URL_ENV_VAR, None)
+
+  def test_get_airflow_url_env_override(self):
+    os.environ[composer.AIRFLOW_URL_ENV_VAR] = "http://override"
+
+    self.assertEqual(
+        composer.get_airflow_url("project", "region", "env"),
+        "http://override",
+    )
+    self.variable.get.assert_not_called()
+    self.get_composer_data.assert_not_called()
+
+  def test_get_airflow_url_cache_hit(self):
+    self.variable.get.return_value = _cache_entry(
+        "http://cached", datetime.timedelta(hours=1)
+    )
+
+    self.assertEqual(
+        composer.get_airflow_url("project", "region", "env"), "http://cached"
+    )
+    self.get_composer_data.assert_not_called()
+
+  def test_get_airflow_url_cache_expired(self):
+    self.variable.get.return_value = _cache_entry(
+        "http://cached", composer.AIRFLOW_URL_TTL * 2
+    )
+
+    self.assertEqual(
+        composer.get_airflow_url("project", "region", "env"), "http://fresh"
+    )
+    self.variable.set.assert_called_once()
+
+  def test_get_airflow_url_falls_back_to_stale_cache(self):
+    self.variable.get.return_value = _cache_entry(
+        "http://cached", composer.AIRFLOW_URL_TTL * 2
+    )
+    self.get_composer_data.side_effect = requests.ConnectionError()
+
+    self.assertEqual(
+        composer.get_airflow_url("project", "region", "env"), "http://cached"
+    )
+    self.variable.set.assert_not_called()
+
+  @mock.patch.object(composer, "conf", autospec=True)
+  def test_get_airflow_url_falls_back_to_base_url_on_auth_error(self, conf):
+    self.variable.get.return_value = {}
+    self.get_composer_data.side_effect = google.auth.exceptions.RefreshError()
+    conf.get.return_value = "http://base"
+
+    self.assertEqual(
+        composer.get_airflow_url("project", "region", "env"), "http://base"
+    )
+    conf.get.assert_called_once_with("webserver", "base_url", fallback="")
+    self.variable.set.assert_not_called()
+
+
+if __name__ == "__main__":
+  absltest.main()
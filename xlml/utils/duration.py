@@ -0,0 +1,265 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Utilities to schedule tests based on how long their past runs took.
+
+Durations recorded by `metric.process_metrics` are summarized from BigQuery
+by `refresh_duration_history` into a JSON file, which DAGs read at parse time
+without any cloud access.
+
+Since the values end up in the serialized DAGs, they are kept stable: the
+file only changes for tests whose durations changed noticeably, and priorities
+and timeouts are rounded to coarse steps. DAGs are then only reserialized when
+a test really got faster or slower.
+"""
+
+import datetime
+import json
+import math
+import os
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from absl import logging
+from airflow.decorators import task
+from xlml.apis import test_config
+from xlml.utils import auth, lazy, metric
+import google.api_core.exceptions
+
+bigquery = lazy.import_module("google.cloud.bigquery")
+
+
+HISTORY_FILE_ENV_VAR = "XLMLTEST_DURATION_HISTORY"
+DEFAULT_HISTORY_FILE = "/home/airflow/gcs/data/duration_history.json"
+
+# Timeouts derived from history are the P99 duration times this margin,
+# rounded up to a multiple of `TIMEOUT_STEP`.
+TIMEOUT_MARGIN = 1.25
+TIMEOUT_STEP = datetime.timedelta(minutes=15)
+
+# Stats of a test phase are only replaced if its P50 or P99 changed by more
+# than this fraction.
+REFRESH_THRESHOLD = 0.2
+
+_history: Dict[str, Dict[str, Dict[str, float]]] = {}
+_history_source = None
+
+
+def query_duration_history(
+    project: str, dataset: str, days: int = 30
+) -> Dict[str, Dict[str, Dict[str, float]]]:
+  """Summarize the phase durations of recent test runs.
+
+  Args:
+    project: Project of the metric dataset.
+    dataset: Name of the metric dataset.
+    days: Number of days of history to include.
+
+  Returns:
+    A dict that maps benchmark ID to phase to the `p50` and `p99` durations in
+    seconds and the `count` of runs.
+  """
+  query = f"""
+      SELECT
+        job.job_name AS benchmark_id,
+        metric.metric_key AS metric_key,
+        APPROX_QUANTILES(metric.metric_value, 100) AS quantiles,
+        COUNT(*) AS count
+      FROM `{project}.{dataset}.job_history` AS job
+      JOIN `{project}.{dataset}.metric_history` AS metric
+        ON job.uuid = metric.job_uuid
+      WHERE
+        DATE(job.timestamp) >= DATE_SUB(CURRENT_DATE(), INTERVAL @days DAY)
+        AND STARTS_WITH(metric.metric_key, @prefix)
+      GROUP BY benchmark_id, metric_key
+  """
+  job_config = bigquery.QueryJobConfig(
+      query_parameters=[
+          bigquery.ScalarQueryParameter("days", "INT64", days),
+          bigquery.ScalarQueryParameter(
+              "prefix", "STRING", f"{metric.DURATION_METRIC_PREFIX}/"
+          ),
+      ]
+  )
+  client = auth.get_client(bigquery.Client, project=project)
+
+  history = {}
+  for row in client.query(query, job_config=job_config).result():
+    phase = row.metric_key.split("/", 1)[1]
+    history.setdefault(row.benchmark_id, {})[phase] = {
+        "p50": row.quantiles[50],
+        "p99": row.quantiles[99],
+        "count": row.count,
+    }
+  return history
+
+
+def get_history_file() -> str:
+  return os.environ.get(HISTORY_FILE_ENV_VAR, DEFAULT_HISTORY_FILE)
+
+
+def _merge_stats(a: Dict[str, float], b: Dict[str, float]) -> Dict[str, float]:
+  """Combine the stats of the same test phase from two datasets.
+
+  Quantiles can't be merged exactly, so this takes the P50 weighted by the
+  number of runs and the larger P99, which keeps timeouts on the safe side.
+  """
+  count = a["count"] + b["count"]
+  return {
+      "p50": (a["p50"] * a["count"] + b["p50"] * b["count"]) / count,
+      "p99": max(a["p99"], b["p99"]),
+      "count": count,
+  }
+
+
+def _has_changed(old: Dict[str, float], new: Dict[str, float]) -> bool:
+  return any(
+      abs(new[key] - old[key]) > REFRESH_THRESHOLD * old[key]
+      for key in ("p50", "p99")
+  )
+
+
+@task
+def refresh_duration_history(
+    datasets: Iterable[Tuple[str, str]], days: int = 30
+) -> None:
+  """Write the duration history of every dataset to the history file.
+
+  Datasets that don't exist yet are skipped. If any is skipped, the previous
+  stats of tests that no other dataset has history for are kept.
+
+  Args:
+    datasets: Project and name of each metric dataset.
+    days: Number of days of history to include.
+  """
+  history = {}
+  num_missing = 0
+  for project, dataset in datasets:
+    try:
+      dataset_history = query_duration_history(project, dataset, days)
+    except google.api_core.exceptions.NotFound as e:
+      logging.warning(f"Skipping {project}.{dataset}: {e}")
+      num_missing += 1
+      continue
+    if not dataset_history:
+      logging.info(f"No duration history in {project}.{dataset}.")
+
+    for benchmark_id, phases in dataset_history.items():
+      merged = history.setdefault(benchmark_id, {})
+      for phase, stats in phases.items():
+        merged[phase] = (
+            _merge_stats(merged[phase], stats) if phase in merged else stats
+        )
+
+  # Keep the previous stats of phases that barely changed, so that the values
+  # derived from them, and the DAGs that use them, stay the same.
+  previous = _load_history()
+  if num_missing:
+    for benchmark_id, phases in previous.items():
+      for phase, stats in phases.items():
+        history.setdefault(benchmark_id, {}).setdefault(phase, stats)
+  num_changed = 0
+  for benchmark_id, phases in history.items():
+    for phase, stats in phases.items():
+      old = previous.get(benchmark_id, {}).get(phase)
+      if old and not _has_changed(old, stats):
+        phases[phase] = old
+      else:
+        num_changed += 1
+
+  for benchmark_id, phases in sorted(history.items()):
+    if "run_model" in phases:
+      timeout = _get_timeout_from_stats(phases["run_model"])
+      logging.info(f"Suggested run_model timeout of {benchmark_id}: {timeout}")
+
+  # Write to a temporary file first, so that readers never see partial data.
+  history_file = get_history_file()
+  os.makedirs(os.path.dirname(history_file), exist_ok=True)
+  with open(f"{history_file}.tmp", "w") as f:
+    json.dump(history, f)
+  os.replace(f"{history_file}.tmp", history_file)
+  logging.info(
+      f"Wrote duration history of {len(history)} tests, with {num_changed}"
+      " new or changed phases."
+  )
+
+
+def _load_history() -> Dict[str, Dict[str, Dict[str, float]]]:
+  """Load the history file, reusing the cached copy if it hasn't changed."""
+  global _history, _history_source
+
+  history_file = get_history_file()
+  try:
+    mtime = os.stat(history_file).st_mtime
+  except FileNotFoundError:
+    return {}
+
+  if _history_source != (history_file, mtime):
+    with open(history_file, "r") as f:
+      _history = json.load(f)
+    _history_source = (history_file, mtime)
+
+  return _history
+
+
+def _get_timeout_from_stats(stats: Dict[str, float]) -> datetime.timedelta:
+  step = TIMEOUT_STEP.total_seconds()
+  steps = math.ceil(stats["p99"] * TIMEOUT_MARGIN / step)
+  return datetime.timedelta(seconds=steps * step)
+
+
+def get_priority_args(benchmark_id: str) -> Dict[str, Any]:
+  """Get task arguments that start the longest tests first.
+
+  The priority weight is the median duration of the test in minutes, rounded
+  to a power of two, so that when tests wait for the same pool, the longest
+  ones start first and the whole DAG run finishes sooner.
+
+  Args:
+    benchmark_id: Benchmark ID of the test.
+
+  Returns:
+    A dict with `priority_weight` and `weight_rule` to use as default args of
+    the test's tasks, or an empty dict if the test has no history.
+  """
+  stats = _load_history().get(benchmark_id, {}).get("total")
+  if not stats:
+    return {}
+
+  minutes = max(1.0, stats["p50"] / 60)
+  return {
+      "priority_weight": 2 ** round(math.log2(minutes)),
+      "weight_rule": "absolute",
+  }
+
+
+def get_timeout(
+    task_test_config: test_config.TestConfig[test_config.Accelerator],
+) -> Optional[datetime.timedelta]:
+  """Get the timeout for running the model of a test.
+
+  Args:
+    task_test_config: Test config of the task.
+
+  Returns:
+    The timeout of `task_test_config` if it has one, or else the P99 duration
+    of the test's past runs plus a margin, rounded up to `TIMEOUT_STEP`, or
+    None if it has no history.
+  """
+  if task_test_config.timeout:
+    return task_test_config.timeout
+
+  history = _load_history().get(task_test_config.benchmark_id, {})
+  if "run_model" not in history:
+    return None
+  return _get_timeout_from_stats(history["run_model"])
@@ -0,0 +1,185 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for duration.py."""
+
+import datetime
+import json
+import os
+import tempfile
+from unittest import mock
+from absl.testing import absltest
+from dags.vm_resource import TpuVersion
+from xlml.apis import test_config
+from xlml.utils import duration
+import google.api_core.exceptions
+
+_HISTORY = {
+    "long-test": {
+        "total": {"p50": 3600.0, "p99": 4000.0, "count": 10},
+        "run_model": {"p50": 3000.0, "p99": 3360.0, "count": 10},
+    },
+}
+
+
+class DurationTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.history_file = os.path.join(
+        self.enter_context(tempfile.TemporaryDirectory()), "history.json"
+    )
+    self.enter_context(
+        mock.patch.dict(
+            os.environ, {duration.HISTORY_FILE_ENV_VAR: self.history_file}
+        )
+    )
+    self.enter_context(mock.patch.object(duration, "_history_source", None))
+
+  def _write_history(self, history):
+    with open(self.history_file, "w") as f:
+      json.dump(history, f)
+
+  def _get_test_config(self, test_name, timeout=None):
+    return test_config.TpuVmTest(
+        test_config.Tpu(version=TpuVersion.V4, cores=8),
+        test_name=test_name,
+        set_up_cmds=[],
+        run_model_cmds=[],
+        timeout=timeout,
+    )
+
+  def test_get_priority_args(self):
+    self._write_history(_HISTORY)
+
+    self.assertEqual(
+        duration.get_priority_args("long-test"),
+        {"priority_weight": 64, "weight_rule": "absolute"},
+    )
+    self.assertEmpty(duration.get_priority_args("new-test"))
+
+  def test_get_priority_args_without_history_file(self):
+    self.assertEmpty(duration.get_priority_args("long-test"))
+
+  def test_get_timeout(self):
+    self._write_history({"long-v4-8": _HISTORY["long-test"]})
+
+    # P99 of 56 minutes plus a 25% margin, rounded up to 15 minutes.
+    self.assertEqual(
+        duration.get_timeout(self._get_test_config("long")),
+        datetime.timedelta(minutes=75),
+    )
+    self.assertIsNone(duration.get_timeout(self._get_test_config("new")))
+
+  def test_get_timeout_from_config(self):
+    self._write_history({"long-v4-8": _HISTORY["long-test"]})
+    timeout = datetime.timedelta(minutes=30)
+
+    self.assertEqual(
+        duration.get_timeout(self._get_test_config("long", timeout)), timeout
+    )
+
+  def test_refresh_duration_history(self):
+    with mock.patch.object(
+        duration, "query_duration_history", return_value=_HISTORY
+    ) as query:
+      duration.refresh_duration_history.function([("project", "dataset")])
+
+    query.assert_called_once_with("project", "dataset", 30)
+    self.assertEqual(
+        duration.get_priority_args("long-test")["priority_weight"], 64
+    )
+
+  def test_refresh_duration_history_merges_datasets(self):
+    histories = {
+        "a": {"long-test": {"total": {"p50": 100.0, "p99": 200.0, "count": 1}}},
+        "b": {
+            "long-test": {
+                "total": {"p50": 400.0, "p99": 500.0, "count": 3},
+                "run_model": {"p50": 300.0, "p99": 400.0, "count": 3},
+            }
+        },
+    }
+
+    with mock.patch.object(
+        duration,
+        "query_duration_history",
+        side_effect=lambda project, dataset, days: histories[dataset],
+    ):
+      duration.refresh_duration_history.function(
+          [("project", "a"), ("project", "b")]
+      )
+
+    with open(self.history_file) as f:
+      history = json.load(f)
+    self.assertEqual(
+        history["long-test"],
+        {
+            "total": {"p50": 325.0, "p99": 500.0, "count": 4},
+            "run_model": {"p50": 300.0, "p99": 400.0, "count": 3},
+        },
+    )
+
+  def test_refresh_duration_history_keeps_small_changes(self):
+    self._write_history(_HISTORY)
+    slightly_slower = {"p50": 3700.0, "p99": 4100.0, "count": 12}
+    much_slower = {"p50": 6000.0, "p99": 7000.0, "count": 12}
+
+    with mock.patch.object(
+        duration,
+        "query_duration_history",
+        return_value={
+            "long-test": {
+                "total": slightly_slower,
+                "run_model": much_slower,
+            },
+        },
+    ):
+      duration.refresh_duration_history.function([("project", "dataset")])
+
+    with open(self.history_file) as f:
+      history = json.load(f)
+    self.assertEqual(
+        history["long-test"]["total"], _HISTORY["long-test"]["total"]
+    )
+    self.assertEqual(history["long-test"]["run_model"], much_slower)
+
+  def test_refresh_duration_history_skips_missing_dataset(self):
+    other_test = {"total": {"p50": 60.0, "p99": 90.0, "count": 5}}
+    self._write_history({**_HISTORY, "other-test": other_test})
+    histories = {
+        "a": {"other-test": {"total": {"p50": 600.0, "p99": 900.0, "count": 5}}}
+    }
+
+    def query(project, dataset, days):
+      if dataset not in histories:
+        raise google.api_core.exceptions.NotFound(f"{dataset} not found")
+      return histories[dataset]
+
+    with mock.patch.object(
+        duration, "query_duration_history", side_effect=query
+    ):
+      duration.refresh_duration_history.function(
+          [("project", "missing"), ("project", "a")]
+      )
+
+    with open(self.history_file) as f:
+      history = json.load(f)
+    # Tests that only the missing dataset had history for keep their stats.
+    self.assertEqual(history["long-test"], _HISTORY["long-test"])
+    self.assertEqual(history["other-test"]["total"]["p50"], 600.0)
+
+
+if __name__ == "__main__":
+  absltest.main()
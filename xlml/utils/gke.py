@@ -1,41 +1,112 @@
+from __future__ import annotations
+
 import base64
 import concurrent.futures
 import datetime
+import hashlib
 import logging
+import os
 import tempfile
-from typing import Any, Dict, Optional
+import threading
+from typing import Any, Dict, Optional, Tuple
 
 from airflow.decorators import task, task_group
-import google.auth
-import google.auth.transport.requests
-from google.cloud import container_v1
-import kubernetes
 
 from xlml.apis import gcp_config
+from xlml.utils import auth, lazy
+
+container_v1 = lazy.import_module('google.cloud.container_v1')
+kubernetes = lazy.import_module('kubernetes')
 
 """Utilities for GKE."""
 
 
+# Maximum number of connections kept alive to a single cluster's API server.
+# `run_job` streams logs from every pod concurrently over the same client.
+_CONNECTION_POOL_MAXSIZE = 32
+
+_lock = threading.Lock()
+_clients: Dict[Tuple[str, str, str], kubernetes.client.ApiClient] = {}
+
+
+def _reset() -> None:
+  """Drop all cached Kubernetes clients."""
+  with _lock:
+    _clients.clear()
+
+
+# Pooled connections must not be shared across `fork`.
+if hasattr(os, 'register_at_fork'):
+  os.register_at_fork(after_in_child=_reset)
+
+
+def _write_ca_cert(cluster_path: str, ca_cert: str) -> str:
+  """Write the cluster CA certificate to a stable per-cluster file.
+
+  Args:
+    cluster_path: Fully qualified name of the cluster.
+    ca_cert: Base64-encoded PEM CA certificate of the cluster.
+
+  Returns:
+    The path of the certificate file.
+  """
+  digest = hashlib.sha256(cluster_path.encode('utf-8')).hexdigest()[:16]
+  path = os.path.join(tempfile.gettempdir(), f'gke-ca-{digest}.crt')
+  # Write to a temporary file first so concurrent tasks never read a
+  # partially written certificate.
+  with tempfile.NamedTemporaryFile(
+      dir=os.path.dirname(path), delete=False
+  ) as f:
+    f.write(base64.b64decode(ca_cert))
+  os.replace(f.name, path)
+  return path
+
+
+def _refresh_api_key(configuration: kubernetes.client.Configuration) -> None:
+  # Called before every request. The token is only refreshed near expiry.
+  configuration.api_key['authorization'] = auth.get_access_token()
+
+
 def get_authenticated_client(
     project_name: str, region: str, cluster_name: str
 ) -> kubernetes.client.ApiClient:
-  container_client = container_v1.ClusterManagerClient()
-  cluster_path = (
-      f'projects/{project_name}/locations/{region}/clusters/{cluster_name}'
-  )
-  response = container_client.get_cluster(name=cluster_path)
-  creds, _ = google.auth.default()
-  auth_req = google.auth.transport.requests.Request()
-  creds.refresh(auth_req)
-  configuration = kubernetes.client.Configuration()
-  configuration.host = f'https://{response.endpoint}'
-  with tempfile.NamedTemporaryFile(delete=False) as ca_cert:
-    ca_cert.write(base64.b64decode(response.master_auth.cluster_ca_certificate))
-  configuration.ssl_ca_cert = ca_cert.name
-  configuration.api_key_prefix['authorization'] = 'Bearer'
-  configuration.api_key['authorization'] = creds.token
-
-  return kubernetes.client.ApiClient(configuration)
+  """Get a cached Kubernetes API client for a GKE cluster.
+
+  The client is created once per (project, region, cluster) in a process, and
+  its bearer token is renewed whenever the underlying credentials expire.
+
+  Args:
+    project_name: Project of the cluster.
+    region: Region or zone of the cluster.
+    cluster_name: Name of the cluster.
+
+  Returns:
+    An authenticated client that reuses pooled connections to the cluster.
+  """
+  key = (project_name, region, cluster_name)
+  with _lock:
+    if key in _clients:
+      return _clients[key]
+
+    container_client = auth.get_client(container_v1.ClusterManagerClient)
+    cluster_path = (
+        f'projects/{project_name}/locations/{region}/clusters/{cluster_name}'
+    )
+    response = container_client.get_cluster(name=cluster_path)
+    configuration = kubernetes.client.Configuration()
+    configuration.host = f'https://{response.endpoint}'
+    configuration.ssl_ca_cert = _write_ca_cert(
+        cluster_path, response.master_auth.cluster_ca_certificate
+    )
+    # `auth_settings` only sends the header, and calls the refresh hook, if a
+    # key is already set.
+    configuration.api_key['authorization'] = auth.get_access_token()
+    configuration.api_key_prefix['authorization'] = 'Bearer'
+    configuration.refresh_api_key_hook = _refresh_api_key
+    configuration.connection_pool_maxsize = _CONNECTION_POOL_MAXSIZE
+
+    _clients[key] = kubernetes.client.ApiClient(configuration)
+    return _clients[key]
 
 
 @task_group
@@ -0,0 +1,76 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for gke.py."""
+
+import base64
+import types
+from unittest import mock
+from absl.testing import absltest
+from xlml.utils import auth, gke
+
+
+class GetAuthenticatedClientTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    gke._reset()
+    self.addCleanup(gke._reset)
+    get_client = self.enter_context(mock.patch.object(auth, "get_client"))
+    get_client.return_value.get_cluster.return_value = types.SimpleNamespace(
+        endpoint="1.2.3.4",
+        master_auth=types.SimpleNamespace(
+            cluster_ca_certificate=base64.b64encode(b"cert").decode()
+        ),
+    )
+    self.get_access_token = self.enter_context(
+        mock.patch.object(auth, "get_access_token", return_value="token-1")
+    )
+
+  def _get_headers(self, client):
+    headers = {}
+    client.update_params_for_auth(
+        headers, [], ["BearerToken"], "/api/v1/pods", "GET", None
+    )
+    return headers
+
+  def test_sends_bearer_token(self):
+    client = gke.get_authenticated_client("project", "region", "cluster")
+
+    self.assertEqual(client.configuration.host, "https://1.2.3.4")
+    self.assertEqual(
+        self._get_headers(client), {"authorization": "Bearer token-1"}
+    )
+
+  def test_refreshes_token_per_request(self):
+    client = gke.get_authenticated_client("project", "region", "cluster")
+    self.get_access_token.return_value = "token-2"
+
+    self.assertEqual(
+        self._get_headers(client), {"authorization": "Bearer token-2"}
+    )
+
+  def test_caches_client_per_cluster(self):
+    client = gke.get_authenticated_client("project", "region", "cluster")
+
+    self.assertIs(
+        gke.get_authenticated_client("project", "region", "cluster"), client
+    )
+    self.assertIsNot(
+        gke.get_authenticated_client("project", "region", "other"), client
+    )
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -21,16 +21,16 @@ from absl import logging
 import airflow
 from airflow.decorators import task, task_group
 import datetime
-import fabric
-from google.cloud import compute_v1
-import io
-import paramiko
 import re
-import time
 from typing import Dict, Iterable
 import uuid
 from xlml.apis import gcp_config, test_config
-from xlml.utils import ssh
+from xlml.utils import auth, lazy, probe, ssh, staging
+
+compute_v1 = lazy.import_module("google.cloud.compute_v1")
+
+# How long a new GPU VM may take before its SSH server accepts connections.
+SSH_READY_TIMEOUT = datetime.timedelta(minutes=10)
 
 
 def get_image_from_family(project: str, family: str) -> compute_v1.Image:
@@ -44,7 +44,7 @@ def get_image_from_family(project: str, family: str) -> compute_v1.Image:
   Returns:
     An Image object.
   """
-  image_client = compute_v1.ImagesClient()
+  image_client = auth.get_client(compute_v1.ImagesClient)
   # List of public operating system (OS) images:
   # https://cloud.google.com/compute/docs/images/os-details
   newest_image = image_client.get_from_family(project=project, family=family)
@@ -188,7 +188,7 @@ def create_resource(
         scopes=["https://www.googleapis.com/auth/cloud-platform"]
     )
 
-    instance_client = compute_v1.InstancesClient()
+    instance_client = auth.get_client(compute_v1.InstancesClient)
     network_link = "global/networks/default"
     # Use the network interface provided in the network_link argument.
     network_interface = compute_v1.NetworkInterface()
@@ -254,7 +254,7 @@ def create_resource(
   )
   def wait_for_resource_creation(operation_name: airflow.XComArg):
     # Retrives the delete opeartion to check the status.
-    client = compute_v1.ZoneOperationsClient()
+    client = auth.get_client(compute_v1.ZoneOperationsClient)
     request = compute_v1.GetZoneOperationRequest(
         operation=operation_name,
         project=project_id,
@@ -287,11 +287,7 @@ def create_resource(
 
   @task
   def get_ip_address(instance: str) -> airflow.XComArg:
-    # It takes time to be able to use the ssh with the ip address
-    # even though the creation request is complete. We intentionally
-    # sleep for 60s to wait for the ip address to be accessible.
-    time.sleep(60)
-    instance_client = compute_v1.InstancesClient()
+    instance_client = auth.get_client(compute_v1.InstancesClient)
     instance = instance_client.get(
         project=project_id, zone=zone, instance=instance
     )
@@ -299,7 +295,15 @@ def create_resource(
       logging.warning(
           f"GPU instance {gpu_name} has more than one network interface."
       )
-    return instance.network_interfaces[0].network_i_p
+    ip_address = instance.network_interfaces[0].network_i_p
+    # It takes time to be able to use the ssh with the ip address
+    # even though the creation request is complete.
+    probe.wait_until(
+        lambda: probe.is_ssh_ready(ip_address),
+        SSH_READY_TIMEOUT,
+        f"SSH on {gpu_name}",
+    )
+    return ip_address
 
   operation = create_resource_request(
       instance_name=gpu_name,
@@ -318,6 +322,7 @@ def ssh_host(
     cmds: Iterable[str],
     ssh_keys: ssh.SshKeys,
     env: Dict[str, str] = None,
+    staged_files: Iterable[staging.StagedFile] = (),
 ) -> None:
   """SSH GPU and run commands in multi process.
 
@@ -326,20 +331,16 @@ def ssh_host(
    cmds: The commands to run on a GPU.
    ssh_keys: The SSH key pair to use for authentication.
    env: environment variables to be pass to the ssh runner session using dict.
+   staged_files: Files from `staging.stage` to copy to the home directory of
+     the host before running the commands.
   """
-  pkey = paramiko.RSAKey.from_private_key(io.StringIO(ssh_keys.private))
   logging.info(f"Connecting to IP addresses {ip_address}")
 
-  ssh_group = fabric.ThreadingGroup(
-      ip_address,
-      user="cloud-ml-auto-solutions",
-      connect_kwargs={
-          "auth_strategy": paramiko.auth_strategy.InMemoryPrivateKey(
-              "cloud-ml-auto-solutions", pkey
-          )
-      },
+  connections = ssh.get_connections(
+      [ip_address], "cloud-ml-auto-solutions", ssh_keys
   )
-  ssh_group.run(cmds, env=env)
+  staging.put(connections, list(staged_files))
+  ssh.run_and_check(connections, cmds, env=env)
 
 
 @task_group
@@ -348,7 +349,7 @@ def delete_resource(instance_name: airflow.XComArg, project_id: str, zone: str):
   def delete_resource_request(
       instance_name: str, project_id: str, zone: str
   ) -> airflow.XComArg:
-    client = compute_v1.InstancesClient()
+    client = auth.get_client(compute_v1.InstancesClient)
     request = compute_v1.DeleteInstanceRequest(
         instance=instance_name,
         project=project_id,
@@ -361,7 +362,7 @@ def delete_resource(instance_name: airflow.XComArg, project_id: str, zone: str):
   @task.sensor(poke_interval=60, timeout=1800, mode="reschedule")
   def wait_for_resource_deletion(operation_name: airflow.XComArg):
     # Retrives the delete opeartion to check the status.
-    client = compute_v1.ZoneOperationsClient()
+    client = auth.get_client(compute_v1.ZoneOperationsClient)
     request = compute_v1.GetZoneOperationRequest(
         operation=operation_name,
         project=project_id,
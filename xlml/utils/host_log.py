@@ -0,0 +1,183 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Utilities to capture the output of commands on many hosts.
+
+The full output of every host is written to a compressed local file, which
+`archive` uploads to GCS with an index of the hosts. Only one host's output
+is streamed to the Airflow log, together with lines of the other hosts that
+look like errors, so that the task log stays small on large slices.
+"""
+
+import collections
+import functools
+import gzip
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, List, Sequence
+
+from absl import logging
+from airflow.operators.python import get_current_context
+from dags import gcs_bucket
+from xlml.utils import auth, lazy
+
+fabric = lazy.import_module("fabric")
+storage = lazy.import_module("google.cloud.storage")
+
+
+LOG_DIR = os.path.join(gcs_bucket.BASE_OUTPUT_DIR, "ssh_logs")
+INDEX_FILE = "index.json"
+
+# Last lines of each host to keep for the Airflow log.
+TAIL_LINES = 50
+
+ERROR_PATTERN = re.compile(
+    r"error|exception|traceback|fatal|killed|out of memory", re.IGNORECASE
+)
+
+# Most error lines of one host to log, so a crash loop can't flood the log.
+MAX_ERROR_LINES = 20
+
+
+class HostLog:
+  """File-like sink for the stdout and stderr of one host.
+
+  Attributes:
+    host: Host that the output comes from.
+    path: Local path of the compressed full output.
+    tail: The last `TAIL_LINES` lines of output.
+  """
+
+  def __init__(self, host: str, path: str, live: bool = False):
+    """Initialize the log.
+
+    Args:
+      host: Host that the output comes from.
+      path: Local path to write the compressed full output to.
+      live: Whether to stream every line to the Airflow log, rather than only
+        lines that match `ERROR_PATTERN`.
+    """
+    self.host = host
+    self.path = path
+    self.live = live
+    self.tail = collections.deque(maxlen=TAIL_LINES)
+    self._num_errors = 0
+    self._partial = ""
+    # Stdout and stderr are written from separate threads.
+    self._lock = threading.Lock()
+    self._file = gzip.open(path, "wt")
+
+  def write(self, data: str) -> int:
+    with self._lock:
+      self._file.write(data)
+      lines = (self._partial + data).split("\n")
+      self._partial = lines.pop()
+      for line in lines:
+        self._add_line(line)
+    return len(data)
+
+  def flush(self) -> None:
+    pass
+
+  def close(self) -> None:
+    with self._lock:
+      if self._partial:
+        self._add_line(self._partial)
+        self._partial = ""
+      self._file.close()
+
+  def _add_line(self, line: str) -> None:
+    self.tail.append(line)
+    if self.live:
+      logging.info(f"[{self.host}] {line}")
+    elif ERROR_PATTERN.search(line) and self._num_errors < MAX_ERROR_LINES:
+      self._num_errors += 1
+      logging.warning(f"[{self.host}] {line}")
+
+
+@functools.cache
+def get_runner_class() -> type:
+  """Get a fabric runner that doesn't keep the output of commands in memory.
+
+  The default runner also collects all output for `Result.stdout`, which grows
+  without bound for long runs. With this runner, output only goes to the
+  `out_stream` and `err_stream` of the command, and results have no output.
+  """
+
+  class Remote(fabric.runners.Remote):
+
+    def _handle_output(self, buffer_, hide, output, reader):
+      for data in self.read_proc_output(reader):
+        if not hide:
+          self.write_our_output(stream=output, string=data)
+
+  return Remote
+
+
+def get_gcs_log_dir() -> str:
+  """Get the GCS folder for the host logs of the current task try."""
+  context = get_current_context()
+  ti = context["ti"]
+  return os.path.join(
+      LOG_DIR,
+      context["dag_run"].dag_id,
+      context["run_id"],
+      ti.task_id,
+      str(ti.map_index),
+      f"try_{ti.try_number}",
+  )
+
+
+def archive(
+    local_dir: str, gcs_dir: str, index: Sequence[Dict[str, Any]]
+) -> None:
+  """Upload host logs and their index to GCS.
+
+  Failing to upload is logged rather than raised, so that it never fails the
+  commands that the logs are from.
+
+  Args:
+    local_dir: Local directory of the host logs.
+    gcs_dir: GCS folder to upload to.
+    index: An entry for each host, e.g. its exit code and log file.
+  """
+  with open(os.path.join(local_dir, INDEX_FILE), "w") as f:
+    json.dump(list(index), f, indent=2)
+
+  # Importing a submodule would import `google.cloud.storage` on DAG parse.
+  from google.cloud.storage import transfer_manager
+
+  filenames = sorted(os.listdir(local_dir))
+  bucket_name, _, prefix = gcs_dir.removeprefix("gs://").partition("/")
+  try:
+    bucket = auth.get_client(storage.Client).bucket(bucket_name)
+    transfer_manager.upload_many_from_filenames(
+        bucket,
+        filenames,
+        source_directory=local_dir,
+        blob_name_prefix=f"{prefix.rstrip('/')}/",
+        worker_type=transfer_manager.THREAD,
+        raise_exception=True,
+    )
+  except Exception as e:
+    logging.warning(f"Unable to upload host logs to {gcs_dir}: {e}")
+    return
+  logging.info(f"Uploaded logs of {len(index)} hosts to {gcs_dir}.")
+
+
+def format_tail(host: str, tail: List[str]) -> str:
+  """Format the last lines of a host's output for the Airflow log."""
+  return "\n".join((f"Last {len(tail)} lines of {host}:", *tail))
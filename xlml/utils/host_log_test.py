@@ -0,0 +1,113 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for host_log.py."""
+
+import gzip
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+from absl import logging
+from absl.testing import absltest
+from google.cloud.storage import transfer_manager
+from xlml.utils import host_log
+
+
+class HostLogTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.path = os.path.join(
+        self.enter_context(tempfile.TemporaryDirectory()), "w1.log.gz"
+    )
+
+  @mock.patch.object(host_log, "TAIL_LINES", 2)
+  def test_write(self):
+    log = host_log.HostLog("w1", self.path)
+
+    with mock.patch.object(logging, "warning") as warning:
+      log.write("step 1\nstep ")
+      log.write("2\nRuntimeError: boom\nstep 3")
+      log.close()
+
+    self.assertEqual(list(log.tail), ["RuntimeError: boom", "step 3"])
+    warning.assert_called_once_with("[w1] RuntimeError: boom")
+    with gzip.open(self.path, "rt") as f:
+      self.assertEqual(f.read(), "step 1\nstep 2\nRuntimeError: boom\nstep 3")
+
+  def test_write_live(self):
+    log = host_log.HostLog("w0", self.path, live=True)
+
+    with mock.patch.object(logging, "info") as info:
+      log.write("step 1\nstep 2\n")
+      log.close()
+
+    self.assertEqual(
+        info.call_args_list,
+        [mock.call("[w0] step 1"), mock.call("[w0] step 2")],
+    )
+
+  @mock.patch.object(host_log, "MAX_ERROR_LINES", 1)
+  def test_write_limits_error_lines(self):
+    log = host_log.HostLog("w1", self.path)
+
+    with mock.patch.object(logging, "warning") as warning:
+      log.write("Error 1\nError 2\n")
+      log.close()
+
+    warning.assert_called_once_with("[w1] Error 1")
+
+  def test_runner_does_not_keep_output(self):
+    runner = host_log.get_runner_class()(context=mock.MagicMock())
+    runner.read_proc_output = lambda _: iter(["a\n", "b\n"])
+    buffer_, output = [], io.StringIO()
+
+    runner._handle_output(buffer_, False, output, None)
+
+    self.assertEqual(buffer_, [])
+    self.assertEqual(output.getvalue(), "a\nb\n")
+
+  @mock.patch.object(transfer_manager, "upload_many_from_filenames")
+  @mock.patch.object(host_log.auth, "get_client")
+  def test_archive(self, get_client, upload_many_from_filenames):
+    local_dir = self.enter_context(tempfile.TemporaryDirectory())
+    with open(os.path.join(local_dir, "0000-w0.log.gz"), "w") as f:
+      f.write("log")
+    index = [{"host": "w0", "exit_code": 0, "log_file": "0000-w0.log.gz"}]
+
+    host_log.archive(local_dir, "gs://bucket/logs/", index)
+
+    get_client.return_value.bucket.assert_called_once_with("bucket")
+    args, kwargs = upload_many_from_filenames.call_args
+    self.assertEqual(args[1], ["0000-w0.log.gz", host_log.INDEX_FILE])
+    self.assertEqual(kwargs["blob_name_prefix"], "logs/")
+    with open(os.path.join(local_dir, host_log.INDEX_FILE)) as f:
+      self.assertEqual(json.load(f), index)
+
+  @mock.patch.object(
+      transfer_manager, "upload_many_from_filenames", side_effect=RuntimeError
+  )
+  @mock.patch.object(host_log.auth, "get_client")
+  def test_archive_ignores_upload_failure(self, *_):
+    host_log.archive(
+        self.enter_context(tempfile.TemporaryDirectory()),
+        "gs://bucket/logs",
+        [],
+    )
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -0,0 +1,57 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Utility to defer heavy imports until first use.
+
+Every DAG file imports `xlml.apis.task`, so anything imported at module level
+in `xlml` is paid for by the scheduler on every parse loop. Client libraries
+that are only needed inside task callables should be imported with
+`import_module` instead.
+"""
+
+import importlib.util
+import sys
+import types
+
+
+def import_module(name: str) -> types.ModuleType:
+  """Import a module lazily.
+
+  The module is registered in `sys.modules` right away, but its code only runs
+  on first attribute access. Parent packages of `name` are imported eagerly,
+  so prefer top-level or lightweight parent packages.
+
+  Args:
+    name: Fully qualified module name, e.g. `google.cloud.tpu_v2alpha1`.
+
+  Returns:
+    A module object that loads itself on first attribute access.
+  """
+  if name in sys.modules:
+    return sys.modules[name]
+
+  spec = importlib.util.find_spec(name)
+  if spec is None:
+    raise ModuleNotFoundError(f'No module named {name!r}', name=name)
+
+  loader = importlib.util.LazyLoader(spec.loader)
+  spec.loader = loader
+  module = importlib.util.module_from_spec(spec)
+  sys.modules[name] = module
+  loader.exec_module(module)
+
+  parent, _, child = name.rpartition('.')
+  if parent:
+    setattr(sys.modules[parent], child, module)
+  return module
@@ -0,0 +1,387 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Utilities to reuse TPUs that are already set up across tests.
+
+A test checks out an idle TPU with the same accelerator, runtime version and
+setup script, or provisions a new one, and checks it back in when it is done.
+Checked in TPUs stay idle until another test checks them out or their TTL
+runs out, after which `evict_expired_leases` deletes them.
+
+Leases are kept in an Airflow Variable that is locked while it is updated, so
+that tests on different workers never check out the same TPU. SSH keys are not
+kept in leases. Instead, a checked out TPU is given the SSH keys of the test
+that checks it out.
+"""
+
+import contextlib
+import datetime
+import hashlib
+import json
+import time
+from typing import Any, Dict, Iterator, Optional
+
+from absl import logging
+from airflow.decorators import task
+from airflow.models import Variable
+from airflow.operators.python import get_current_context
+from airflow.utils.session import create_session
+from airflow.utils.sqlalchemy import with_row_locks
+from airflow.utils.state import State
+from xlml.apis import gcp_config, test_config
+from xlml.utils import auth, lazy, metric, probe, ssh, tpu
+import google.api_core.exceptions
+
+tpu_api = lazy.import_module("google.cloud.tpu_v2alpha1")
+field_mask_pb2 = lazy.import_module("google.protobuf.field_mask_pb2")
+
+
+LEASE_VARIABLE = "tpu_leases"
+
+# Most idle TPUs to keep for the same lease key.
+MAX_IDLE_PER_KEY = 2
+
+# Extra time that the TTL label gives a TPU over its lease, so that the
+# `clean_up` DAG only deletes TPUs that leases have lost track of.
+TTL_LABEL_BUFFER = datetime.timedelta(hours=1)
+
+# How long a checked out TPU may take to accept the new SSH keys.
+SSH_KEYS_TIMEOUT = datetime.timedelta(minutes=5)
+
+IDLE = "idle"
+LEASED = "leased"
+
+
+def get_lease_key(
+    gcp: gcp_config.GCPConfig,
+    task_test_config: test_config.TestConfig[test_config.Tpu],
+) -> str:
+  """Get the key of the TPUs that a test can reuse.
+
+  Args:
+    gcp: GCP project/zone configuration of the test.
+    task_test_config: Test config of the test.
+
+  Returns:
+    A key that is the same for tests with the same TPU and setup script.
+  """
+  accelerator = task_test_config.accelerator
+  setup_hash = hashlib.sha256(
+      (task_test_config.setup_script or "").encode()
+  ).hexdigest()[:16]
+  return "/".join((
+      gcp.project_name,
+      gcp.zone,
+      accelerator.name,
+      str(accelerator.runtime_version),
+      accelerator.network,
+      accelerator.subnetwork,
+      "reserved" if accelerator.reserved else "on-demand",
+      setup_hash,
+  ))
+
+
+@contextlib.contextmanager
+def _locked_leases() -> Iterator[Dict[str, Dict[str, Any]]]:
+  """Lock the leases and yield them, saving any changes on exit."""
+  with create_session() as session:
+    query = session.query(Variable).filter(Variable.key == LEASE_VARIABLE)
+    variable = with_row_locks(query, session=session).one_or_none()
+    if variable is None:
+      variable = Variable(key=LEASE_VARIABLE, val="{}")
+      session.add(variable)
+
+    leases = json.loads(variable.val)
+    # Drop the private SSH keys that older leases kept.
+    for lease in leases.values():
+      lease.pop("ssh_keys", None)
+    yield leases
+    variable.val = json.dumps(leases)
+
+
+def _get_holder() -> str:
+  """Get a name for the test of the current task."""
+  context = get_current_context()
+  test_group = context["task"].task_group.parent_group
+  return "/".join((
+      context["dag_run"].dag_id,
+      context["run_id"],
+      test_group.group_id or "",
+      str(context["ti"].map_index),
+  ))
+
+
+def _update_nodes(
+    client,
+    qualified_name: str,
+    ttl: datetime.timedelta,
+    ssh_keys: Optional[ssh.SshKeys] = None,
+) -> None:
+  """Set the TTL label of the TPU nodes so they live for `ttl` from now.
+
+  If `ssh_keys` is set, they replace the SSH keys of the nodes, so that only the
+  new holder of the TPU can connect to it.
+  """
+  qr = client.get_queued_resource(name=qualified_name)
+  if qr.state.state != tpu_api.QueuedResourceState.State.ACTIVE:
+    raise RuntimeError(f"{qualified_name} is {qr.state.state.name}")
+
+  now = datetime.datetime.now(datetime.timezone.utc)
+  for node_spec in qr.tpu.node_spec:
+    node = client.get_node(name=f"{node_spec.parent}/nodes/{node_spec.node_id}")
+    if node.state != tpu_api.Node.State.READY:
+      raise RuntimeError(f"{node.name} is {node.state.name}")
+
+    age = now - node.create_time
+    labels = dict(node.labels)
+    labels[tpu.TTL] = str(int((age + ttl).total_seconds()))
+    update = tpu_api.Node(name=node.name, labels=labels)
+    paths = ["labels"]
+    if ssh_keys:
+      metadata = dict(node.metadata)
+      metadata["ssh-keys"] = f"ml-auto-solutions:{ssh_keys.public}"
+      update.metadata = metadata
+      paths.append("metadata")
+    client.update_node(
+        node=update,
+        update_mask=field_mask_pb2.FieldMask(paths=paths),
+    ).result()
+
+
+def _accepts_ssh_keys(qualified_name: str, ssh_keys: ssh.SshKeys) -> bool:
+  """Whether every worker of a TPU accepts `ssh_keys`."""
+  try:
+    tpu.ssh_tpu.function(qualified_name, "true", ssh_keys, True)
+  except Exception as e:
+    logging.info(f"{qualified_name} doesn't accept the SSH keys yet: {e}")
+    return False
+  return True
+
+
+@task(multiple_outputs=True)
+def check_out(
+    key: str,
+    tpu_name: str,
+    ssh_keys: ssh.SshKeys,
+    gcp: gcp_config.GCPConfig,
+    timeout: datetime.timedelta,
+) -> Dict[str, Any]:
+  """Check out an idle TPU, or lease a new one for the test to provision.
+
+  Args:
+    key: Lease key of the test from `get_lease_key`.
+    tpu_name: Name of the TPU to provision if none is idle.
+    ssh_keys: SSH keys of the test, which the TPU is given.
+    gcp: GCP project/zone configuration of the test.
+    timeout: How long the test may hold the TPU before it's checked in.
+
+  Returns:
+    A dict with the `qualified_name` of the queued resource, the `ssh_keys` to
+    connect to it, and whether it is `reused` and already set up.
+  """
+  client = auth.get_client(tpu_api.TpuClient)
+  holder = _get_holder()
+
+  while True:
+    with _locked_leases() as leases:
+      idle = [
+          name
+          for name, lease in leases.items()
+          if lease["key"] == key
+          and lease["state"] == IDLE
+          and lease["expires_at"] > time.time()
+      ]
+      if not idle:
+        qualified_name = (
+            f"projects/{gcp.project_name}/locations/{gcp.zone}/"
+            f"queuedResources/{tpu_name}"
+        )
+        leases[qualified_name] = {
+            "key": key,
+            "state": LEASED,
+            "holder": holder,
+            "leased_at": time.time(),
+        }
+        logging.info(f"No idle TPU for {key}, leasing {qualified_name}.")
+        return {
+            "qualified_name": qualified_name,
+            "ssh_keys": ssh_keys,
+            "reused": False,
+        }
+
+      qualified_name = idle[0]
+      lease = leases[qualified_name]
+      lease.update(
+          state=LEASED, holder=holder, leased_at=time.time(), expires_at=None
+      )
+
+    try:
+      _update_nodes(
+          client, qualified_name, timeout + TTL_LABEL_BUFFER, ssh_keys
+      )
+      probe.wait_until(
+          lambda: _accepts_ssh_keys(qualified_name, ssh_keys),
+          SSH_KEYS_TIMEOUT,
+          f"SSH keys of {qualified_name}",
+      )
+    except (
+        google.api_core.exceptions.GoogleAPIError,
+        RuntimeError,
+        TimeoutError,
+    ) as e:
+      logging.warning(f"Can't reuse {qualified_name}, evicting it: {e}")
+      with _locked_leases() as leases:
+        leases.pop(qualified_name, None)
+      continue
+
+    logging.info(f"Checked out {qualified_name} for {holder}.")
+    return {
+        "qualified_name": qualified_name,
+        "ssh_keys": ssh_keys,
+        "reused": True,
+    }
+
+
+@task.short_circuit(ignore_downstream_trigger_rules=False)
+def should_provision(reused: bool) -> bool:
+  """Skip provisioning and setup if the test reuses a TPU."""
+  return not reused
+
+
+def _test_succeeded() -> bool:
+  """Whether no task of the current test has failed so far."""
+  context = get_current_context()
+  test_group = context["task"].task_group.parent_group
+  prefix = f"{test_group.group_id}." if test_group.group_id else ""
+  failed = [
+      task_id
+      for task_id, state in metric.get_task_states().items()
+      if task_id.startswith(prefix) and state in State.failed_states
+  ]
+  if failed:
+    logging.info(f"Tasks {failed} failed.")
+  return not failed
+
+
+def _reset(qualified_name: str, ssh_keys: ssh.SshKeys) -> None:
+  """Stop leftover processes of the last test on every worker of a TPU."""
+  tpu.ssh_tpu.function(qualified_name, tpu.RESET_SCRIPT, ssh_keys, True)
+
+
+@task(trigger_rule="all_done")
+def check_in(
+    qualified_name: Optional[str],
+    ssh_keys: Optional[ssh.SshKeys],
+    idle_ttl: datetime.timedelta,
+) -> Optional[str]:
+  """Reset a TPU and check it in, unless it has to be deleted.
+
+  A TPU is deleted if the test failed, it can't be reset, or enough TPUs with
+  the same lease key are already idle.
+
+  Args:
+    qualified_name: Qualified name of the queued resource from `check_out`.
+    ssh_keys: SSH keys of the queued resource from `check_out`.
+    idle_ttl: How long the TPU may stay idle before it's deleted.
+
+  Returns:
+    The qualified name of the queued resource to delete, or None if it was
+    checked in.
+  """
+  if not qualified_name:
+    logging.info("No TPU was checked out.")
+    return None
+
+  try:
+    if not _test_succeeded():
+      raise RuntimeError("the test failed")
+
+    _reset(qualified_name, ssh_keys)
+    client = auth.get_client(tpu_api.TpuClient)
+    _update_nodes(client, qualified_name, idle_ttl + TTL_LABEL_BUFFER)
+
+    with _locked_leases() as leases:
+      lease = leases.get(qualified_name)
+      if not lease:
+        raise RuntimeError("its lease was evicted")
+      num_idle = sum(
+          1
+          for other in leases.values()
+          if other["key"] == lease["key"] and other["state"] == IDLE
+      )
+      if num_idle >= MAX_IDLE_PER_KEY:
+        raise RuntimeError(f"{num_idle} TPUs are already idle")
+      lease.update(
+          state=IDLE,
+          holder=None,
+          expires_at=time.time() + idle_ttl.total_seconds(),
+      )
+  except Exception as e:
+    logging.info(f"Deleting {qualified_name}, since {e}.")
+    with _locked_leases() as leases:
+      leases.pop(qualified_name, None)
+    return qualified_name
+
+  logging.info(f"Checked in {qualified_name} for {idle_ttl}.")
+  return None
+
+
+@task
+def evict_expired_leases() -> None:
+  """Delete idle TPUs whose TTL ran out and forget leases of deleted TPUs.
+
+  Only the TPU nodes are deleted here. The suspended queued resources that are
+  left behind are deleted by `tpu.clean_up_idle_queued_resources`.
+  """
+  client = auth.get_client(tpu_api.TpuClient)
+
+  with _locked_leases() as leases:
+    expired = [
+        name
+        for name, lease in leases.items()
+        if lease["state"] == IDLE and lease["expires_at"] <= time.time()
+    ]
+    for name in expired:
+      del leases[name]
+    # Give new leases time to create their queued resource.
+    leased = [
+        name
+        for name, lease in leases.items()
+        if lease["state"] == LEASED
+        and lease["leased_at"] + TTL_LABEL_BUFFER.total_seconds() <= time.time()
+    ]
+
+  for name in expired:
+    logging.info(f"Evicting idle TPU {name}.")
+    try:
+      qr = client.get_queued_resource(name=name)
+    except google.api_core.exceptions.NotFound:
+      continue
+    for node_spec in qr.tpu.node_spec:
+      try:
+        client.delete_node(name=f"{node_spec.parent}/nodes/{node_spec.node_id}")
+      except google.api_core.exceptions.NotFound:
+        logging.info(f"{node_spec.node_id} is already deleted")
+
+  gone = []
+  for name in leased:
+    try:
+      client.get_queued_resource(name=name)
+    except google.api_core.exceptions.NotFound:
+      gone.append(name)
+  if gone:
+    logging.info(f"Forgetting leases of deleted TPUs {gone}.")
+    with _locked_leases() as leases:
+      for name in gone:
+        leases.pop(name, None)
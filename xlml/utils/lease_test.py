@@ -0,0 +1,238 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for lease.py."""
+
+import contextlib
+import datetime
+import json
+import time
+from unittest import mock
+from absl.testing import absltest
+from dags.vm_resource import TpuVersion
+from xlml.apis import gcp_config, metric_config, test_config
+from xlml.utils import lease, ssh
+
+_GCP = gcp_config.GCPConfig(
+    project_name="project",
+    zone="zone",
+    dataset_name=metric_config.DatasetOption.XLML_DATASET,
+)
+_KEYS = ssh.SshKeys(private="private", public="public")
+_QR = "projects/project/locations/zone/queuedResources/{}"
+
+# Unpatched, since tests replace it with an in-memory dict.
+_locked_leases = lease._locked_leases
+
+
+def _make_test(setup_cmds):
+  return test_config.TpuVmTest(
+      test_config.Tpu(version=TpuVersion.V4, cores=8),
+      test_name="test",
+      set_up_cmds=setup_cmds,
+      run_model_cmds=["train"],
+  )
+
+
+class LeaseTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.leases = {}
+
+    @contextlib.contextmanager
+    def locked_leases():
+      yield self.leases
+
+    self.enter_context(
+        mock.patch.object(lease, "_locked_leases", locked_leases)
+    )
+    self.enter_context(
+        mock.patch.object(lease, "_get_holder", return_value="holder")
+    )
+    self.enter_context(mock.patch.object(lease.auth, "get_client"))
+    self.update_nodes = self.enter_context(
+        mock.patch.object(lease, "_update_nodes")
+    )
+    self.accepts_ssh_keys = self.enter_context(
+        mock.patch.object(lease, "_accepts_ssh_keys", return_value=True)
+    )
+
+  def _add_lease(self, name, state, expires_in=60, key="key"):
+    self.leases[_QR.format(name)] = {
+        "key": key,
+        "state": state,
+        "holder": None,
+        "leased_at": time.time(),
+        "expires_at": time.time() + expires_in,
+    }
+
+  def test_get_lease_key(self):
+    key = lease.get_lease_key(_GCP, _make_test(["pip install a"]))
+
+    self.assertEqual(
+        key, lease.get_lease_key(_GCP, _make_test(["pip install a"]))
+    )
+    self.assertNotEqual(
+        key, lease.get_lease_key(_GCP, _make_test(["pip install b"]))
+    )
+
+  def test_check_out_without_idle_tpu(self):
+    self._add_lease("leased", lease.LEASED)
+    self._add_lease("expired", lease.IDLE, expires_in=-1)
+    self._add_lease("other", lease.IDLE, key="other")
+
+    checked_out = lease.check_out.function(
+        "key", "new", _KEYS, _GCP, datetime.timedelta(hours=1)
+    )
+
+    self.assertEqual(
+        checked_out,
+        {
+            "qualified_name": _QR.format("new"),
+            "ssh_keys": _KEYS,
+            "reused": False,
+        },
+    )
+    self.assertEqual(self.leases[_QR.format("new")]["state"], lease.LEASED)
+    self.assertNotIn("ssh_keys", self.leases[_QR.format("new")])
+    self.update_nodes.assert_not_called()
+
+  def test_check_out_idle_tpu(self):
+    self._add_lease("idle", lease.IDLE)
+
+    checked_out = lease.check_out.function(
+        "key", "new", _KEYS, _GCP, datetime.timedelta(hours=1)
+    )
+
+    # The TPU is given the SSH keys of the new test.
+    self.assertEqual(
+        checked_out,
+        {
+            "qualified_name": _QR.format("idle"),
+            "ssh_keys": _KEYS,
+            "reused": True,
+        },
+    )
+    self.update_nodes.assert_called_once_with(
+        mock.ANY,
+        _QR.format("idle"),
+        datetime.timedelta(hours=1) + lease.TTL_LABEL_BUFFER,
+        _KEYS,
+    )
+    self.accepts_ssh_keys.assert_called_with(_QR.format("idle"), _KEYS)
+    self.assertEqual(self.leases[_QR.format("idle")]["state"], lease.LEASED)
+    self.assertNotIn(_QR.format("new"), self.leases)
+
+  def test_check_out_evicts_broken_tpu(self):
+    self._add_lease("broken", lease.IDLE)
+    self.update_nodes.side_effect = RuntimeError("broken is DELETING")
+
+    checked_out = lease.check_out.function(
+        "key", "new", _KEYS, _GCP, datetime.timedelta(hours=1)
+    )
+
+    self.assertEqual(checked_out["qualified_name"], _QR.format("new"))
+    self.assertNotIn(_QR.format("broken"), self.leases)
+
+  @mock.patch.object(lease, "SSH_KEYS_TIMEOUT", datetime.timedelta(0))
+  def test_check_out_evicts_tpu_without_new_keys(self):
+    self._add_lease("stale", lease.IDLE)
+    self.accepts_ssh_keys.return_value = False
+
+    checked_out = lease.check_out.function(
+        "key", "new", _KEYS, _GCP, datetime.timedelta(hours=1)
+    )
+
+    self.assertEqual(checked_out["qualified_name"], _QR.format("new"))
+    self.assertNotIn(_QR.format("stale"), self.leases)
+
+  def test_locked_leases_drops_ssh_keys(self):
+    self.leases[_QR.format("old")] = {
+        "key": "key",
+        "state": lease.IDLE,
+        "ssh_keys": {"private": "old-private", "public": "old-public"},
+    }
+    variable = mock.MagicMock(val=json.dumps(self.leases))
+    session = mock.MagicMock()
+    self.enter_context(
+        mock.patch.object(
+            lease,
+            "create_session",
+            return_value=contextlib.nullcontext(session),
+        )
+    )
+    self.enter_context(
+        mock.patch.object(lease, "with_row_locks")
+    ).return_value.one_or_none.return_value = variable
+
+    with _locked_leases() as leases:
+      self.assertNotIn("ssh_keys", leases[_QR.format("old")])
+    self.assertNotIn("private", variable.val)
+
+  @mock.patch.object(lease, "_reset")
+  @mock.patch.object(lease, "_test_succeeded", return_value=True)
+  def test_check_in(self, _, reset):
+    self._add_lease("leased", lease.LEASED)
+
+    to_delete = lease.check_in.function(
+        _QR.format("leased"), _KEYS, datetime.timedelta(minutes=30)
+    )
+
+    self.assertIsNone(to_delete)
+    reset.assert_called_once_with(_QR.format("leased"), _KEYS)
+    self.assertEqual(self.leases[_QR.format("leased")]["state"], lease.IDLE)
+
+  @mock.patch.object(lease, "_reset")
+  @mock.patch.object(lease, "_test_succeeded", return_value=False)
+  def test_check_in_after_failure(self, _, reset):
+    self._add_lease("leased", lease.LEASED)
+
+    to_delete = lease.check_in.function(
+        _QR.format("leased"), _KEYS, datetime.timedelta(minutes=30)
+    )
+
+    self.assertEqual(to_delete, _QR.format("leased"))
+    reset.assert_not_called()
+    self.assertEmpty(self.leases)
+
+  @mock.patch.object(lease, "_reset")
+  @mock.patch.object(lease, "_test_succeeded", return_value=True)
+  def test_check_in_with_full_pool(self, *_):
+    self._add_lease("leased", lease.LEASED)
+    for i in range(lease.MAX_IDLE_PER_KEY):
+      self._add_lease(f"idle-{i}", lease.IDLE)
+
+    to_delete = lease.check_in.function(
+        _QR.format("leased"), _KEYS, datetime.timedelta(minutes=30)
+    )
+
+    self.assertEqual(to_delete, _QR.format("leased"))
+    self.assertNotIn(_QR.format("leased"), self.leases)
+
+  def test_evict_expired_leases(self):
+    self._add_lease("idle", lease.IDLE)
+    self._add_lease("expired", lease.IDLE, expires_in=-1)
+
+    lease.evict_expired_leases.function()
+
+    self.assertEqual(list(self.leases), [_QR.format("idle")])
+    client = lease.auth.get_client.return_value
+    client.get_queued_resource.assert_called_once_with(
+        name=_QR.format("expired")
+    )
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -20,25 +20,23 @@ import enum
 import hashlib
 import os
 import re
-from typing import Dict, Iterable, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 import uuid
 from absl import logging
 import airflow
 from airflow.decorators import task
 from airflow.exceptions import AirflowFailException
-from airflow.models import TaskInstance
 from airflow.operators.python import get_current_context
 from xlml.apis import gcp_config, test_config
 from xlml.apis import metric_config
-from xlml.utils import bigquery, composer
+from xlml.utils import bigquery, composer, lazy, name_format
 from dags import composer_env
-from google.cloud import storage
 import jsonlines
-import numpy as np
-import tensorflow as tf
-from tensorflow.core.util import event_pb2
 from urllib.parse import urlparse
 
+np = lazy.import_module("numpy")
+storage = lazy.import_module("google.cloud.storage")
+
 
 @dataclasses.dataclass
 class TensorBoardScalar:
@@ -46,6 +44,26 @@ class TensorBoardScalar:
   step: int
 
 
+# Key to cache the task instances of the DAG run on the Airflow task context.
+_TASK_INSTANCES_CONTEXT_KEY = "xlml_task_instances"
+
+# Prefix of the metrics that record how long each phase of a test took.
+DURATION_METRIC_PREFIX = "duration_sec"
+
+# Prefix of the metrics that record how many chip-seconds a test held.
+CHIP_USAGE_METRIC_PREFIX = "chip_sec"
+
+# Parts of a phase that are timed on their own, by the task IDs they end with.
+_SUB_PHASE_TASK_SUFFIXES = {
+    "queue_wait": (
+        "wait_for_ready_queued_resource",
+        "wait_for_workload_start",
+        "wait_for_resource_creation",
+    ),
+    "setup": ("provision.setup",),
+}
+
+
 class TaskState(enum.Enum):
   FAILED = "failed"
   SKIPPED = "upstream_failed"
@@ -96,6 +114,10 @@ def read_from_tb(
     A dict that maps metric name to a list of TensorBoardScalar, and
     a dict that maps dimension name to dimenstion value.
   """
+  # TensorFlow takes seconds to import, so only load it when it is needed.
+  import tensorflow as tf
+  from tensorflow.core.util import event_pb2
+
   metrics = {}
   metadata = {}
 
@@ -398,6 +420,11 @@ def add_airflow_metadata(
             job_uuid=uuid, metadata_key="run_id", metadata_value=run_id
         )
     )
+    airflow_meta.append(
+        bigquery.MetadataHistoryRow(
+            job_uuid=uuid, metadata_key="dag_id", metadata_value=str(dag_id)
+        )
+    )
     if context["prev_start_date_success"]:
       airflow_meta.append(
           bigquery.MetadataHistoryRow(
@@ -477,6 +504,167 @@ def add_test_config_metadata(
   return metadata
 
 
+def add_extra_metadata(
+    base_id: str,
+    extra_metadata: Dict[str, Any],
+    metadata: List[List[bigquery.MetadataHistoryRow]],
+) -> List[List[bigquery.MetadataHistoryRow]]:
+  """Add extra metadata, such as sweep parameters, to each test run.
+
+  Args:
+    base_id: The base id to generate uuid.
+    extra_metadata: The metadata keys and values to add.
+    metadata: The data to append extra metadata.
+
+  Returns:
+    The data with extra metadata.
+  """
+  for index in range(len(metadata)):
+    uuid = generate_row_uuid(base_id, index)
+    metadata[index].extend(
+        bigquery.MetadataHistoryRow(
+            job_uuid=uuid, metadata_key=key, metadata_value=str(value)
+        )
+        for key, value in extra_metadata.items()
+    )
+  return metadata
+
+
+def get_phase_spans(
+    test_group_id: Optional[str] = None,
+) -> Dict[str, Tuple[datetime.datetime, datetime.datetime]]:
+  """Get the start and end time of each phase of the current test.
+
+  A phase is a direct child of the test's task group, such as `provision` or
+  `run_model`, and lasts from the first start to the last end of its task
+  instances. Phases that are still running, like the post process that calls
+  this, last until now. `queue_wait` and `setup` are timed on their own.
+
+  Args:
+    test_group_id: ID of the test's task group. Defaults to the parent of the
+      current task's group.
+
+  Returns:
+    A dict that maps phase name to its start and end time.
+  """
+  context = get_current_context()
+  if test_group_id is None:
+    current_group = context["task"].task_group
+    test_group = current_group.parent_group if current_group else None
+    test_group_id = test_group.group_id if test_group else None
+  prefix = f"{test_group_id}." if test_group_id else ""
+  now = datetime.datetime.now(datetime.timezone.utc)
+
+  spans = {}
+  for ti in get_task_instances():
+    if not ti.start_date or not ti.task_id.startswith(prefix):
+      continue
+    relative_id = ti.task_id[len(prefix) :]
+    phases = [relative_id.split(".")[0]]
+    phases.extend(
+        phase
+        for phase, suffixes in _SUB_PHASE_TASK_SUFFIXES.items()
+        if relative_id.endswith(suffixes)
+    )
+    ti_end = ti.end_date or now
+    for phase in phases:
+      start, end = spans.get(phase, (ti.start_date, ti_end))
+      spans[phase] = (min(start, ti.start_date), max(end, ti_end))
+  return spans
+
+
+def get_phase_durations(
+    test_group_id: Optional[str] = None,
+) -> Dict[str, float]:
+  """Get the wall-clock duration of each phase of the current test.
+
+  Args:
+    test_group_id: ID of the test's task group. Defaults to the parent of the
+      current task's group.
+
+  Returns:
+    A dict that maps phase name to duration in seconds, with `total` spanning
+    all the phases that have started. See `get_phase_spans`.
+  """
+  spans = get_phase_spans(test_group_id)
+  durations = {
+      phase: (end - start).total_seconds()
+      for phase, (start, end) in spans.items()
+  }
+  if spans:
+    start = min(start for start, _ in spans.values())
+    end = max(end for _, end in spans.values())
+    durations["total"] = (end - start).total_seconds()
+  return durations
+
+
+def get_chip_seconds(
+    spans: Dict[str, Tuple[datetime.datetime, datetime.datetime]],
+    num_chips: int,
+) -> Dict[str, float]:
+  """Get the chip-seconds that a test held its accelerator for.
+
+  The accelerator is held from when it's ready, at the end of `queue_wait` (or
+  the start of `provision` if that wasn't timed), until `clean_up` has deleted
+  it. Whatever part of that is not `setup` or `run_model` is counted as `idle`.
+
+  Args:
+    spans: Start and end time of each phase, from `get_phase_spans`.
+    num_chips: Number of chips of the accelerator.
+
+  Returns:
+    A dict with the `total`, `setup`, `run_model` and `idle` chip-seconds, or
+    an empty dict if the test never got its accelerator.
+  """
+  if "queue_wait" in spans:
+    held_since = spans["queue_wait"][1]
+  elif "provision" in spans:
+    held_since = spans["provision"][0]
+  else:
+    return {}
+  if "clean_up" not in spans:
+    return {}
+
+  seconds = lambda span: (span[1] - span[0]).total_seconds()
+  held = seconds((held_since, spans["clean_up"][1]))
+  chip_seconds = {"total": held * num_chips}
+  busy = 0.0
+  for phase in ("setup", "run_model"):
+    if phase in spans:
+      chip_seconds[phase] = seconds(spans[phase]) * num_chips
+      busy += chip_seconds[phase]
+  chip_seconds["idle"] = max(0.0, chip_seconds["total"] - busy)
+  return chip_seconds
+
+
+def add_duration_metrics(
+    base_id: str,
+    durations: Dict[str, float],
+    metric: List[List[bigquery.MetricHistoryRow]],
+) -> List[List[bigquery.MetricHistoryRow]]:
+  """Add the duration of each test phase as a metric of each test run.
+
+  Args:
+    base_id: The base id to generate uuid.
+    durations: A dict that maps phase name to duration in seconds.
+    metric: The data to append duration metrics.
+
+  Returns:
+    The data with duration metrics.
+  """
+  for index in range(len(metric)):
+    uuid = generate_row_uuid(base_id, index)
+    metric[index].extend(
+        bigquery.MetricHistoryRow(
+            job_uuid=uuid,
+            metric_key=f"{DURATION_METRIC_PREFIX}/{phase}",
+            metric_value=seconds,
+        )
+        for phase, seconds in durations.items()
+    )
+  return metric
+
+
 def generate_row_uuid(base_id: str, index: int) -> str:
   """Generate uuid for entry.
 
@@ -515,21 +703,50 @@ def update_dataset_name_if_needed(
   return prod_dataset_name.value
 
 
+def get_task_instances() -> List[Any]:
+  """Get all task instances in the current DAG run.
+
+  They are fetched with a single metadata DB query and cached on the task
+  context, so every lookup within a task, such as job status and phase
+  timings, shares it. Inside a mapped task group, only task instances with the
+  same map index as the current one are included, so each mapped instance sees
+  the tasks of its own group.
+
+  Returns:
+    The task instances, as of the first call in the current task.
+  """
+  context = get_current_context()
+  if _TASK_INSTANCES_CONTEXT_KEY not in context:
+    map_index = context["ti"].map_index
+    context[_TASK_INSTANCES_CONTEXT_KEY] = [
+        ti
+        for ti in context["dag_run"].get_task_instances()
+        if ti.map_index in (-1, map_index)
+    ]
+  return context[_TASK_INSTANCES_CONTEXT_KEY]
+
+
+def get_task_states() -> Dict[str, Optional[str]]:
+  """Get the states of all task instances in the current DAG run.
+
+  Returns:
+    A dict that maps task ID to task instance state. See
+    `get_task_instances`.
+  """
+  return {ti.task_id: ti.state for ti in get_task_instances()}
+
+
 def get_xpk_job_status(benchmark_id: str) -> bigquery.JobStatus:
   """Get job status for the GKE run.
 
   FAILED - if any failure occurs in run_model
   SUCCESS - end-to-end model tests are successful in run_model
   """
-  context = get_current_context()
-  execution_date = context["dag_run"].logical_date
-  current_dag = context["dag"]
+  task_states = get_task_states()
 
-  workload_completion = current_dag.get_task(
-      task_id=f"{benchmark_id}.run_model.wait_for_workload_completion"
+  workload_completion_state = task_states.get(
+      f"{benchmark_id}.run_model.wait_for_workload_completion"
   )
-  workload_completion_ti = TaskInstance(workload_completion, execution_date)
-  workload_completion_state = workload_completion_ti.current_state()
 
   if workload_completion_state == TaskState.SUCCESS.value:
     logging.info(
@@ -554,28 +771,18 @@ def get_gke_job_status(
   run_model).
   SUCCESS - end-to-end model tests are successful from provision to run_model
   """
-  context = get_current_context()
-  execution_date = context["dag_run"].logical_date
-  current_dag = context["dag"]
+  task_states = get_task_states()
   benchmark_id = task_test_config.benchmark_id
 
   # check setup status to see if setup step is successful
-  setup_task = current_dag.get_task(
-      task_id=f"{benchmark_id}.generate_gcs_folder_location"
-  )
-  setup_ti = TaskInstance(setup_task, execution_date)
-  setup_state = setup_ti.current_state()
+  setup_state = task_states.get(f"{benchmark_id}.generate_gcs_folder_location")
 
   if setup_state == TaskState.FAILED.value:
     logging.info("The setup state is failed, and the job status is failed.")
     return bigquery.JobStatus.FAILED
 
   # check run_model status to see if run_model step is successful
-  run_model_task = current_dag.get_task(
-      task_id=f"{benchmark_id}.run_model.stream_logs"
-  )
-  run_model_ti = TaskInstance(run_model_task, execution_date)
-  run_model_state = run_model_ti.current_state()
+  run_model_state = task_states.get(f"{benchmark_id}.run_model.stream_logs")
 
   if run_model_state == TaskState.SUCCESS.value:
     logging.info(
@@ -590,6 +797,8 @@ def get_gke_job_status(
 def get_gce_job_status(
     task_test_config: test_config.TestConfig[test_config.Accelerator],
     use_startup_script: bool,
+    test_group_id: Optional[str] = None,
+    provision_group_id: Optional[str] = None,
 ) -> bigquery.JobStatus:
   """Get job status for the GCE run.
 
@@ -599,29 +808,29 @@ def get_gce_job_status(
   FAILED - if any failure occurs in check_if_startup_script_end
   (including timeout of check_if_startup_script_end) for startup script method.
   SUCCESS - end-to-end model tests are successful from provision to run_model
+
+  For the SSH method, `test_group_id` is the ID of the task group with the
+  test's run_model, which defaults to the benchmark ID, and
+  `provision_group_id` is the ID of the task group that provisioned the
+  accelerator, which defaults to `provision` in the test's group.
   """
-  context = get_current_context()
-  execution_date = context["dag_run"].logical_date
-  current_dag = context["dag"]
+  task_states = get_task_states()
   benchmark_id = task_test_config.benchmark_id
 
   # GCE SSH method
   if not use_startup_script:
+    test_group_id = test_group_id or benchmark_id
+    provision_group_id = provision_group_id or f"{test_group_id}.provision"
     if isinstance(task_test_config.accelerator, test_config.Tpu):
       # check wait status to see if wait_for_ready_queued_resource is successful
-      wait_task = current_dag.get_task(
-          task_id=f"{benchmark_id}.provision.create_queued_resource.wait_for_ready_queued_resource"
-      )
+      wait_task_id = f"{provision_group_id}.create_queued_resource.wait_for_ready_queued_resource"
     elif isinstance(task_test_config, test_config.GpuVmTest):
-      wait_task = current_dag.get_task(
-          task_id=f"{benchmark_id}.provision.create_resource.get_ip_address"
-      )
+      wait_task_id = f"{provision_group_id}.create_resource.get_ip_address"
     else:
       raise NotImplementedError(
           f"Unable to get task for {type(task_test_config.accelerator)}."
       )
-    wait_ti = TaskInstance(wait_task, execution_date)
-    wait_state = wait_ti.current_state()
+    wait_state = task_states.get(wait_task_id)
 
     if wait_state == TaskState.SKIPPED.value:
       logging.info(
@@ -630,17 +839,13 @@ def get_gce_job_status(
       return bigquery.JobStatus.MISSED
 
     # check setup status to see if setup step is successful
-    setup_task = current_dag.get_task(task_id=f"{benchmark_id}.provision.setup")
-    setup_ti = TaskInstance(setup_task, execution_date)
-    setup_state = setup_ti.current_state()
+    setup_state = task_states.get(f"{provision_group_id}.setup")
     if setup_state == TaskState.FAILED.value:
       logging.info("The setup state is failed, and the job status is failed.")
       return bigquery.JobStatus.FAILED
 
     # check run_model status to see if run_model step is successful
-    run_model_task = current_dag.get_task(task_id=f"{benchmark_id}.run_model")
-    run_model_ti = TaskInstance(run_model_task, execution_date)
-    run_model_state = run_model_ti.current_state()
+    run_model_state = task_states.get(f"{test_group_id}.run_model")
 
     if run_model_state == TaskState.SUCCESS.value:
       logging.info(
@@ -653,11 +858,9 @@ def get_gce_job_status(
   # GCE startup script method
   else:
     # check wait status to see if provision step is successful
-    wait_task = current_dag.get_task(
-        task_id=f"{benchmark_id}.provision_with_startup_script.create_queued_resource.wait_for_ready_queued_resource"
+    wait_state = task_states.get(
+        f"{benchmark_id}.provision_with_startup_script.create_queued_resource.wait_for_ready_queued_resource"
     )
-    wait_ti = TaskInstance(wait_task, execution_date)
-    wait_state = wait_ti.current_state()
 
     if wait_state == TaskState.SKIPPED.value:
       logging.info(
@@ -666,11 +869,9 @@ def get_gce_job_status(
       return bigquery.JobStatus.MISSED
 
     # check startup_script status to see if startup_script step is successful
-    startup_script_task = current_dag.get_task(
-        task_id=f"{benchmark_id}.provision_with_startup_script.create_queued_resource.check_if_startup_script_end"
+    startup_script_state = task_states.get(
+        f"{benchmark_id}.provision_with_startup_script.create_queued_resource.check_if_startup_script_end"
     )
-    startup_script_ti = TaskInstance(startup_script_task, execution_date)
-    startup_script_state = startup_script_ti.current_state()
     if startup_script_state == TaskState.FAILED.value:
       logging.info(
           "The startup_script state is failed, and the job status is failed."
@@ -692,8 +893,26 @@ def process_metrics(
     task_gcp_config: gcp_config.GCPConfig,
     use_startup_script: bool = False,
     folder_location: Optional[str] = None,
-) -> None:
+    extra_metadata: Optional[Dict[str, Any]] = None,
+    test_group_id: Optional[str] = None,
+    provision_group_id: Optional[str] = None,
+    tb_file_location: Optional[str] = None,
+) -> List[str]:
+  # Configs may hold templates like dated output directories and image tags,
+  # which Airflow doesn't render inside objects.
+  task_test_config = name_format.render_run_templates(task_test_config)
+  task_metric_config = name_format.render_run_templates(task_metric_config)
   benchmark_id = task_test_config.benchmark_id
+  # Set when each mapped instance writes its own TensorBoard summary. Passed as
+  # a task argument so that Airflow resolves it for this instance.
+  if tb_file_location and task_metric_config.tensorboard_summary:
+    task_metric_config = dataclasses.replace(
+        task_metric_config,
+        tensorboard_summary=dataclasses.replace(
+            task_metric_config.tensorboard_summary,
+            file_location=tb_file_location,
+        ),
+    )
   current_time = datetime.datetime.now()
   has_profile = False
   metric_history_rows_list = [[]]
@@ -746,6 +965,15 @@ def process_metrics(
       metadata_history_rows_list,
   )
 
+  if extra_metadata:
+    metadata_history_rows_list = add_extra_metadata(
+        base_id, extra_metadata, metadata_history_rows_list
+    )
+
+  metric_history_rows_list = add_duration_metrics(
+      base_id, get_phase_durations(), metric_history_rows_list
+  )
+
   # append profile metrics to metric_history_rows_list if any
   if has_profile:
     if len(metric_history_rows_list) != len(profile_history_rows_list):
@@ -770,7 +998,12 @@ def process_metrics(
   elif isinstance(task_test_config, test_config.GpuGkeTest):
     test_job_status = get_gke_job_status(task_test_config)
   else:
-    test_job_status = get_gce_job_status(task_test_config, use_startup_script)
+    test_job_status = get_gce_job_status(
+        task_test_config,
+        use_startup_script,
+        test_group_id=test_group_id,
+        provision_group_id=provision_group_id,
+    )
 
   for index in range(len(metadata_history_rows_list)):
     job_history_row = bigquery.JobHistoryRow(
@@ -789,3 +1022,60 @@ def process_metrics(
 
   print("Test run rows:", test_run_rows)
   bigquery_metric.insert(test_run_rows)
+  return [row.job_history.uuid for row in test_run_rows]
+
+
+@task(trigger_rule="all_done")
+def record_phase_durations(
+    task_gcp_config: gcp_config.GCPConfig,
+    phases: Iterable[str],
+    num_chips: Optional[int] = None,
+) -> None:
+  """Record durations of test phases that end after `process_metrics`.
+
+  This runs in the test's task group after the given phases, such as
+  `clean_up`, and adds their durations to the test runs that `process_metrics`
+  inserted.
+
+  Args:
+    task_gcp_config: The GCP config of the test.
+    phases: Names of the phases to record.
+    num_chips: Number of chips that the test provisioned, across all slices.
+      If set, the chip-seconds that the test held are recorded too.
+  """
+  context = get_current_context()
+  test_group_id = context["task"].task_group.group_id
+  job_uuids = context["ti"].xcom_pull(
+      task_ids=f"{test_group_id}.post_process.process_metrics"
+  )
+  if not job_uuids:
+    logging.info("No test runs were inserted, so there is nothing to record.")
+    return
+
+  durations = get_phase_durations(test_group_id)
+  metrics = {
+      f"{DURATION_METRIC_PREFIX}/{phase}": durations[phase]
+      for phase in phases
+      if phase in durations
+  }
+  if num_chips:
+    chip_seconds = get_chip_seconds(get_phase_spans(test_group_id), num_chips)
+    logging.info(f"Chip-seconds held by the test: {chip_seconds}")
+    metrics.update(
+        (f"{CHIP_USAGE_METRIC_PREFIX}/{key}", value)
+        for key, value in chip_seconds.items()
+    )
+
+  metric_history_rows = [
+      bigquery.MetricHistoryRow(
+          job_uuid=uuid, metric_key=key, metric_value=value
+      )
+      for uuid in job_uuids
+      for key, value in metrics.items()
+  ]
+
+  dataset_name = update_dataset_name_if_needed(task_gcp_config.dataset_name)
+  bigquery_metric = bigquery.BigQueryMetricClient(
+      task_gcp_config.dataset_project, dataset_name
+  )
+  bigquery_metric.insert_metric_history(metric_history_rows)
@@ -416,6 +416,340 @@ class BenchmarkMetricTest(parameterized.TestCase, absltest.TestCase):
     )
     self.assert_metric_and_dimension_equal([], [], actual_value, expected_value)
 
+  @parameterized.named_parameters(
+      ("success", "success", "success", bigquery.JobStatus.SUCCESS),
+      ("setup_failed", "failed", "upstream_failed", bigquery.JobStatus.FAILED),
+      ("run_model_failed", "success", "failed", bigquery.JobStatus.FAILED),
+  )
+  def test_get_gce_job_status(self, setup_state, run_model_state, expected):
+    task_test_config = test_config.TpuVmTest(
+        test_config.Tpu(version=TpuVersion.V4, cores=8),
+        test_name="test_name",
+        set_up_cmds="set_up_cmds",
+        run_model_cmds="run_model_cmds",
+    )
+    benchmark_id = task_test_config.benchmark_id
+    states = {
+        f"{benchmark_id}.provision.create_queued_resource.wait_for_ready_queued_resource": "success",
+        f"{benchmark_id}.provision.setup": setup_state,
+        f"{benchmark_id}.run_model": run_model_state,
+    }
+    task_instances = [
+        mock.MagicMock(task_id=task_id, state=state, map_index=-1)
+        for task_id, state in states.items()
+    ]
+
+    mock_dag_run = mock.MagicMock()
+    mock_dag_run.get_task_instances.return_value = task_instances
+    context = {"dag_run": mock_dag_run, "ti": mock.MagicMock(map_index=-1)}
+
+    with mock.patch(
+        "xlml.utils.metric.get_current_context", return_value=context
+    ):
+      actual_value = metric.get_gce_job_status(task_test_config, False)
+      # Subsequent lookups are served from the cached states.
+      metric.get_gce_job_status(task_test_config, False)
+
+    self.assertEqual(actual_value, expected)
+    mock_dag_run.get_task_instances.assert_called_once()
+
+  def test_get_gce_job_status_in_test_group(self):
+    task_test_config = test_config.TpuVmTest(
+        test_config.Tpu(version=TpuVersion.V4, cores=8),
+        test_name="test_name",
+        set_up_cmds="set_up_cmds",
+        run_model_cmds="run_model_cmds",
+    )
+    benchmark_id = task_test_config.benchmark_id
+    states = {
+        "group.provision.create_queued_resource.wait_for_ready_queued_resource": "success",
+        "group.provision.setup": "success",
+        f"group.{benchmark_id}.run_model": "failed",
+    }
+    task_instances = [
+        mock.MagicMock(task_id=task_id, state=state, map_index=-1)
+        for task_id, state in states.items()
+    ]
+
+    mock_dag_run = mock.MagicMock()
+    mock_dag_run.get_task_instances.return_value = task_instances
+    context = {"dag_run": mock_dag_run, "ti": mock.MagicMock(map_index=-1)}
+
+    with mock.patch(
+        "xlml.utils.metric.get_current_context", return_value=context
+    ):
+      actual_value = metric.get_gce_job_status(
+          task_test_config,
+          False,
+          test_group_id=f"group.{benchmark_id}",
+          provision_group_id="group.provision",
+      )
+
+    self.assertEqual(actual_value, bigquery.JobStatus.FAILED)
+
+  @parameterized.named_parameters(
+      ("first", 0, bigquery.JobStatus.SUCCESS),
+      ("second", 1, bigquery.JobStatus.FAILED),
+  )
+  def test_get_xpk_job_status_mapped(self, map_index, expected):
+    task_id = "benchmark.run_model.wait_for_workload_completion"
+    task_instances = [
+        mock.MagicMock(task_id=task_id, state="success", map_index=0),
+        mock.MagicMock(task_id=task_id, state="failed", map_index=1),
+    ]
+
+    mock_dag_run = mock.MagicMock()
+    mock_dag_run.get_task_instances.return_value = task_instances
+    context = {
+        "dag_run": mock_dag_run,
+        "ti": mock.MagicMock(map_index=map_index),
+    }
+
+    with mock.patch(
+        "xlml.utils.metric.get_current_context", return_value=context
+    ):
+      actual_value = metric.get_xpk_job_status("benchmark")
+
+    self.assertEqual(actual_value, expected)
+
+  def _mock_phase_context(self, task_instances, group_id, parent_group_id):
+    mock_dag_run = mock.MagicMock()
+    mock_dag_run.get_task_instances.return_value = task_instances
+    task_group = mock.MagicMock(
+        group_id=group_id,
+        parent_group=mock.MagicMock(group_id=parent_group_id),
+    )
+    return {
+        "dag_run": mock_dag_run,
+        "task": mock.MagicMock(task_group=task_group),
+        "ti": mock.MagicMock(map_index=-1),
+    }
+
+  def test_get_phase_durations(self):
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    minutes = lambda m: start + datetime.timedelta(minutes=m)
+    create_qr = "benchmark.provision.create_queued_resource"
+    spans = {
+        f"{create_qr}.create_queued_resource_request": (0, 1),
+        f"{create_qr}.wait_for_ready_queued_resource": (1, 5),
+        "benchmark.provision.setup": (6, 10),
+        "benchmark.run_model": (10, 40),
+        "benchmark.post_process.generate_process_id": (40, 41),
+        "benchmark.post_process.process_metrics": (41, 42),
+        "other.run_model": (0, 90),
+    }
+    task_instances = [
+        mock.MagicMock(
+            task_id=task_id,
+            start_date=minutes(begin),
+            end_date=minutes(end),
+            map_index=-1,
+        )
+        for task_id, (begin, end) in spans.items()
+    ]
+    task_instances.append(
+        mock.MagicMock(
+            task_id="benchmark.clean_up.delete_queued_resource_request",
+            start_date=None,
+            end_date=None,
+            map_index=-1,
+        )
+    )
+    context = self._mock_phase_context(
+        task_instances, "benchmark.post_process", "benchmark"
+    )
+
+    with mock.patch(
+        "xlml.utils.metric.get_current_context", return_value=context
+    ):
+      durations = metric.get_phase_durations()
+
+    self.assertEqual(
+        durations,
+        {
+            "provision": 600.0,
+            "queue_wait": 240.0,
+            "setup": 240.0,
+            "run_model": 1800.0,
+            "post_process": 120.0,
+            "total": 2520.0,
+        },
+    )
+
+  def test_get_phase_durations_running(self):
+    start = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        minutes=10
+    )
+    task_instances = [
+        mock.MagicMock(
+            task_id="benchmark.clean_up.wait_for_tpu_deletion",
+            start_date=start,
+            end_date=None,
+            map_index=-1,
+        )
+    ]
+    context = self._mock_phase_context(task_instances, "benchmark", None)
+
+    with mock.patch(
+        "xlml.utils.metric.get_current_context", return_value=context
+    ):
+      durations = metric.get_phase_durations("benchmark")
+
+    self.assertAlmostEqual(durations["clean_up"], 600, delta=5)
+
+  def test_task_instances_fetched_once(self):
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    task_instances = [
+        mock.MagicMock(
+            task_id="benchmark.run_model",
+            state="success",
+            start_date=start,
+            end_date=start + datetime.timedelta(minutes=5),
+            map_index=-1,
+        )
+    ]
+    context = self._mock_phase_context(task_instances, "benchmark", None)
+
+    with mock.patch(
+        "xlml.utils.metric.get_current_context", return_value=context
+    ):
+      states = metric.get_task_states()
+      durations = metric.get_phase_durations("benchmark")
+
+    self.assertEqual(states, {"benchmark.run_model": "success"})
+    self.assertEqual(durations["run_model"], 300.0)
+    context["dag_run"].get_task_instances.assert_called_once()
+
+  @mock.patch.object(bigquery, "BigQueryMetricClient")
+  def test_record_phase_durations(self, mock_client):
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    task_instances = [
+        mock.MagicMock(
+            task_id="benchmark.clean_up.delete_queued_resource_request",
+            start_date=start,
+            end_date=start + datetime.timedelta(minutes=2),
+            map_index=-1,
+        )
+    ]
+    context = self._mock_phase_context(task_instances, "benchmark", None)
+    context["ti"].xcom_pull.return_value = ["uuid"]
+    gcp = gcp_config.GCPConfig(
+        project_name="project",
+        zone="zone",
+        dataset_name=metric_config.DatasetOption.XLML_DATASET,
+    )
+
+    with mock.patch(
+        "xlml.utils.metric.get_current_context", return_value=context
+    ):
+      metric.record_phase_durations.function(gcp, ["clean_up"])
+
+    context["ti"].xcom_pull.assert_called_once_with(
+        task_ids="benchmark.post_process.process_metrics"
+    )
+    mock_client.return_value.insert_metric_history.assert_called_once_with(
+        [
+            bigquery.MetricHistoryRow(
+                job_uuid="uuid",
+                metric_key="duration_sec/clean_up",
+                metric_value=120.0,
+            )
+        ]
+    )
+
+  def test_get_chip_seconds(self):
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    minutes = lambda begin, end: (
+        start + datetime.timedelta(minutes=begin),
+        start + datetime.timedelta(minutes=end),
+    )
+    spans = {
+        "provision": minutes(0, 10),
+        "queue_wait": minutes(1, 5),
+        "setup": minutes(6, 10),
+        "run_model": minutes(10, 40),
+        "post_process": minutes(40, 42),
+        "clean_up": minutes(42, 45),
+    }
+
+    chip_seconds = metric.get_chip_seconds(spans, num_chips=4)
+
+    self.assertEqual(
+        chip_seconds,
+        {
+            "total": 40 * 60 * 4,
+            "setup": 4 * 60 * 4,
+            "run_model": 30 * 60 * 4,
+            "idle": 6 * 60 * 4,
+        },
+    )
+
+  def test_get_chip_seconds_without_clean_up(self):
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    spans = {"provision": (start, start + datetime.timedelta(minutes=5))}
+
+    self.assertEqual(metric.get_chip_seconds(spans, num_chips=4), {})
+
+  @mock.patch.object(bigquery, "BigQueryMetricClient")
+  def test_record_phase_durations_with_chips(self, mock_client):
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    task_instances = [
+        mock.MagicMock(
+            task_id=task_id,
+            start_date=start + datetime.timedelta(minutes=begin),
+            end_date=start + datetime.timedelta(minutes=end),
+            map_index=-1,
+        )
+        for task_id, (begin, end) in {
+            "benchmark.provision.setup": (0, 1),
+            "benchmark.run_model": (1, 3),
+            "benchmark.clean_up.delete_queued_resource_request": (3, 4),
+        }.items()
+    ]
+    context = self._mock_phase_context(task_instances, "benchmark", None)
+    context["ti"].xcom_pull.return_value = ["uuid"]
+    gcp = gcp_config.GCPConfig(
+        project_name="project",
+        zone="zone",
+        dataset_name=metric_config.DatasetOption.XLML_DATASET,
+    )
+
+    with mock.patch(
+        "xlml.utils.metric.get_current_context", return_value=context
+    ):
+      metric.record_phase_durations.function(gcp, ["clean_up"], num_chips=2)
+
+    rows = mock_client.return_value.insert_metric_history.call_args[0][0]
+    self.assertEqual(
+        {row.metric_key: row.metric_value for row in rows},
+        {
+            "duration_sec/clean_up": 60.0,
+            "chip_sec/total": 480.0,
+            "chip_sec/setup": 120.0,
+            "chip_sec/run_model": 240.0,
+            "chip_sec/idle": 120.0,
+        },
+    )
+
+  def test_add_duration_metrics(self):
+    metric_rows = metric.add_duration_metrics(
+        "base", {"run_model": 60.0}, [[], []]
+    )
+
+    self.assertEqual(
+        metric_rows,
+        [
+            [
+                bigquery.MetricHistoryRow(
+                    job_uuid=metric.generate_row_uuid("base", index),
+                    metric_key="duration_sec/run_model",
+                    metric_value=60.0,
+                )
+            ]
+            for index in range(2)
+        ],
+    )
+
   def test_get_gcs_file_location_with_regex(self):
     with mock.patch("xlml.utils.metric.storage") as mock_storage:
       mock_gcs_client = mock_storage.Client.return_value
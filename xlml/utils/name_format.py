@@ -14,11 +14,76 @@
 
 """Utility to generate names and locations."""
 
+import dataclasses
 import datetime
 import os
+from typing import Any, TypeVar
+import airflow
 from airflow.decorators import task
+from airflow.operators.python import get_current_context
+import attrs
 from dags import gcs_bucket
 
+T = TypeVar("T")
+
+# Jinja templates for the time the DAG run started. Use these instead of
+# `datetime.now()` in DAG files: Airflow renders them in task arguments when the
+# task runs, so the parsed DAG stays the same from one parse to the next. Inside
+# configs, they are rendered by `render_run_templates`.
+RUN_DATE = "{{ dag_run.start_date.strftime('%Y-%m-%d') }}"
+RUN_DATE_NODASH = "{{ dag_run.start_date.strftime('%Y%m%d') }}"
+RUN_DATETIME = "{{ dag_run.start_date.strftime('%Y-%m-%d-%H-%M-%S') }}"
+
+
+def _render(value: Any, context) -> Any:
+  # XCom values are resolved separately, when the task reads them.
+  if isinstance(value, airflow.XComArg):
+    return value
+  if isinstance(value, str):
+    if "{{" not in value:
+      return value
+    return context["task"].render_template(value, context)
+  if isinstance(value, (list, tuple)):
+    return type(value)(_render(item, context) for item in value)
+  if isinstance(value, dict):
+    return {key: _render(item, context) for key, item in value.items()}
+  if attrs.has(type(value)):
+    return attrs.evolve(
+        value,
+        **{
+            field.name: _render(getattr(value, field.name), context)
+            for field in attrs.fields(type(value))
+            if field.init
+        },
+    )
+  if dataclasses.is_dataclass(value) and not isinstance(value, type):
+    return dataclasses.replace(
+        value,
+        **{
+            field.name: _render(getattr(value, field.name), context)
+            for field in dataclasses.fields(value)
+            if field.init
+        },
+    )
+  return value
+
+
+def render_run_templates(value: T) -> T:
+  """Render templates such as `RUN_DATE` in a config for the current task.
+
+  Airflow only renders templates in task arguments, not inside objects like
+  test and metric configs. Render configs before their values are used or
+  recorded, e.g. as metadata.
+
+  Args:
+    value: A string, or a list, tuple, dict, attrs class or dataclass that may
+      contain strings.
+
+  Returns:
+    A copy of `value` with every string rendered.
+  """
+  return _render(value, get_current_context())
+
 
 @task
 def generate_run_name(benchmark_id: str) -> str:
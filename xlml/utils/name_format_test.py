@@ -0,0 +1,83 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for name_format.py."""
+
+import datetime
+from unittest import mock
+from absl.testing import absltest
+from airflow.operators.empty import EmptyOperator
+from dags.vm_resource import TpuVersion
+from xlml.apis import metric_config, test_config
+from xlml.utils import name_format
+
+
+class RenderRunTemplatesTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    start_date = datetime.datetime(2024, 6, 3, 4, 5, 6)
+    context = {
+        "task": EmptyOperator(task_id="process_metrics"),
+        "dag_run": mock.MagicMock(start_date=start_date),
+    }
+    self.enter_context(
+        mock.patch.object(
+            name_format, "get_current_context", return_value=context
+        )
+    )
+
+  def test_render_test_config(self):
+    config = test_config.TpuGkeTest(
+        test_config.Tpu(version=TpuVersion.V4, cores=8),
+        test_name="test",
+        cluster_name="cluster",
+        docker_image=f"gcr.io/project/image:{name_format.RUN_DATE}",
+        set_up_cmds=(),
+        run_model_cmds=(f"train run_name={name_format.RUN_DATETIME}",),
+    )
+
+    rendered = name_format.render_run_templates(config)
+
+    self.assertEqual(rendered.docker_image, "gcr.io/project/image:2024-06-03")
+    self.assertEqual(
+        rendered.run_model_cmds, ("train run_name=2024-06-03-04-05-06",)
+    )
+    self.assertEqual(rendered.benchmark_id, config.benchmark_id)
+    self.assertIn(name_format.RUN_DATE, config.docker_image)
+
+  def test_render_metric_config(self):
+    config = metric_config.MetricConfig(
+        tensorboard_summary=metric_config.SummaryConfig(
+            file_location=f"gs://bucket/{name_format.RUN_DATE_NODASH}",
+            aggregation_strategy=metric_config.AggregationStrategy.LAST,
+        )
+    )
+
+    rendered = name_format.render_run_templates(config)
+
+    self.assertEqual(
+        rendered.tensorboard_summary.file_location, "gs://bucket/20240603"
+    )
+    self.assertEqual(
+        rendered.tensorboard_summary.aggregation_strategy,
+        metric_config.AggregationStrategy.LAST,
+    )
+
+  def test_render_none(self):
+    self.assertIsNone(name_format.render_run_templates(None))
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -0,0 +1,184 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Utilities to queue tests in Airflow pools sized by accelerator capacity."""
+
+import contextlib
+import datetime
+import json
+import time
+from typing import Any, Dict, Iterator
+
+from absl import logging
+from airflow.decorators import task
+from airflow.models import Pool, Variable
+from airflow.utils.session import create_session
+from airflow.utils.sqlalchemy import with_row_locks
+from dags import capacity, composer_env
+from dags.vm_resource import TpuVersion
+from xlml.apis import test_config
+
+
+def get_tpu_pool_name(
+    project: str, zone: str, version: TpuVersion, reserved: bool
+) -> str:
+  """Get the name of the pool for a kind of TPU capacity."""
+  capacity_type = "reserved" if reserved else "on-demand"
+  return f"tpu-{project}-{zone}-v{version.value}-{capacity_type}"
+
+
+def get_tpu_pool_args(
+    project: str,
+    zone: str,
+    accelerator: test_config.Tpu,
+    num_slices: int = 1,
+) -> Dict[str, Any]:
+  """Get the pool arguments for the tasks of a test that holds a TPU.
+
+  Pass them as `default_args` of the test's task group, so that every task from
+  the queued resource request until the TPU is deleted runs in the pool. Tasks
+  take one slot per TPU core, so tests of any size share the pool. Pools are
+  only used in the prod environment, where `sync_pools` keeps them up to date.
+
+  Airflow gives slots back between tasks and while sensors wait to be
+  rescheduled, so the pool only bounds the TPU tasks that run at once. Use
+  `reserve_tpu_cores` and `release_tpu_cores` to bound the TPUs that exist.
+
+  Args:
+    project: Project to provision the TPU in.
+    zone: Zone to provision the TPU in.
+    accelerator: The TPU to provision.
+    num_slices: Number of slices of `accelerator`.
+
+  Returns:
+    A dict with `pool` and `pool_slots` to pass to `override`, or an empty dict
+    if the TPU has no capacity configured.
+  """
+  key = (project, zone, accelerator.version, accelerator.reserved)
+  if not composer_env.is_prod_env() or key not in capacity.TPU_CORES:
+    return {}
+
+  # A task that asks for more slots than the pool has would never run.
+  pool_slots = min(accelerator.cores * num_slices, capacity.TPU_CORES[key])
+  return {"pool": get_tpu_pool_name(*key), "pool_slots": pool_slots}
+
+
+@task
+def sync_pools() -> None:
+  """Create or resize the pools for every TPU in `capacity.TPU_CORES`."""
+  for key, cores in capacity.TPU_CORES.items():
+    name = get_tpu_pool_name(*key)
+    logging.info(f"Setting pool {name} to {cores} slots.")
+    Pool.create_or_update_pool(
+        name=name,
+        slots=cores,
+        description="TPU cores that tests may hold at once.",
+        include_deferred=False,
+    )
+
+
+# Airflow Variable that maps each test holding TPU capacity to its reservation.
+RESERVATION_VARIABLE = "tpu_reservations"
+
+# How long a test may wait for TPU capacity to be free.
+RESERVATION_TIMEOUT = datetime.timedelta(hours=12)
+
+
+@contextlib.contextmanager
+def _locked_reservations() -> Iterator[Dict[str, Dict[str, Any]]]:
+  """Lock the reservations and yield them, saving any changes on exit."""
+  with create_session() as session:
+    query = session.query(Variable).filter(Variable.key == RESERVATION_VARIABLE)
+    variable = with_row_locks(query, session=session).one_or_none()
+    if variable is None:
+      variable = Variable(key=RESERVATION_VARIABLE, val="{}")
+      session.add(variable)
+
+    reservations = json.loads(variable.val)
+    yield reservations
+    variable.val = json.dumps(reservations)
+
+
+@task.sensor(
+    poke_interval=60,
+    timeout=RESERVATION_TIMEOUT.total_seconds(),
+    mode="reschedule",
+    pool=Pool.DEFAULT_POOL_NAME,
+    pool_slots=1,
+)
+def reserve_tpu_cores(
+    pool_name: str, cores: int, holder: str, ttl: datetime.timedelta
+) -> bool:
+  """Wait until the pool's capacity has `cores` free and reserve them.
+
+  Put it upstream of the queued resource request and `release_tpu_cores`
+  downstream of the TPU deletion, so that the cores are held while the TPU
+  exists, including between tasks. The sensor itself runs outside of the pool,
+  so that waiting tests don't take slots from tests that hold a TPU.
+
+  Args:
+    pool_name: Name of the pool from `get_tpu_pool_args`.
+    cores: Number of TPU cores to reserve, from `get_tpu_pool_args`.
+    holder: Unique name of the test, such as its TPU name.
+    ttl: How long the reservation lasts if it's never released, e.g. because
+      the DAG run was killed. Should match the TTL label of the TPU.
+
+  Returns:
+    Whether the cores are reserved.
+  """
+  capacity_cores = {
+      get_tpu_pool_name(*key): total
+      for key, total in capacity.TPU_CORES.items()
+  }[pool_name]
+  now = time.time()
+  with _locked_reservations() as reservations:
+    for name, reservation in list(reservations.items()):
+      if reservation["expires_at"] <= now:
+        logging.warning(f"Reservation of {name} expired without a release.")
+        del reservations[name]
+
+    if holder in reservations:
+      return True
+
+    held = sum(
+        reservation["cores"]
+        for reservation in reservations.values()
+        if reservation["pool"] == pool_name
+    )
+    if held + cores > capacity_cores:
+      logging.info(
+          f"{held} of {capacity_cores} cores in {pool_name} are reserved,"
+          f" waiting for {cores} more."
+      )
+      return False
+
+    reservations[holder] = {
+        "pool": pool_name,
+        "cores": cores,
+        "expires_at": now + ttl.total_seconds(),
+    }
+  logging.info(f"Reserved {cores} cores in {pool_name} for {holder}.")
+  return True
+
+
+@task(trigger_rule="all_done", pool=Pool.DEFAULT_POOL_NAME, pool_slots=1)
+def release_tpu_cores(holder: str) -> None:
+  """Release the TPU cores that `reserve_tpu_cores` reserved for `holder`."""
+  with _locked_reservations() as reservations:
+    reservation = reservations.pop(holder, None)
+  if reservation:
+    logging.info(
+        f"Released {reservation['cores']} cores in {reservation['pool']} for"
+        f" {holder}."
+    )
@@ -0,0 +1,130 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for pool.py."""
+
+import contextlib
+import datetime
+import os
+from unittest import mock
+from absl.testing import absltest
+from absl.testing import parameterized
+from dags import capacity, composer_env
+from dags.vm_resource import TpuVersion
+from xlml.apis import test_config
+from xlml.utils import pool
+
+_PROD_ENV = {
+    composer_env.COMPOSER_ENVIRONMENT: composer_env.PROD_COMPOSER_ENV_NAME
+}
+_CAPACITY = {("project", "zone", TpuVersion.V4, True): 64}
+
+
+class PoolTest(parameterized.TestCase):
+
+  @parameterized.named_parameters(
+      ("single_slice", 8, 1, 8),
+      ("multislice", 8, 4, 32),
+      ("larger_than_capacity", 128, 1, 64),
+  )
+  def test_get_tpu_pool_args(self, cores, num_slices, expected_slots):
+    tpu = test_config.Tpu(version=TpuVersion.V4, cores=cores, reserved=True)
+
+    with mock.patch.dict(os.environ, _PROD_ENV), mock.patch.dict(
+        capacity.TPU_CORES, _CAPACITY, clear=True
+    ):
+      pool_args = pool.get_tpu_pool_args("project", "zone", tpu, num_slices)
+
+    self.assertEqual(
+        pool_args,
+        {"pool": "tpu-project-zone-v4-reserved", "pool_slots": expected_slots},
+    )
+
+  def test_get_tpu_pool_args_without_capacity(self):
+    tpu = test_config.Tpu(version=TpuVersion.V4, cores=8, reserved=False)
+
+    with mock.patch.dict(os.environ, _PROD_ENV), mock.patch.dict(
+        capacity.TPU_CORES, _CAPACITY, clear=True
+    ):
+      pool_args = pool.get_tpu_pool_args("project", "zone", tpu)
+
+    self.assertEmpty(pool_args)
+
+  def test_get_tpu_pool_args_outside_prod(self):
+    tpu = test_config.Tpu(version=TpuVersion.V4, cores=8, reserved=True)
+
+    with mock.patch.dict(os.environ, clear=True), mock.patch.dict(
+        capacity.TPU_CORES, _CAPACITY, clear=True
+    ):
+      pool_args = pool.get_tpu_pool_args("project", "zone", tpu)
+
+    self.assertEmpty(pool_args)
+
+
+class ReservationTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.reservations = {}
+
+    @contextlib.contextmanager
+    def locked_reservations():
+      yield self.reservations
+
+    self.enter_context(
+        mock.patch.object(pool, "_locked_reservations", locked_reservations)
+    )
+    self.enter_context(
+        mock.patch.dict(capacity.TPU_CORES, _CAPACITY, clear=True)
+    )
+
+  def _reserve(self, holder, cores, ttl=datetime.timedelta(hours=1)):
+    return pool.reserve_tpu_cores.function(
+        "tpu-project-zone-v4-reserved", cores, holder, ttl
+    )
+
+  def test_second_test_waits_until_first_releases(self):
+    self.assertTrue(self._reserve("first", 64))
+
+    # The first test holds the capacity until its TPU is deleted, even while
+    # none of its tasks run.
+    self.assertFalse(self._reserve("second", 8))
+    self.assertFalse(self._reserve("second", 8))
+
+    pool.release_tpu_cores.function("first")
+    self.assertTrue(self._reserve("second", 8))
+
+  def test_tests_share_capacity(self):
+    self.assertTrue(self._reserve("first", 32))
+    self.assertTrue(self._reserve("second", 32))
+    self.assertFalse(self._reserve("third", 8))
+
+  def test_reserve_is_idempotent(self):
+    self.assertTrue(self._reserve("first", 64))
+    self.assertTrue(self._reserve("first", 64))
+
+  def test_expired_reservation_is_dropped(self):
+    self.assertTrue(self._reserve("first", 64, ttl=datetime.timedelta(0)))
+
+    self.assertTrue(self._reserve("second", 64))
+    self.assertNotIn("first", self.reservations)
+
+  def test_release_without_reservation(self):
+    pool.release_tpu_cores.function("unknown")
+
+    self.assertEmpty(self.reservations)
+
+
+if __name__ == "__main__":
+  absltest.main()
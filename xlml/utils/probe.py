@@ -0,0 +1,136 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Utilities to wait until a host or server is ready, instead of sleeping.
+
+`wait_until` polls a readiness check from the Airflow worker. The `*_cmd`
+functions build shell commands that poll from the test host itself, e.g. for
+servers that only listen on localhost.
+"""
+
+import datetime
+import shlex
+import socket
+import time
+from typing import Callable
+
+from absl import logging
+
+INITIAL_DELAY = datetime.timedelta(seconds=1)
+MAX_DELAY = datetime.timedelta(seconds=30)
+
+
+def wait_until(
+    check: Callable[[], bool],
+    timeout: datetime.timedelta,
+    description: str,
+    initial_delay: datetime.timedelta = INITIAL_DELAY,
+    max_delay: datetime.timedelta = MAX_DELAY,
+) -> None:
+  """Poll `check` with exponential backoff until it passes.
+
+  Args:
+    check: Returns whether the thing to wait for is ready.
+    timeout: How long to wait in total.
+    description: What is waited for, for logs and errors.
+    initial_delay: Delay after the first failed check.
+    max_delay: Longest delay between checks.
+
+  Raises:
+    TimeoutError: `check` didn't pass before the timeout.
+  """
+  start = time.monotonic()
+  deadline = start + timeout.total_seconds()
+  delay = initial_delay.total_seconds()
+  while not check():
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+      raise TimeoutError(f"{description} is not ready after {timeout}.")
+    logging.info(f"{description} is not ready, checking again in {delay}s.")
+    time.sleep(min(delay, remaining))
+    delay = min(delay * 2, max_delay.total_seconds())
+  logging.info(f"{description} is ready after {time.monotonic() - start:.1f}s.")
+
+
+def is_ssh_ready(host: str, port: int = 22, timeout: float = 10.0) -> bool:
+  """Whether an SSH server accepts connections and sends its banner."""
+  try:
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+      sock.settimeout(timeout)
+      return sock.recv(4).startswith(b"SSH-")
+  except OSError:
+    return False
+
+
+def _wait_cmd(
+    check_cmd: str,
+    description: str,
+    timeout: datetime.timedelta,
+    max_delay: datetime.timedelta,
+) -> str:
+  """Build a shell command that runs `check_cmd` until it succeeds."""
+  seconds = int(timeout.total_seconds())
+  max_delay_seconds = int(max_delay.total_seconds())
+  message = shlex.quote(f"{description} is not ready after {seconds}s.")
+  return f"""deadline=$((SECONDS + {seconds})); delay=1
+until {check_cmd}; do
+  if [ $SECONDS -ge $deadline ]; then echo {message}; exit 1; fi
+  sleep $delay
+  delay=$((delay * 2 > {max_delay_seconds} ? {max_delay_seconds} : delay * 2))
+done"""
+
+
+def wait_for_port_cmd(
+    port: int,
+    timeout: datetime.timedelta,
+    host: str = "localhost",
+    max_delay: datetime.timedelta = MAX_DELAY,
+) -> str:
+  """Build a shell command that waits until a TCP port accepts connections.
+
+  Args:
+    port: Port to connect to.
+    timeout: How long to wait before failing the command.
+    host: Host to connect to, from the host that runs the command.
+    max_delay: Longest delay between checks.
+
+  Returns:
+    A bash command, since it uses `/dev/tcp`.
+  """
+  return _wait_cmd(
+      f"(exec 3<>/dev/tcp/{host}/{port}) 2>/dev/null",
+      f"{host}:{port}",
+      timeout,
+      max_delay,
+  )
+
+
+def wait_for_http_cmd(
+    url: str,
+    timeout: datetime.timedelta,
+    max_delay: datetime.timedelta = MAX_DELAY,
+) -> str:
+  """Build a shell command that waits until a URL responds with success.
+
+  Args:
+    url: URL of the health check, e.g. `http://localhost:8000/healthz`.
+    timeout: How long to wait before failing the command.
+    max_delay: Longest delay between checks.
+
+  Returns:
+    A bash command that uses `curl`.
+  """
+  return _wait_cmd(
+      f"curl -sf -o /dev/null {shlex.quote(url)}", url, timeout, max_delay
+  )
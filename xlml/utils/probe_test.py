@@ -0,0 +1,109 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for probe.py."""
+
+import datetime
+import socket
+import subprocess
+import threading
+from unittest import mock
+from absl.testing import absltest
+from xlml.utils import probe
+
+
+def _serve_once(response: bytes) -> int:
+  """Accept one connection on a free port and send `response`."""
+  server = socket.create_server(("localhost", 0))
+
+  def serve():
+    with server:
+      conn, _ = server.accept()
+      with conn:
+        conn.sendall(response)
+
+  threading.Thread(target=serve, daemon=True).start()
+  return server.getsockname()[1]
+
+
+def _closed_port() -> int:
+  with socket.create_server(("localhost", 0)) as server:
+    return server.getsockname()[1]
+
+
+class WaitUntilTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.sleep = self.enter_context(mock.patch.object(probe.time, "sleep"))
+
+  def test_wait_until_backs_off(self):
+    check = mock.Mock(side_effect=[False, False, False, True])
+
+    probe.wait_until(
+        check,
+        datetime.timedelta(hours=1),
+        "server",
+        max_delay=datetime.timedelta(seconds=3),
+    )
+
+    self.assertEqual(
+        self.sleep.call_args_list,
+        [mock.call(1.0), mock.call(2.0), mock.call(3.0)],
+    )
+
+  @mock.patch.object(probe.time, "monotonic", side_effect=[0, 0, 5, 11])
+  def test_wait_until_times_out(self, _):
+    with self.assertRaisesRegex(TimeoutError, "server is not ready"):
+      probe.wait_until(lambda: False, datetime.timedelta(seconds=10), "server")
+
+    self.assertEqual(
+        self.sleep.call_args_list, [mock.call(1.0), mock.call(2.0)]
+    )
+
+
+class ProbeTest(absltest.TestCase):
+
+  def test_is_ssh_ready(self):
+    port = _serve_once(b"SSH-2.0-OpenSSH_8.9\r\n")
+
+    self.assertTrue(probe.is_ssh_ready("localhost", port))
+
+  def test_is_ssh_ready_without_banner(self):
+    port = _serve_once(b"HTTP/1.1 400 Bad Request\r\n")
+
+    self.assertFalse(probe.is_ssh_ready("localhost", port))
+
+  def test_is_ssh_ready_closed_port(self):
+    self.assertFalse(probe.is_ssh_ready("localhost", _closed_port()))
+
+  def test_wait_for_port_cmd(self):
+    port = _serve_once(b"")
+    cmd = probe.wait_for_port_cmd(port, datetime.timedelta(seconds=5))
+
+    result = subprocess.run(["bash", "-c", cmd], capture_output=True)
+
+    self.assertEqual(result.returncode, 0)
+
+  def test_wait_for_port_cmd_times_out(self):
+    cmd = probe.wait_for_port_cmd(_closed_port(), datetime.timedelta(0))
+
+    result = subprocess.run(["bash", "-c", cmd], capture_output=True, text=True)
+
+    self.assertEqual(result.returncode, 1)
+    self.assertIn("is not ready after 0s", result.stdout)
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -0,0 +1,96 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Utility to cache the environment that a setup script creates in GCS."""
+
+import hashlib
+import shlex
+from typing import Iterable, Optional
+
+from dags import gcs_bucket
+
+# Directories whose files setup scripts change, e.g. with `pip install --user`,
+# `git clone` into the home directory, or `apt-get install`.
+SNAPSHOT_DIRS = ("$HOME", "/usr", "/etc", "/opt", "/var/lib/dpkg")
+
+
+def get_cache_key(setup_script: str, runtime_version: Optional[str]) -> str:
+  """Get the key of the environment that `setup_script` creates."""
+  content = "\n".join((str(runtime_version), setup_script))
+  return hashlib.sha256(content.encode()).hexdigest()[:32]
+
+
+def get_changed_files_cmd(
+    marker: str, dirs: Iterable[str] = SNAPSHOT_DIRS
+) -> str:
+  """Get a command that lists the files in `dirs` changed after `marker`.
+
+  Files are compared by their status change time rather than modification time,
+  since package managers like dpkg keep the modification time of the files
+  they unpack.
+
+  Args:
+    marker: Path of a file created before the changes.
+    dirs: Directories to search.
+
+  Returns:
+    A command that prints the paths of the files, separated by null characters.
+  """
+  return (
+      f"find {' '.join(dirs)} -xdev -cnewer {marker}"
+      " \\( -type f -o -type l \\) -print0"
+  )
+
+
+def wrap_setup_script(
+    setup_script: str,
+    runtime_version: Optional[str],
+    cache_dir: str = gcs_bucket.SETUP_CACHE_DIR,
+) -> str:
+  """Wrap a setup script to restore its environment from a snapshot.
+
+  If a snapshot for the script and runtime version exists, it is unpacked
+  instead of running the script. Otherwise the script runs, and the files it
+  added or changed are saved as the snapshot. Only files are saved, so the
+  script must not depend on anything else, such as services it stops, and its
+  inputs must not change between runs, e.g. nightly packages.
+
+  Args:
+    setup_script: The setup script to wrap.
+    runtime_version: Runtime version of the machine that the script runs on.
+    cache_dir: GCS directory of the snapshots.
+
+  Returns:
+    The wrapped setup script.
+  """
+  snapshot = f"{cache_dir}/{get_cache_key(setup_script, runtime_version)}.tgz"
+  escaped_script = shlex.quote(setup_script)
+  changed_files_cmd = get_changed_files_cmd('"$marker"')
+  return f"""
+set -xue
+snapshot={snapshot}
+archive=/tmp/setup-cache.tgz
+if gcloud storage ls "$snapshot" > /dev/null 2>&1; then
+  echo "Restoring the setup environment from $snapshot."
+  gcloud storage cp "$snapshot" "$archive"
+  sudo tar -xzpf "$archive" -C /
+else
+  marker=$(mktemp)
+  bash -c {escaped_script}
+  echo "Saving the setup environment to $snapshot."
+  sudo {changed_files_cmd} | sudo tar -czpf "$archive" --null -T -
+  gcloud storage cp --no-clobber "$archive" "$snapshot"
+fi
+sudo rm -f "$archive"
+"""
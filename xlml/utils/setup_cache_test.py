@@ -0,0 +1,82 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for setup_cache.py."""
+
+import os
+import shlex
+import subprocess
+import tempfile
+import time
+from absl.testing import absltest
+from xlml.utils import setup_cache
+
+
+class SetupCacheTest(absltest.TestCase):
+
+  def test_get_cache_key(self):
+    key = setup_cache.get_cache_key("pip install a", "v2-alpha-tpuv5")
+
+    self.assertEqual(
+        key, setup_cache.get_cache_key("pip install a", "v2-alpha-tpuv5")
+    )
+    self.assertNotEqual(
+        key, setup_cache.get_cache_key("pip install b", "v2-alpha-tpuv5")
+    )
+    self.assertNotEqual(
+        key, setup_cache.get_cache_key("pip install a", "tpu-ubuntu2204-base")
+    )
+
+  def test_wrap_setup_script(self):
+    setup_script = "set -xue\npip install 'a==1.0'"
+    key = setup_cache.get_cache_key(setup_script, "v2-alpha-tpuv5")
+
+    wrapped = setup_cache.wrap_setup_script(
+        setup_script, "v2-alpha-tpuv5", cache_dir="gs://bucket/cache"
+    )
+
+    self.assertIn(f"snapshot=gs://bucket/cache/{key}.tgz", wrapped)
+    self.assertIn(f"bash -c {shlex.quote(setup_script)}", wrapped)
+
+  def test_get_changed_files_cmd(self):
+    tmp_dir = self.enter_context(tempfile.TemporaryDirectory())
+
+    def write(name):
+      path = os.path.join(tmp_dir, name)
+      with open(path, "w") as f:
+        f.write(name)
+      return path
+
+    write("unchanged.txt")
+    time.sleep(0.01)
+    marker = write("marker")
+    time.sleep(0.01)
+    # dpkg keeps the modification time of the files in a package.
+    apt_file = write("libopenblas.so")
+    os.utime(apt_file, (0, 0))
+    pip_file = write("package.py")
+
+    output = subprocess.run(
+        setup_cache.get_changed_files_cmd(shlex.quote(marker), [tmp_dir]),
+        shell=True,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+    self.assertCountEqual(output.split("\0")[:-1], [apt_file, pip_file])
+
+
+if __name__ == "__main__":
+  absltest.main()
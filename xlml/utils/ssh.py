@@ -12,13 +12,48 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-"""Utility for ssh."""
+"""Utility for ssh.
 
+Connections made with `get_connection` are pooled per process, so every
+command that a process runs on the same host reuses one authenticated
+transport instead of a new handshake. A pooled connection is health-checked
+before it's reused, and replaced if its transport is gone.
+
+`run` fans commands out to many hosts with a bounded number of handshakes at
+once, and reports the exit code and timings of every host. `run_and_check`
+also archives the output of every host with `host_log`.
+"""
+
+import concurrent.futures
 import dataclasses
+import datetime
+import io
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 
+from absl import logging
 from airflow.decorators import task
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.asymmetric import rsa
+from xlml.utils import host_log, lazy
+
+fabric = lazy.import_module('fabric')
+paramiko = lazy.import_module('paramiko')
+
+# See https://stackoverflow.com/a/59453832
+BANNER_TIMEOUT = 200
+
+# Most SSH handshakes that `run` makes at once, since hundreds of them from one
+# worker run into `BANNER_TIMEOUT`.
+MAX_CONCURRENT_CONNECTS = 32
+CONNECT_RETRIES = 3
+CONNECT_BACKOFF = datetime.timedelta(seconds=5)
+
+# Most failed hosts to log the last lines of output of.
+MAX_FAILED_TAILS = 5
 
 
 @dataclasses.dataclass
@@ -47,3 +82,299 @@ def generate_ssh_keys() -> SshKeys:
   )
 
   return SshKeys(private=private_key.decode(), public=public_key.decode())
+
+
+@dataclasses.dataclass
+class HostResult:
+  """Result of running commands on one host."""
+
+  host: str
+  exit_code: Optional[int] = None
+  connect_seconds: float = 0.0
+  run_seconds: float = 0.0
+  error: Optional[str] = None
+  log_file: Optional[str] = None
+  tail: List[str] = dataclasses.field(default_factory=list)
+
+  @property
+  def ok(self) -> bool:
+    return self.exit_code == 0
+
+
+_lock = threading.RLock()
+_keys: Dict[str, 'paramiko.PKey'] = {}
+_connections: Dict[
+    Tuple[str, str, str, Optional[str]], 'fabric.Connection'
+] = {}
+
+
+def _reset() -> None:
+  """Forget all pooled keys and connections."""
+  with _lock:
+    _keys.clear()
+    _connections.clear()
+
+
+# Sockets must not be shared across `fork`. Airflow forks a new process for
+# each task, so start every child with an empty pool.
+if hasattr(os, 'register_at_fork'):
+  os.register_at_fork(after_in_child=_reset)
+
+
+def _load_key(ssh_keys: SshKeys) -> 'paramiko.PKey':
+  """Parse the private key once per process."""
+  with _lock:
+    if ssh_keys.private not in _keys:
+      _keys[ssh_keys.private] = paramiko.RSAKey.from_private_key(
+          io.StringIO(ssh_keys.private)
+      )
+    return _keys[ssh_keys.private]
+
+
+def _is_healthy(connection: 'fabric.Connection') -> bool:
+  """Whether a pooled connection can be reused.
+
+  Connections that were never opened are healthy, since they connect on first
+  use.
+  """
+  transport = connection.transport
+  if transport is None:
+    return True
+  if not transport.is_active():
+    return False
+  try:
+    transport.send_ignore()
+  except (EOFError, OSError, paramiko.SSHException):
+    return False
+  return True
+
+
+def get_connection(
+    host: str,
+    user: str,
+    ssh_keys: SshKeys,
+    gateway: Optional[str] = None,
+) -> 'fabric.Connection':
+  """Get a pooled connection to a host, reconnecting if it is broken.
+
+  Args:
+    host: The IP address or host name to connect to.
+    user: The user to log in as.
+    ssh_keys: The SSH key pair to use for authentication.
+    gateway: Optional proxy command to connect through.
+
+  Returns:
+    A connection that is shared by every caller in the worker process.
+  """
+  key = (host, user, ssh_keys.public, gateway)
+  with _lock:
+    connection = _connections.get(key)
+    if connection is not None and not _is_healthy(connection):
+      logging.info(f'Reconnecting to {host}.')
+      connection.close()
+      connection = None
+    if connection is None:
+      connection = fabric.Connection(
+          host,
+          user=user,
+          connect_kwargs={
+              'auth_strategy': paramiko.auth_strategy.InMemoryPrivateKey(
+                  user, _load_key(ssh_keys)
+              ),
+              'banner_timeout': BANNER_TIMEOUT,
+          },
+          gateway=gateway,
+          config=fabric.Config(
+              overrides={'runners': {'remote': host_log.get_runner_class()}}
+          ),
+      )
+      _connections[key] = connection
+    return connection
+
+
+def get_connections(
+    hosts: Iterable[str],
+    user: str,
+    ssh_keys: SshKeys,
+    gateway: Optional[str] = None,
+) -> List['fabric.Connection']:
+  """Get pooled connections to every host.
+
+  Connections are keyed by host rather than by TPU or VM name, so a reused
+  name with new hosts never gets a stale connection.
+
+  Args:
+    hosts: The IP addresses or host names to connect to.
+    user: The user to log in as.
+    ssh_keys: The SSH key pair to use for authentication.
+    gateway: Optional proxy command to connect through.
+
+  Returns:
+    Connections in the order of `hosts`, opened on first use.
+  """
+  return [get_connection(host, user, ssh_keys, gateway) for host in hosts]
+
+
+def _open(
+    connection: 'fabric.Connection',
+    retries: int,
+    backoff: datetime.timedelta,
+) -> None:
+  """Open a connection, retrying with exponential backoff."""
+  for attempt in range(retries + 1):
+    try:
+      connection.open()
+      return
+    except (EOFError, OSError, paramiko.SSHException) as e:
+      if attempt == retries:
+        raise
+      delay = backoff.total_seconds() * 2**attempt
+      logging.warning(
+          f'Unable to connect to {connection.host}, retrying in {delay}s: {e}'
+      )
+      time.sleep(delay)
+
+
+def run(
+    connections: Sequence['fabric.Connection'],
+    cmds: str,
+    env: Optional[Dict[str, str]] = None,
+    max_concurrent_connects: int = MAX_CONCURRENT_CONNECTS,
+    connect_retries: int = CONNECT_RETRIES,
+    connect_backoff: datetime.timedelta = CONNECT_BACKOFF,
+    staged: bool = True,
+    log_dir: Optional[str] = None,
+) -> List[HostResult]:
+  """Run commands on every host, with few SSH handshakes at once.
+
+  Commands start on each host as soon as it is connected, and then run on all
+  hosts at the same time, since multi-host workloads wait for every worker.
+  Only connecting is bounded by `max_concurrent_connects`.
+
+  Args:
+    connections: Connections to the hosts, with worker 0 first.
+    cmds: The commands to run on every host.
+    env: Environment variables of the commands.
+    max_concurrent_connects: Most handshakes to run at once.
+    connect_retries: How many times to retry a handshake on each host.
+    connect_backoff: Delay before the first retry, doubled for each retry.
+    staged: Whether to connect to worker 0 before any other host, so that
+      misconfigured keys or networks fail without hundreds of handshakes.
+    log_dir: Local directory to capture the output of each host in with a
+      `host_log.HostLog`. Only worker 0 is streamed to the Airflow log. If
+      unset, the output of every host goes to the Airflow log.
+
+  Returns:
+    The result on each host, in the order of `connections`. Failures on one
+    host never stop the commands on the other hosts.
+  """
+  results = [HostResult(connection.host) for connection in connections]
+  semaphore = threading.BoundedSemaphore(max_concurrent_connects)
+
+  def connect(i: int) -> None:
+    start = time.monotonic()
+    try:
+      with semaphore:
+        _open(connections[i], connect_retries, connect_backoff)
+    finally:
+      results[i].connect_seconds = time.monotonic() - start
+
+  def run_on_host(i: int, connected: bool) -> None:
+    result = results[i]
+    try:
+      if not connected:
+        connect(i)
+      streams = {}
+      if log_dir:
+        result.log_file = f'{i:04d}-{result.host}.log.gz'
+        log = host_log.HostLog(
+            result.host, os.path.join(log_dir, result.log_file), live=i == 0
+        )
+        streams = {'out_stream': log, 'err_stream': log}
+      start = time.monotonic()
+      try:
+        output = connections[i].run(cmds, env=env or {}, warn=True, **streams)
+      finally:
+        result.run_seconds = time.monotonic() - start
+        if log_dir:
+          log.close()
+          result.tail = list(log.tail)
+      result.exit_code = output.exited
+    except Exception as e:
+      result.error = f'{type(e).__name__}: {e}'
+
+  if staged and connections:
+    try:
+      connect(0)
+    except Exception as e:
+      results[0].error = f'{type(e).__name__}: {e}'
+      for result in results[1:]:
+        result.error = f'Not run, since {results[0].host} is unreachable'
+      return results
+
+  with concurrent.futures.ThreadPoolExecutor(
+      max_workers=max(len(connections), 1)
+  ) as executor:
+    futures = [
+        executor.submit(run_on_host, i, staged and i == 0)
+        for i in range(len(connections))
+    ]
+    concurrent.futures.wait(futures)
+
+  return results
+
+
+def check_results(results: Sequence[HostResult]) -> None:
+  """Log the results on every host, and raise if any host failed.
+
+  Raises:
+    RuntimeError: The commands failed or didn't run on a host.
+  """
+  if results:
+    slowest_connect = max(results, key=lambda r: r.connect_seconds)
+    slowest_run = max(results, key=lambda r: r.run_seconds)
+    logging.info(
+        f'Ran on {len(results)} hosts. Slowest connect:'
+        f' {slowest_connect.host} in {slowest_connect.connect_seconds:.1f}s.'
+        f' Slowest run: {slowest_run.host} in'
+        f' {slowest_run.run_seconds:.1f}s.'
+    )
+
+  failed = [r for r in results if not r.ok]
+  for r in failed:
+    logging.error(
+        f'{r.host} failed with exit code {r.exit_code}'
+        + (f': {r.error}' if r.error else '')
+    )
+  for r in failed[:MAX_FAILED_TAILS]:
+    if r.tail:
+      logging.error(host_log.format_tail(r.host, r.tail))
+  if failed:
+    raise RuntimeError(
+        f'Commands failed on {len(failed)} of {len(results)} hosts:'
+        f' {[r.host for r in failed]}'
+    )
+
+
+def run_and_check(
+    connections: Sequence['fabric.Connection'],
+    cmds: str,
+    env: Optional[Dict[str, str]] = None,
+) -> List[HostResult]:
+  """Run commands on every host, archive their logs, and check the results.
+
+  The logs and an index of the results of every host go to
+  `host_log.get_gcs_log_dir()`.
+
+  Raises:
+    RuntimeError: The commands failed or didn't run on a host.
+  """
+  with tempfile.TemporaryDirectory() as log_dir:
+    results = run(connections, cmds, env=env, log_dir=log_dir)
+    host_log.archive(
+        log_dir,
+        host_log.get_gcs_log_dir(),
+        [dataclasses.asdict(result) for result in results],
+    )
+  check_results(results)
+  return results
@@ -0,0 +1,157 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for ssh.py."""
+
+import os
+import tempfile
+from unittest import mock
+from absl.testing import absltest
+from xlml.utils import ssh
+
+
+class SshTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    ssh._reset()
+    self.keys = ssh.generate_ssh_keys.function()
+
+  def tearDown(self):
+    ssh._reset()
+    super().tearDown()
+
+  def test_get_connection_pooled(self):
+    first = ssh.get_connection("10.0.0.1", "user", self.keys)
+
+    self.assertIs(first, ssh.get_connection("10.0.0.1", "user", self.keys))
+    self.assertIsNot(first, ssh.get_connection("10.0.0.2", "user", self.keys))
+    self.assertEqual(first.user, "user")
+    self.assertEqual(first.connect_kwargs["banner_timeout"], ssh.BANNER_TIMEOUT)
+
+  def test_get_connection_replaces_inactive_transport(self):
+    first = ssh.get_connection("10.0.0.1", "user", self.keys)
+    first.transport = mock.MagicMock()
+    first.transport.is_active.return_value = False
+
+    self.assertIsNot(first, ssh.get_connection("10.0.0.1", "user", self.keys))
+
+  def test_get_connection_replaces_broken_transport(self):
+    first = ssh.get_connection("10.0.0.1", "user", self.keys)
+    first.transport = mock.MagicMock()
+    first.transport.send_ignore.side_effect = EOFError()
+
+    self.assertIsNot(first, ssh.get_connection("10.0.0.1", "user", self.keys))
+
+  def test_get_connection_reuses_healthy_transport(self):
+    first = ssh.get_connection("10.0.0.1", "user", self.keys)
+    first.transport = mock.MagicMock()
+
+    self.assertIs(first, ssh.get_connection("10.0.0.1", "user", self.keys))
+    first.transport.send_ignore.assert_called_once()
+
+  def test_get_connections(self):
+    connections = ssh.get_connections(
+        ["10.0.0.1", "10.0.0.2"], "user", self.keys
+    )
+
+    self.assertEqual([c.host for c in connections], ["10.0.0.1", "10.0.0.2"])
+    self.assertIs(
+        connections[0], ssh.get_connection("10.0.0.1", "user", self.keys)
+    )
+
+
+def _make_connection(host, exit_code=0, open_error=None):
+  connection = mock.MagicMock(host=host)
+  connection.open.side_effect = open_error
+  connection.run.return_value.exited = exit_code
+  return connection
+
+
+class RunTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.sleep = self.enter_context(mock.patch.object(ssh.time, "sleep"))
+
+  def test_run(self):
+    connections = [_make_connection("w0"), _make_connection("w1", 1)]
+
+    results = ssh.run(connections, "train", env={"A": "1"})
+
+    self.assertEqual([r.exit_code for r in results], [0, 1])
+    self.assertEqual([r.ok for r in results], [True, False])
+    for connection in connections:
+      connection.open.assert_called_once()
+      connection.run.assert_called_once_with("train", env={"A": "1"}, warn=True)
+
+  def test_run_retries_connect(self):
+    connection = _make_connection("w0", open_error=[EOFError(), None])
+
+    (result,) = ssh.run([connection], "train")
+
+    self.assertTrue(result.ok)
+    self.assertEqual(connection.open.call_count, 2)
+    self.sleep.assert_called_once_with(ssh.CONNECT_BACKOFF.total_seconds())
+
+  def test_run_continues_after_unreachable_host(self):
+    unreachable = _make_connection("w1", open_error=OSError("timed out"))
+    connections = [_make_connection("w0"), unreachable, _make_connection("w2")]
+
+    results = ssh.run(connections, "train", connect_retries=1)
+
+    self.assertEqual([r.exit_code for r in results], [0, None, 0])
+    self.assertIn("timed out", results[1].error)
+    self.assertEqual(unreachable.open.call_count, 2)
+    unreachable.run.assert_not_called()
+
+  def test_run_staged_stops_if_worker_0_unreachable(self):
+    connections = [
+        _make_connection("w0", open_error=OSError("timed out")),
+        _make_connection("w1"),
+    ]
+
+    results = ssh.run(connections, "train", connect_retries=0)
+
+    self.assertIn("timed out", results[0].error)
+    self.assertIn("Not run", results[1].error)
+    connections[1].open.assert_not_called()
+
+  def test_run_with_log_dir(self):
+    def write_output(cmds, out_stream, **_):
+      out_stream.write(f"ran {cmds}\n")
+      return mock.MagicMock(exited=0)
+
+    connection = _make_connection("w0")
+    connection.run.side_effect = write_output
+    log_dir = self.enter_context(tempfile.TemporaryDirectory())
+
+    (result,) = ssh.run([connection], "train", log_dir=log_dir)
+
+    self.assertEqual(result.log_file, "0000-w0.log.gz")
+    self.assertEqual(result.tail, ["ran train"])
+    self.assertTrue(os.path.exists(os.path.join(log_dir, result.log_file)))
+
+  def test_check_results(self):
+    ssh.check_results([ssh.HostResult("w0", exit_code=0)])
+
+    with self.assertRaisesRegex(RuntimeError, "1 of 2 hosts: \\['w1'\\]"):
+      ssh.check_results([
+          ssh.HostResult("w0", exit_code=0),
+          ssh.HostResult("w1", exit_code=1),
+      ])
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -0,0 +1,232 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Utilities to stage local files and directories on test hosts.
+
+Files are addressed by the hash of their contents, so each version is only
+uploaded once, and commands and DAGs only carry a short path instead of the
+files themselves. Workloads download staged files from GCS with the commands
+from `get_download_cmds`, after `upload` has run. SSH hosts get them over SFTP
+with `put`, on the connections that run their commands.
+"""
+
+import concurrent.futures
+import dataclasses
+import hashlib
+import os
+import shlex
+import tarfile
+import tempfile
+from typing import Any, Iterable, Sequence, Tuple
+
+from absl import logging
+from airflow.decorators import task
+from dags import gcs_bucket
+from xlml.utils import auth, lazy, ssh
+
+fabric = lazy.import_module("fabric")
+storage = lazy.import_module("google.cloud.storage")
+
+
+# Directory on SSH hosts that staged files are kept in, so that hosts that are
+# reused across tests only receive each version once.
+REMOTE_CACHE_DIR = "/tmp/xlml-staging"
+
+
+@dataclasses.dataclass(frozen=True)
+class StagedFile:
+  """A local file or directory to make available on test hosts.
+
+  Attributes:
+    local_path: Path of the file or directory on the Airflow worker.
+    digest: Hash of the contents, from `stage`.
+    is_dir: Whether `local_path` is a directory, which is staged as a tarball.
+  """
+
+  local_path: str
+  digest: str
+  is_dir: bool = False
+
+  @property
+  def name(self) -> str:
+    """Name of the file or directory on the test host."""
+    return os.path.basename(os.path.normpath(self.local_path))
+
+  @property
+  def object_name(self) -> str:
+    """Name of the staged file in its content-addressed folder."""
+    return f"{self.name}.tar.gz" if self.is_dir else self.name
+
+
+def _hash_file(path: str, sha: Any) -> None:
+  with open(path, "rb") as f:
+    for chunk in iter(lambda: f.read(1 << 20), b""):
+      sha.update(chunk)
+
+
+def stage(local_path: str) -> StagedFile:
+  """Hash a local file or directory so that it can be staged.
+
+  Args:
+    local_path: Path of the file or directory on the Airflow worker.
+
+  Returns:
+    The file to pass as `staged_files` of a test config, or to `upload`,
+    `get_download_cmds` and `put`.
+  """
+  sha = hashlib.sha256()
+  if not os.path.isdir(local_path):
+    _hash_file(local_path, sha)
+    return StagedFile(local_path, sha.hexdigest()[:32])
+
+  for root, dirs, files in os.walk(local_path):
+    dirs.sort()
+    for name in sorted(files):
+      path = os.path.join(root, name)
+      sha.update(os.path.relpath(path, local_path).encode())
+      sha.update(b"\0")
+      _hash_file(path, sha)
+  return StagedFile(local_path, sha.hexdigest()[:32], is_dir=True)
+
+
+def get_gcs_path(
+    staged: StagedFile, staging_dir: str = gcs_bucket.STAGING_DIR
+) -> str:
+  """Get the content-addressed GCS path of a staged file."""
+  return f"{staging_dir}/{staged.digest}/{staged.object_name}"
+
+
+def _make_tarball(staged: StagedFile, dest_dir: str) -> str:
+  """Pack a staged directory into `dest_dir` and return the tarball path."""
+  path = os.path.join(dest_dir, staged.object_name)
+  with tarfile.open(path, "w:gz") as tar:
+    tar.add(staged.local_path, arcname=staged.name)
+  return path
+
+
+@task
+def upload(
+    staged_files: Sequence[StagedFile],
+    staging_dir: str = gcs_bucket.STAGING_DIR,
+) -> None:
+  """Upload staged files to GCS, unless the same contents are already there.
+
+  Args:
+    staged_files: Files to upload.
+    staging_dir: GCS directory of the staged files.
+  """
+  bucket_name, _, prefix = staging_dir.removeprefix("gs://").partition("/")
+  bucket = auth.get_client(storage.Client).bucket(bucket_name)
+  for staged in staged_files:
+    blob = bucket.blob(f"{prefix}/{staged.digest}/{staged.object_name}")
+    if blob.exists():
+      logging.info(f"{staged.local_path} is already staged at {blob.name}.")
+      continue
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      if staged.is_dir:
+        path = _make_tarball(staged, tmp_dir)
+      else:
+        path = staged.local_path
+      blob.upload_from_filename(path)
+    logging.info(f"Staged {staged.local_path} at {blob.name}.")
+
+
+def get_download_cmds(
+    staged_files: Iterable[StagedFile],
+    dest_dir: str = ".",
+    staging_dir: str = gcs_bucket.STAGING_DIR,
+) -> Tuple[str, ...]:
+  """Get commands that download staged files from GCS on a test host.
+
+  Args:
+    staged_files: Files that `upload` staged.
+    dest_dir: Directory to download the files to.
+    staging_dir: GCS directory of the staged files.
+
+  Returns:
+    Commands that download all files with one parallel copy and unpack the
+    directories.
+  """
+  staged_files = list(staged_files)
+  if not staged_files:
+    return ()
+
+  dest = shlex.quote(dest_dir)
+  cmds = [
+      f"mkdir -p {dest}",
+      "gcloud storage cp "
+      + " ".join(get_gcs_path(s, staging_dir) for s in staged_files)
+      + f" {dest}/",
+  ]
+  for staged in staged_files:
+    if staged.is_dir:
+      tarball = shlex.quote(os.path.join(dest_dir, staged.object_name))
+      cmds.append(f"tar -xzf {tarball} -C {dest} && rm {tarball}")
+  return tuple(cmds)
+
+
+def put(
+    connections: Sequence["fabric.Connection"],
+    staged_files: Sequence[StagedFile],
+    dest_dir: str = ".",
+) -> None:
+  """Copy staged files to SSH hosts over SFTP.
+
+  Each version is copied to `REMOTE_CACHE_DIR` on a host at most once, and
+  then copied to `dest_dir`, relative to the home directory.
+
+  Args:
+    connections: Connections to the hosts, e.g. from `ssh.get_connections`.
+    staged_files: Files to copy.
+    dest_dir: Directory to copy the files to.
+  """
+  if not staged_files or not connections:
+    return
+
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    local_paths = {
+        staged: _make_tarball(staged, tmp_dir)
+        if staged.is_dir
+        else staged.local_path
+        for staged in staged_files
+    }
+
+    def put_on_host(connection: "fabric.Connection") -> None:
+      for staged, local_path in local_paths.items():
+        cache_dir = f"{REMOTE_CACHE_DIR}/{staged.digest}"
+        cached = f"{cache_dir}/{staged.object_name}"
+        if connection.run(f"test -e {cached}", warn=True, hide=True).failed:
+          connection.run(f"mkdir -p {cache_dir}", hide=True)
+          connection.put(local_path, f"{cached}.part")
+          connection.run(f"mv {cached}.part {cached}", hide=True)
+
+        dest = shlex.quote(dest_dir)
+        if staged.is_dir:
+          copy = f"tar -xzf {cached} -C {dest}"
+        else:
+          copy = f"cp {cached} {dest}/"
+        connection.run(f"mkdir -p {dest} && {copy}", hide=True)
+
+    # Copying opens connections that aren't open yet, so it is bounded like
+    # handshakes in `ssh.run`.
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=min(len(connections), ssh.MAX_CONCURRENT_CONNECTS)
+    ) as executor:
+      for _ in executor.map(put_on_host, connections):
+        pass
+  logging.info(
+      f"Staged {[s.local_path for s in staged_files]} on"
+      f" {len(connections)} hosts."
+  )
@@ -0,0 +1,123 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for staging.py."""
+
+import os
+import tempfile
+from unittest import mock
+from absl.testing import absltest
+from xlml.utils import auth, staging
+
+_DIR = "gs://bucket/staging"
+
+
+class StagingTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.tmp_dir = self.enter_context(tempfile.TemporaryDirectory())
+
+  def _write(self, relpath: str, content: str) -> str:
+    path = os.path.join(self.tmp_dir, relpath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+      f.write(content)
+    return path
+
+  def test_stage_file(self):
+    path = self._write("a/test.sh", "echo hi")
+    same = self._write("b/test.sh", "echo hi")
+    other = self._write("c/test.sh", "echo bye")
+
+    staged = staging.stage(path)
+
+    self.assertEqual(staged.name, "test.sh")
+    self.assertEqual(staged.object_name, "test.sh")
+    self.assertFalse(staged.is_dir)
+    self.assertEqual(staged.digest, staging.stage(same).digest)
+    self.assertNotEqual(staged.digest, staging.stage(other).digest)
+
+  def test_stage_dir(self):
+    self._write("tests/a.py", "a")
+    self._write("tests/sub/b.py", "b")
+    dir_path = os.path.join(self.tmp_dir, "tests")
+
+    staged = staging.stage(dir_path + "/")
+    digest = staged.digest
+    self._write("tests/sub/b.py", "changed")
+
+    self.assertTrue(staged.is_dir)
+    self.assertEqual(staged.object_name, "tests.tar.gz")
+    self.assertNotEqual(staging.stage(dir_path).digest, digest)
+
+  def test_get_download_cmds(self):
+    script = staging.StagedFile("/dags/test.sh", "abc")
+    tests = staging.StagedFile("/dags/tests", "def", is_dir=True)
+
+    cmds = staging.get_download_cmds((script, tests), staging_dir=_DIR)
+
+    self.assertEqual(
+        cmds,
+        (
+            "mkdir -p .",
+            f"gcloud storage cp {_DIR}/abc/test.sh {_DIR}/def/tests.tar.gz ./",
+            "tar -xzf ./tests.tar.gz -C . && rm ./tests.tar.gz",
+        ),
+    )
+
+  def test_get_download_cmds_without_files(self):
+    self.assertEqual(staging.get_download_cmds(()), ())
+
+  @mock.patch.object(auth, "get_client")
+  def test_upload(self, get_client):
+    new = staging.stage(self._write("new.sh", "new"))
+    old = staging.stage(self._write("old.sh", "old"))
+    bucket = get_client.return_value.bucket.return_value
+    blobs = {}
+
+    def make_blob(name):
+      blob = blobs[name] = mock.MagicMock()
+      blob.exists.return_value = name.endswith("old.sh")
+      return blob
+
+    bucket.blob.side_effect = make_blob
+
+    staging.upload.function((new, old), staging_dir=_DIR)
+
+    get_client.return_value.bucket.assert_called_once_with("bucket")
+    new_blob = blobs[f"staging/{new.digest}/new.sh"]
+    new_blob.upload_from_filename.assert_called_once_with(new.local_path)
+    old_blob = blobs[f"staging/{old.digest}/old.sh"]
+    old_blob.upload_from_filename.assert_not_called()
+
+  def test_put(self):
+    staged = staging.stage(self._write("test.sh", "echo hi"))
+    cached = f"{staging.REMOTE_CACHE_DIR}/{staged.digest}/test.sh"
+    missing, present = mock.MagicMock(), mock.MagicMock()
+    missing.run.return_value.failed = True
+    present.run.return_value.failed = False
+
+    staging.put((missing, present), (staged,))
+
+    missing.put.assert_called_once_with(staged.local_path, f"{cached}.part")
+    present.put.assert_not_called()
+    for connection in (missing, present):
+      connection.run.assert_called_with(
+          f"mkdir -p . && cp {cached} ./", hide=True
+      )
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -0,0 +1,175 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Utilities to run parameter sweeps with dynamic task mapping."""
+
+import datetime
+import itertools
+import os
+from typing import Any, Dict, Iterable, List, Optional
+from absl import logging
+from airflow.decorators import task
+from airflow.operators.python import get_current_context
+from airflow.utils.trigger_rule import TriggerRule
+from xlml.apis import metric_config
+from xlml.utils import metric
+
+
+def get_param_grid(sweep_params: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+  """Get every combination of sweep parameter values.
+
+  Args:
+    sweep_params: A dict that maps each parameter to the values to sweep over.
+
+  Returns:
+    A list of dicts that map each parameter to one of its values.
+  """
+  keys = list(sweep_params)
+  return [
+      dict(zip(keys, values))
+      for values in itertools.product(*sweep_params.values())
+  ]
+
+
+@task(multiple_outputs=True)
+def generate_sweep_run(
+    benchmark_id: str,
+    params: Dict[str, Any],
+    test_script: str,
+    base_output_directory: Optional[str] = None,
+) -> Dict[str, Optional[str]]:
+  """Generate the run name and commands for one point of a mapped sweep.
+
+  Args:
+    benchmark_id: Benchmark id of the sweep.
+    params: Parameters of this point, exported as environment variables.
+    test_script: Script of the test config to run with the parameters.
+    base_output_directory: GCS path that the model writes TensorBoard summaries
+      under, if any.
+
+  Returns:
+    A dict with the `run_name`, the `run_cmds` script, and the
+    `tb_file_location` regex of the TensorBoard file for this point.
+  """
+  map_index = get_current_context()["ti"].map_index
+  current_datetime = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+  run_name = f"{benchmark_id}-{map_index}-{current_datetime}"
+
+  exports = [f"export {key}={value}" for key, value in params.items()]
+  run_cmds = ";".join(
+      ("set -xue", f"export M_RUN_NAME={run_name}", *exports, test_script)
+  )
+
+  tb_file_location = None
+  if base_output_directory:
+    tb_file_location = os.path.join(
+        base_output_directory, run_name, "tensorboard", "events.out.tfevents.*"
+    )
+
+  return {
+      "run_name": run_name,
+      "run_cmds": run_cmds,
+      "tb_file_location": tb_file_location,
+  }
+
+
+def get_num_halving_rounds(num_trials: int, eta: int) -> int:
+  """Get the number of successive halving rounds to narrow down to one trial.
+
+  Args:
+    num_trials: Number of trials in the first round.
+    eta: Factor by which each round shrinks the number of trials.
+
+  Returns:
+    The number of rounds, including the last one with a single trial.
+  """
+  num_rounds = 1
+  while num_trials > 1:
+    num_trials = max(1, num_trials // eta)
+    num_rounds += 1
+  return num_rounds
+
+
+@task(trigger_rule=TriggerRule.ALL_DONE)
+def get_trial_result(
+    params: Dict[str, Any],
+    tb_file_location: str,
+    metric_key: str,
+    aggregation_strategy: metric_config.AggregationStrategy,
+) -> Dict[str, Any]:
+  """Read the aggregated metric of a sweep trial from its TensorBoard summary.
+
+  Runs even if the trial failed, so that every mapped instance has a result.
+
+  Args:
+    params: Parameters of the trial.
+    tb_file_location: Regex of the TensorBoard file of the trial.
+    metric_key: TensorBoard tag of the metric.
+    aggregation_strategy: The strategy to aggregate the metric over steps.
+
+  Returns:
+    A dict with the trial's `params` and its `metric`, which is None if the
+    trial failed or didn't report the metric.
+  """
+  value = None
+  try:
+    file_location = metric.get_gcs_file_location_with_regex(tb_file_location)
+    metrics, _ = metric.read_from_tb(file_location, [metric_key], None)
+    if metrics.get(metric_key):
+      value = metric.aggregate_metrics(
+          metrics[metric_key], aggregation_strategy
+      )
+  except Exception as e:
+    logging.warning(f"Failed to read {metric_key} for trial {params}: {e}")
+
+  logging.info(f"Trial {params} has {metric_key}={value}.")
+  return {"params": params, "metric": value}
+
+
+@task(trigger_rule=TriggerRule.ALL_DONE)
+def select_trials(
+    results: Iterable[Dict[str, Any]],
+    num_trials: int,
+    maximize: bool,
+    budget_param: str,
+    budget: Optional[int],
+) -> List[Dict[str, Any]]:
+  """Select the best trials of a successive halving round.
+
+  Trials without a metric, e.g. because they ran out of memory, are pruned.
+
+  Args:
+    results: Results of the round from `get_trial_result`.
+    num_trials: Number of trials to keep.
+    maximize: Whether higher values of the metric are better.
+    budget_param: Parameter that sets the budget of a trial.
+    budget: Budget of the selected trials in the next round. Keeps the current
+      budget if None.
+
+  Returns:
+    Parameters of the selected trials, best first.
+  """
+  results = list(results)
+  completed = [r for r in results if r["metric"] is not None]
+  logging.info(
+      f"Pruned {len(results) - len(completed)} trials without a metric."
+  )
+
+  completed.sort(key=lambda r: r["metric"], reverse=maximize)
+  selected = [dict(r["params"]) for r in completed[:num_trials]]
+  for params in selected:
+    logging.info(f"Selected trial {params}.")
+    if budget is not None:
+      params[budget_param] = budget
+  return selected
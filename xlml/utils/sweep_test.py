@@ -0,0 +1,98 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for sweep.py."""
+
+from unittest import mock
+from absl.testing import absltest
+from xlml.utils import sweep
+
+
+class SweepTest(absltest.TestCase):
+
+  def test_get_param_grid(self):
+    grid = sweep.get_param_grid({"A": [1, 2], "B": ["x", "y"]})
+
+    self.assertEqual(
+        grid,
+        [
+            {"A": 1, "B": "x"},
+            {"A": 1, "B": "y"},
+            {"A": 2, "B": "x"},
+            {"A": 2, "B": "y"},
+        ],
+    )
+
+  def test_generate_sweep_run(self):
+    context = {"ti": mock.MagicMock(map_index=3)}
+
+    with mock.patch.object(sweep, "get_current_context", return_value=context):
+      sweep_run = sweep.generate_sweep_run.function(
+          "benchmark",
+          {"A": 1},
+          "set -xue;gcloud storage cp gs://staging/abc/train.py ./;python3 train.py",
+          "gs://bucket/output",
+      )
+
+    run_name = sweep_run["run_name"]
+    self.assertStartsWith(run_name, "benchmark-3-")
+    self.assertEqual(
+        sweep_run["run_cmds"],
+        f"set -xue;export M_RUN_NAME={run_name};export A=1;"
+        "set -xue;gcloud storage cp gs://staging/abc/train.py ./;python3 train.py",
+    )
+    self.assertEqual(
+        sweep_run["tb_file_location"],
+        f"gs://bucket/output/{run_name}/tensorboard/events.out.tfevents.*",
+    )
+
+  def test_get_num_halving_rounds(self):
+    self.assertEqual(sweep.get_num_halving_rounds(1, 3), 1)
+    self.assertEqual(sweep.get_num_halving_rounds(2, 3), 2)
+    self.assertEqual(sweep.get_num_halving_rounds(9, 3), 3)
+    self.assertEqual(sweep.get_num_halving_rounds(8, 2), 4)
+
+  def test_select_trials(self):
+    results = [
+        {"params": {"A": 1, "STEPS": 10}, "metric": 0.5},
+        {"params": {"A": 2, "STEPS": 10}, "metric": None},
+        {"params": {"A": 3, "STEPS": 10}, "metric": 0.9},
+        {"params": {"A": 4, "STEPS": 10}, "metric": 0.7},
+    ]
+
+    selected = sweep.select_trials.function(results, 2, True, "STEPS", 30)
+
+    self.assertEqual(selected, [{"A": 3, "STEPS": 30}, {"A": 4, "STEPS": 30}])
+    self.assertEqual(results[2]["params"]["STEPS"], 10)
+
+  def test_select_trials_minimize_last_round(self):
+    results = [
+        {"params": {"A": 1, "STEPS": 90}, "metric": 0.5},
+        {"params": {"A": 3, "STEPS": 90}, "metric": 0.9},
+    ]
+
+    selected = sweep.select_trials.function(results, 1, False, "STEPS", None)
+
+    self.assertEqual(selected, [{"A": 1, "STEPS": 90}])
+
+  def test_select_trials_all_failed(self):
+    results = [{"params": {"A": 1, "STEPS": 10}, "metric": None}]
+
+    selected = sweep.select_trials.function(results, 1, True, "STEPS", 30)
+
+    self.assertEmpty(selected)
+
+
+if __name__ == "__main__":
+  absltest.main()
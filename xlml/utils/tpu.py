@@ -14,11 +14,11 @@
 
 """Utilities to create, delete, and SSH with TPUs."""
 
+import concurrent.futures
 import datetime
-import io
 import itertools
 import os
-from typing import Dict, Iterable, Optional, Tuple, Union
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
 import uuid
 
 from absl import logging
@@ -28,18 +28,29 @@ from airflow.utils.task_group import TaskGroup
 from airflow.operators.python import get_current_context
 from airflow.models import Variable
 from xlml.apis import gcp_config, test_config
-from xlml.utils import ssh, startup_script
-import fabric
+from xlml.utils import auth, lazy, ssh, staging, startup_script
 import google.api_core.exceptions
-import google.auth
-import google.cloud.tpu_v2alpha1 as tpu_api
-import google.longrunning.operations_pb2 as operations
-import paramiko
-from google.protobuf.duration_pb2 import Duration
+
+tpu_api = lazy.import_module('google.cloud.tpu_v2alpha1')
+operations = lazy.import_module('google.longrunning.operations_pb2')
+duration_pb2 = lazy.import_module('google.protobuf.duration_pb2')
 
 
 TTL = 'ttl'
 
+ENDPOINTS_XCOM_PREFIX = 'tpu_endpoints:'
+
+# Most `get_node` calls to make at once for a multi-slice queued resource.
+MAX_CONCURRENT_NODE_FETCHES = 16
+
+# Stops processes that a previous test left on the TPU, so that the next test
+# can use it.
+RESET_SCRIPT = '\n'.join((
+    'set -xu',
+    'sudo lsof -t /dev/accel* /dev/vfio/* 2>/dev/null | xargs -r sudo kill -9',
+    'sudo rm -rf /tmp/tpu_logs',
+))
+
 
 @task
 def generate_tpu_name(
@@ -61,6 +72,7 @@ def create_queued_resource(
         test_config.TpuVmTest, test_config.JSonnetTpuVmTest
     ],
     use_startup_script: bool = False,
+    run_timeout: Optional[datetime.timedelta] = None,
 ) -> Tuple[TaskGroup, airflow.XComArg]:
   """Request a QueuedResource and wait until the nodes are created.
 
@@ -72,6 +84,8 @@ def create_queued_resource(
     timeout: Amount of time to wait for TPUs to be created.
     task_test_config: Test config of the task.
     use_startup_script: Indicator to use startup script.
+    run_timeout: Time that tests may run on the TPU, which counts towards its
+      TTL. Defaults to the timeout of `task_test_config`.
 
   Returns:
     A TaskGroup for the entire create operation and an XCom value for the
@@ -82,8 +96,7 @@ def create_queued_resource(
   def create_queued_resource_request(
       tpu_name: str, ssh_keys: ssh.SshKeys
   ) -> str:
-    creds, _ = google.auth.default()
-    client = tpu_api.TpuClient(credentials=creds)
+    client = auth.get_client(tpu_api.TpuClient)
 
     parent = f'projects/{gcp.project_name}/locations/{gcp.zone}'
 
@@ -115,7 +128,9 @@ def create_queued_resource(
     }
 
     create_tpu_timeout_in_sec = int(timeout.total_seconds())
-    if task_test_config.timeout:
+    if run_timeout:
+      run_model_timeout_in_sec = int(run_timeout.total_seconds())
+    elif task_test_config.timeout:
       run_model_timeout_in_sec = int(task_test_config.timeout.total_seconds())
     else:
       run_model_timeout_in_sec = 0
@@ -156,7 +171,9 @@ def create_queued_resource(
             reserved=accelerator.reserved,
         ),
         queueing_policy=tpu_api.QueuedResource.QueueingPolicy(
-            valid_until_duration=Duration(seconds=int(timeout.total_seconds())),
+            valid_until_duration=duration_pb2.Duration(
+                seconds=int(timeout.total_seconds())
+            ),
         ),
     )
 
@@ -175,8 +192,7 @@ def create_queued_resource(
       poke_interval=60, timeout=timeout.total_seconds(), mode='reschedule'
   )
   def wait_for_ready_queued_resource(qualified_name: str):
-    creds, _ = google.auth.default()
-    client = tpu_api.TpuClient(credentials=creds)
+    client = auth.get_client(tpu_api.TpuClient)
 
     qr = client.get_queued_resource(name=qualified_name)
     state = qr.state.state
@@ -211,13 +227,10 @@ def create_queued_resource(
 
   with TaskGroup(group_id='create_queued_resource') as tg:
     qualified_name = create_queued_resource_request(tpu_name, ssh_keys)
+    wait_for_ready = wait_for_ready_queued_resource(qualified_name)
 
     if use_startup_script:
-      wait_for_ready_queued_resource(
-          qualified_name
-      ) >> check_if_startup_script_end(qualified_name, ssh_keys)
-    else:
-      wait_for_ready_queued_resource(qualified_name)
+      wait_for_ready >> check_if_startup_script_end(qualified_name, ssh_keys)
 
   return tg, qualified_name
 
@@ -228,14 +241,16 @@ def delete_queued_resource(qualified_name: airflow.XComArg):
 
   Args:
     qualified_name: XCom value holding the qualified name of the queued
-      resource.
+      resource. Nothing is deleted if it is None.
   """
 
   @task(trigger_rule='all_done')
-  def delete_tpu_nodes_request(qualified_name: str):
-    # TODO(wcromar): Find a less repetitive way to manage the TPU client.
-    creds, _ = google.auth.default()
-    client = tpu_api.TpuClient(credentials=creds)
+  def delete_tpu_nodes_request(qualified_name: Optional[str]):
+    if not qualified_name:
+      logging.info('No queued resource to delete')
+      return
+
+    client = auth.get_client(tpu_api.TpuClient)
 
     try:
       qr = client.get_queued_resource(name=qualified_name)
@@ -251,9 +266,11 @@ def delete_queued_resource(qualified_name: airflow.XComArg):
         logging.info(f'{node.node_id} is already deleted')
 
   @task.sensor(poke_interval=60, timeout=3600, mode='reschedule')
-  def wait_for_tpu_deletion(qualified_name: str):
-    creds, _ = google.auth.default()
-    client = tpu_api.TpuClient(credentials=creds)
+  def wait_for_tpu_deletion(qualified_name: Optional[str]):
+    if not qualified_name:
+      return True
+
+    client = auth.get_client(tpu_api.TpuClient)
 
     try:
       qr = client.get_queued_resource(name=qualified_name)
@@ -278,9 +295,13 @@ def delete_queued_resource(qualified_name: airflow.XComArg):
     return False
 
   @task(trigger_rule='all_done')
-  def delete_queued_resource_request(qualified_name: str) -> Optional[str]:
-    creds, _ = google.auth.default()
-    client = tpu_api.TpuClient(credentials=creds)
+  def delete_queued_resource_request(
+      qualified_name: Optional[str],
+  ) -> Optional[str]:
+    if not qualified_name:
+      return None
+
+    client = auth.get_client(tpu_api.TpuClient)
 
     try:
       op = client.delete_queued_resource(name=qualified_name)
@@ -297,8 +318,7 @@ def delete_queued_resource(qualified_name: airflow.XComArg):
       logging.info('No delete operation given')
       return True
 
-    creds, _ = google.auth.default()
-    client = tpu_api.TpuClient(credentials=creds)
+    client = auth.get_client(tpu_api.TpuClient)
 
     op = client.get_operation(operations.GetOperationRequest(name=op_name))
     return op.done
@@ -325,6 +345,68 @@ def kill_process_by_pid() -> str:
   """
 
 
+def _fetch_endpoints(qualified_name: str) -> Dict[str, Any]:
+  """Get the worker IP addresses of a queued resource from the TPU API."""
+  client = auth.get_client(tpu_api.TpuClient)
+  queued_resource = client.get_queued_resource(name=qualified_name)
+  node_names = [
+      os.path.join(node.parent, 'nodes', node.node_id)
+      for node in queued_resource.tpu.node_spec
+  ]
+  with concurrent.futures.ThreadPoolExecutor(
+      max_workers=min(len(node_names), MAX_CONCURRENT_NODE_FETCHES)
+  ) as executor:
+    nodes = list(
+        executor.map(lambda name: client.get_node(name=name), node_names)
+    )
+
+  endpoints = list(
+      itertools.chain.from_iterable(node.network_endpoints for node in nodes)
+  )
+  return {
+      'accelerator_type': nodes[0].accelerator_type,
+      'ip_addresses': [endpoint.ip_address for endpoint in endpoints],
+      'external_ips': [
+          endpoint.access_config.external_ip for endpoint in endpoints
+      ],
+  }
+
+
+def get_endpoints(qualified_name: str) -> Dict[str, Any]:
+  """Get the worker IP addresses of a queued resource, cached in XCom.
+
+  The first task of a test that looks up a queued resource pushes its
+  endpoints to XCom, so later SSH tasks of the test don't call the TPU API.
+  Only the XComs of upstream tasks with the same map index are read, so that
+  a test never uses the entry of another mapped test.
+
+  Args:
+    qualified_name: The qualified name of a queued resource.
+
+  Returns:
+    A dict with the `accelerator_type` of the TPU and the `ip_addresses` and
+    `external_ips` of every worker, with worker 0 first.
+  """
+  context = get_current_context()
+  ti = context['ti']
+  key = f'{ENDPOINTS_XCOM_PREFIX}{qualified_name}'
+  upstream_task_ids = sorted(
+      context['task'].get_flat_relative_ids(upstream=True)
+  )
+  if upstream_task_ids:
+    cached = ti.xcom_pull(
+        task_ids=upstream_task_ids, key=key, map_indexes=ti.map_index
+    )
+    endpoints = next((value for value in cached if value), None)
+    if endpoints:
+      logging.info(f'Using endpoints of {qualified_name} from XCom.')
+      return endpoints
+
+  endpoints = _fetch_endpoints(qualified_name)
+  ti.xcom_push(key=key, value=endpoints)
+  return endpoints
+
+
 @task
 def ssh_tpu(
     qualified_name: str,
@@ -332,6 +414,7 @@ def ssh_tpu(
     ssh_keys: ssh.SshKeys,
     all_workers: bool,
     env: Dict[str, str] = None,
+    staged_files: Iterable[staging.StagedFile] = (),
 ) -> None:
   """SSH TPU and run commands in multi process.
 
@@ -342,44 +425,25 @@ def ssh_tpu(
    all_workers: The flag to define if run commands on all workers or worker 0
      only.
    env: environment variables to be pass to the ssh runner session using dict.
+   staged_files: Files from `staging.stage` to copy to the home directory of
+     the workers before running the commands.
   """
-  creds, _ = google.auth.default()
-  client = tpu_api.TpuClient(credentials=creds)
-
-  queued_resource = client.get_queued_resource(name=qualified_name)
-
-  nodes = [
-      client.get_node(name=os.path.join(node.parent, 'nodes', node.node_id))
-      for node in queued_resource.tpu.node_spec
-  ]
-
-  if all_workers:
-    endpoints = itertools.chain.from_iterable(
-        node.network_endpoints for node in nodes
-    )
-  else:
-    endpoints = [nodes[0].network_endpoints[0]]
+  endpoints = get_endpoints(qualified_name)
 
   use_external_ips = os.getenv('XLMLTEST_SSH_EXTERNAL_IPS', '0') == '1'
   if use_external_ips:
-    ip_addresses = [
-        endpoint.access_config.external_ip for endpoint in endpoints
-    ]
+    ip_addresses = endpoints['external_ips']
   else:
-    ip_addresses = [endpoint.ip_address for endpoint in endpoints]
+    ip_addresses = endpoints['ip_addresses']
+  if not all_workers:
+    ip_addresses = ip_addresses[:1]
 
   logging.info(f'Connecting to IP addresses of workers: {ip_addresses}')
 
-  pkey = paramiko.RSAKey.from_private_key(io.StringIO(ssh_keys.private))
-  ssh_group = fabric.ThreadingGroup(
-      *ip_addresses,
-      connect_kwargs={
-          'auth_strategy': paramiko.auth_strategy.InMemoryPrivateKey(
-              'ml-auto-solutions', pkey
-          ),
-          # See https://stackoverflow.com/a/59453832
-          'banner_timeout': 200,
-      },
+  connections = ssh.get_connections(
+      ip_addresses,
+      'ml-auto-solutions',
+      ssh_keys,
       # Proxy required on Cloudtops to connect to external IPs
       gateway='corp-ssh-helper %h %p' if use_external_ips else None,
   )
@@ -388,16 +452,18 @@ def ssh_tpu(
   if context['task_instance'].try_number > 1:
     # kill TPU process by pid (if any) to avoid `TPU in use` error in retry
     tmp_file = '/tmp/kill_process.sh'
-    accelerator_type = nodes[0].accelerator_type
+    accelerator_type = endpoints['accelerator_type']
     script = kill_process_by_pid()
     kill_process_cmds = (
         f'set -xue; sudo echo "{script}" > {tmp_file}',
         f'bash {tmp_file} {accelerator_type}',
     )
-    ssh_group.run(';'.join(kill_process_cmds))
+    ssh.check_results(ssh.run(connections, ';'.join(kill_process_cmds)))
+
+  staging.put(connections, list(staged_files))
 
   # run provided commands
-  ssh_group.run(cmds, env=env)
+  ssh.run_and_check(connections, cmds, env=env)
 
 
 @task
@@ -410,8 +476,7 @@ def clean_up_idle_queued_resources(
    project_name: The project of resources.
    zones: Available zones to clean up for the project.
   """
-  creds, _ = google.auth.default()
-  client = tpu_api.TpuClient(credentials=creds)
+  client = auth.get_client(tpu_api.TpuClient)
 
   logging.info(f'Cleaning up resources in project {project_name}.')
   for zone in zones:
@@ -438,8 +503,7 @@ def clean_up_idle_nodes(project_name: str, zones: Iterable[str]) -> None:
    project_name: The project of resources.
    zones: Available zones to clean up for the project.
   """
-  creds, _ = google.auth.default()
-  client = tpu_api.TpuClient(credentials=creds)
+  client = auth.get_client(tpu_api.TpuClient)
 
   logging.info(f'Cleaning up nodes in project {project_name}.')
   for zone in zones:
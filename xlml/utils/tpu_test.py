@@ -0,0 +1,117 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for tpu.py."""
+
+import types
+from unittest import mock
+from absl.testing import absltest
+from xlml.utils import tpu
+
+_QR = "projects/project/locations/zone/queuedResources/qr"
+_PARENT = "projects/project/locations/zone"
+
+
+def _make_node(ips):
+  return types.SimpleNamespace(
+      accelerator_type="v4-16",
+      network_endpoints=[
+          types.SimpleNamespace(
+              ip_address=ip,
+              access_config=types.SimpleNamespace(external_ip=f"x{ip}"),
+          )
+          for ip in ips
+      ],
+  )
+
+
+class EndpointsTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.client = mock.MagicMock()
+    self.enter_context(
+        mock.patch.object(tpu.auth, "get_client", return_value=self.client)
+    )
+    self.client.get_queued_resource.return_value.tpu.node_spec = [
+        types.SimpleNamespace(parent=_PARENT, node_id="slice-0"),
+        types.SimpleNamespace(parent=_PARENT, node_id="slice-1"),
+    ]
+    nodes = {
+        f"{_PARENT}/nodes/slice-0": _make_node(["10.0.0.1", "10.0.0.2"]),
+        f"{_PARENT}/nodes/slice-1": _make_node(["10.0.1.1", "10.0.1.2"]),
+    }
+    self.client.get_node.side_effect = lambda name: nodes[name]
+    self.ti = mock.MagicMock(map_index=2)
+    self.task = mock.MagicMock()
+    self.task.get_flat_relative_ids.return_value = {"setup", "create"}
+    self.enter_context(
+        mock.patch.object(
+            tpu,
+            "get_current_context",
+            return_value={"ti": self.ti, "task": self.task},
+        )
+    )
+
+  def test_fetch_endpoints(self):
+    endpoints = tpu._fetch_endpoints(_QR)
+
+    self.assertEqual(
+        endpoints,
+        {
+            "accelerator_type": "v4-16",
+            "ip_addresses": ["10.0.0.1", "10.0.0.2", "10.0.1.1", "10.0.1.2"],
+            "external_ips": [
+                "x10.0.0.1",
+                "x10.0.0.2",
+                "x10.0.1.1",
+                "x10.0.1.2",
+            ],
+        },
+    )
+    self.assertEqual(self.client.get_node.call_count, 2)
+
+  def test_get_endpoints_pushes_to_xcom(self):
+    self.ti.xcom_pull.return_value = []
+
+    endpoints = tpu.get_endpoints(_QR)
+
+    self.ti.xcom_push.assert_called_once_with(
+        key=f"{tpu.ENDPOINTS_XCOM_PREFIX}{_QR}", value=endpoints
+    )
+
+  def test_get_endpoints_from_xcom(self):
+    cached = {"accelerator_type": "v4-8", "ip_addresses": ["10.0.0.9"]}
+    self.ti.xcom_pull.return_value = [None, cached]
+
+    self.assertEqual(tpu.get_endpoints(_QR), cached)
+    self.ti.xcom_pull.assert_called_once_with(
+        task_ids=["create", "setup"],
+        key=f"{tpu.ENDPOINTS_XCOM_PREFIX}{_QR}",
+        map_indexes=2,
+    )
+    self.client.get_queued_resource.assert_not_called()
+    self.ti.xcom_push.assert_not_called()
+
+  def test_get_endpoints_without_upstream_tasks(self):
+    self.task.get_flat_relative_ids.return_value = set()
+
+    tpu.get_endpoints(_QR)
+
+    self.ti.xcom_pull.assert_not_called()
+    self.ti.xcom_push.assert_called_once()
+
+
+if __name__ == "__main__":
+  absltest.main()
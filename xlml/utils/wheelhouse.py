@@ -0,0 +1,203 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Utilities to share downloaded Python wheels and apt packages across VMs.
+
+Wheels are prefetched into GCS by `refresh_wheelhouse` in groups, e.g. one for
+torch and one for jax. Setup commands wrapped by `wrap_set_up_cmds` copy the
+groups they need to the VM and point pip at them. Since pip prefers local
+files over index files with the same version, matching wheels are installed
+from the wheelhouse and anything else still comes from the index.
+
+Apt packages are shared the other way around: every VM restores the packages
+that earlier VMs with the same Ubuntu release saved, and saves the ones it had
+to download.
+"""
+
+import datetime
+import subprocess
+import sys
+import tempfile
+from typing import Iterable, Sequence, Tuple
+
+from absl import logging
+from airflow.decorators import task
+from dags import gcs_bucket
+from xlml.utils import auth, lazy
+
+storage = lazy.import_module("google.cloud.storage")
+
+
+# Directory on the VM that pip finds wheels in.
+LOCAL_DIR = "/tmp/wheelhouse"
+
+APT_ARCHIVE_DIR = "/var/cache/apt/archives"
+
+# Platforms of the TPU and GPU VMs that wheels are prefetched for.
+PLATFORMS = ("manylinux2014_x86_64", "manylinux_2_28_x86_64", "linux_x86_64")
+
+# Saved apt packages that are older are deleted, so that they are saved again
+# by the next VM that downloads them if they are still in use.
+APT_MAX_AGE = datetime.timedelta(days=30)
+
+
+def get_set_up_cmds(
+    groups: Iterable[str], wheelhouse_dir: str = gcs_bucket.WHEELHOUSE_DIR
+) -> Tuple[str, ...]:
+  """Get commands that make pip and apt use the shared packages.
+
+  The commands never fail, so that setup still works without the wheelhouse.
+
+  Args:
+    groups: Groups of wheels to copy to the VM.
+    wheelhouse_dir: GCS directory of the wheelhouse.
+
+  Returns:
+    Commands to run before the setup commands.
+  """
+  sources = " ".join(f"'{wheelhouse_dir}/pip/{group}/*'" for group in groups)
+  cmds = [f"mkdir -p {LOCAL_DIR}"]
+  if sources:
+    cmds.append(
+        f"gcloud storage cp {sources} {LOCAL_DIR}/"
+        " || echo 'Unable to copy wheels from the wheelhouse.'"
+    )
+  cmds.extend((
+      f"python3 -m pip config --user set global.find-links {LOCAL_DIR}",
+      "echo 'Binary::apt::APT::Keep-Downloaded-Packages \"true\";'"
+      " | sudo tee /etc/apt/apt.conf.d/10keep-downloaded-packages",
+      f'sudo gcloud storage cp "{wheelhouse_dir}/apt/$(lsb_release -cs)/*.deb"'
+      f" {APT_ARCHIVE_DIR}/ || echo 'No apt packages in the wheelhouse.'",
+  ))
+  return tuple(cmds)
+
+
+def get_save_cmds(
+    wheelhouse_dir: str = gcs_bucket.WHEELHOUSE_DIR,
+) -> Tuple[str, ...]:
+  """Get commands that save the apt packages the setup downloaded."""
+  return (
+      f"gcloud storage cp --no-clobber {APT_ARCHIVE_DIR}/*.deb"
+      f' "{wheelhouse_dir}/apt/$(lsb_release -cs)/"'
+      " || echo 'Unable to save apt packages to the wheelhouse.'",
+  )
+
+
+def wrap_set_up_cmds(
+    set_up_cmds: Iterable[str],
+    groups: Iterable[str] = (),
+    wheelhouse_dir: str = gcs_bucket.WHEELHOUSE_DIR,
+) -> Tuple[str, ...]:
+  """Wrap setup commands to install packages from the wheelhouse.
+
+  Args:
+    set_up_cmds: Setup commands to wrap.
+    groups: Groups of wheels that the setup commands install.
+    wheelhouse_dir: GCS directory of the wheelhouse.
+
+  Returns:
+    The wrapped setup commands.
+  """
+  return (
+      *get_set_up_cmds(groups, wheelhouse_dir),
+      *set_up_cmds,
+      *get_save_cmds(wheelhouse_dir),
+  )
+
+
+def _download_wheels(
+    requirement: Sequence[str], dest: str, python_version: str
+) -> None:
+  """Download the wheels of a requirement and its dependencies to `dest`."""
+  platforms = [
+      arg for platform in PLATFORMS for arg in ("--platform", platform)
+  ]
+  subprocess.run(
+      [
+          sys.executable,
+          "-m",
+          "pip",
+          "download",
+          "--dest",
+          dest,
+          "--only-binary=:all:",
+          "--python-version",
+          python_version,
+          *platforms,
+          *requirement,
+      ],
+      check=True,
+  )
+
+
+@task
+def refresh_wheelhouse(
+    group: str,
+    requirements: Sequence[Sequence[str]],
+    python_version: str = "3.10",
+    wheelhouse_dir: str = gcs_bucket.WHEELHOUSE_DIR,
+) -> None:
+  """Replace a group of wheels in the wheelhouse with the latest ones.
+
+  Args:
+    group: Name of the group of wheels.
+    requirements: `pip download` arguments of each requirement in the group,
+      e.g. `("--pre", "torch", "--index-url", ...)`.
+    python_version: Python version of the VMs.
+    wheelhouse_dir: GCS directory of the wheelhouse.
+  """
+  failed = []
+  with tempfile.TemporaryDirectory() as dest:
+    for requirement in requirements:
+      try:
+        _download_wheels(requirement, dest, python_version)
+      except subprocess.CalledProcessError as e:
+        logging.error(f"Unable to download {requirement}: {e}")
+        failed.append(requirement)
+
+    # Upload whatever was downloaded, so that one broken nightly doesn't make
+    # every other wheel stale, but keep the old wheels if anything failed.
+    delete_flags = [] if failed else ["--delete-unmatched-destination-objects"]
+    subprocess.run(
+        [
+            "gcloud",
+            "storage",
+            "rsync",
+            *delete_flags,
+            dest,
+            f"{wheelhouse_dir}/pip/{group}",
+        ],
+        check=True,
+    )
+
+  if failed:
+    raise RuntimeError(f"Unable to download {failed} for {group}.")
+
+
+@task
+def delete_old_apt_packages(
+    wheelhouse_dir: str = gcs_bucket.WHEELHOUSE_DIR,
+) -> None:
+  """Delete saved apt packages that are older than `APT_MAX_AGE`."""
+  bucket_name, _, path = wheelhouse_dir.removeprefix("gs://").partition("/")
+  client = auth.get_client(storage.Client)
+  cutoff = datetime.datetime.now(datetime.timezone.utc) - APT_MAX_AGE
+  old = [
+      blob
+      for blob in client.list_blobs(bucket_name, prefix=f"{path}/apt/")
+      if blob.time_created < cutoff
+  ]
+  for blob in old:
+    blob.delete()
+  logging.info(f"Deleted {len(old)} apt packages older than {APT_MAX_AGE}.")
@@ -0,0 +1,79 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for wheelhouse.py."""
+
+import subprocess
+from unittest import mock
+from absl.testing import absltest
+from xlml.utils import wheelhouse
+
+_DIR = "gs://bucket/wheelhouse"
+
+
+class WheelhouseTest(absltest.TestCase):
+
+  def test_wrap_set_up_cmds(self):
+    cmds = wheelhouse.wrap_set_up_cmds(
+        ("pip install torch",), groups=("torch", "jax"), wheelhouse_dir=_DIR
+    )
+
+    self.assertEqual(
+        cmds[1],
+        f"gcloud storage cp '{_DIR}/pip/torch/*' '{_DIR}/pip/jax/*'"
+        f" {wheelhouse.LOCAL_DIR}/"
+        " || echo 'Unable to copy wheels from the wheelhouse.'",
+    )
+    self.assertIn(
+        f"python3 -m pip config --user set global.find-links"
+        f" {wheelhouse.LOCAL_DIR}",
+        cmds,
+    )
+    self.assertEqual(
+        cmds[-2:], ("pip install torch", *wheelhouse.get_save_cmds(_DIR))
+    )
+
+  def test_wrap_set_up_cmds_without_groups(self):
+    cmds = wheelhouse.wrap_set_up_cmds(("apt-get install jq",))
+
+    self.assertFalse(any("/pip/" in cmd for cmd in cmds))
+
+  @mock.patch.object(wheelhouse.subprocess, "run")
+  def test_refresh_wheelhouse(self, run):
+    wheelhouse.refresh_wheelhouse.function(
+        "torch", (("torch",), ("--pre", "torch")), wheelhouse_dir=_DIR
+    )
+
+    self.assertEqual(run.call_count, 3)
+    self.assertEqual(run.call_args_list[1].args[0][-2:], ["--pre", "torch"])
+    rsync = run.call_args_list[-1].args[0]
+    self.assertIn("--delete-unmatched-destination-objects", rsync)
+    self.assertEqual(rsync[-1], f"{_DIR}/pip/torch")
+
+  @mock.patch.object(wheelhouse.subprocess, "run")
+  def test_refresh_wheelhouse_keeps_old_wheels_on_failure(self, run):
+    run.side_effect = [subprocess.CalledProcessError(1, "pip"), None, None]
+
+    with self.assertRaisesRegex(RuntimeError, "Unable to download"):
+      wheelhouse.refresh_wheelhouse.function(
+          "torch", (("torch",), ("torchvision",)), wheelhouse_dir=_DIR
+      )
+
+    rsync = run.call_args_list[-1].args[0]
+    self.assertEqual(rsync[:3], ["gcloud", "storage", "rsync"])
+    self.assertNotIn("--delete-unmatched-destination-objects", rsync)
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -14,6 +14,8 @@
 
 """Utilities to run workloads with xpk (https://github.com/google/xpk)."""
 
+from __future__ import annotations
+
 import os
 import tempfile
 import uuid
@@ -21,12 +23,13 @@ from absl import logging
 from airflow.decorators import task
 from airflow.exceptions import AirflowFailException
 from airflow.hooks.subprocess import SubprocessHook
-from kubernetes import client as k8s_client
 from xlml.apis import metric_config
-from xlml.utils import gke
+from xlml.utils import gke, lazy
 from dags.vm_resource import GpuVersion
 
 
+kubernetes = lazy.import_module("kubernetes")
+
 WORKLOAD_URL_FORMAT = "https://console.cloud.google.com/kubernetes/service/{region}/{cluster}/default/{workload_id}/details?project={project}"
 
 
@@ -88,19 +91,19 @@ def run_workload(
 
 def _get_core_api_client(
     project_id: str, region: str, cluster_name: str
-) -> k8s_client.CoreV1Api:
+) -> kubernetes.client.CoreV1Api:
   """Create a core API client for the given cluster."""
   client = gke.get_authenticated_client(project_id, region, cluster_name)
 
   # Initilize the client
-  core_api = k8s_client.CoreV1Api(client)
+  core_api = kubernetes.client.CoreV1Api(client)
   logging.info("Successful initilize k8s client from cluster response.")
   return core_api
 
 
 def _list_workload_pods(
-    core_api: k8s_client.CoreV1Api, workload_id: str
-) -> k8s_client.V1PodList:
+    core_api: kubernetes.client.CoreV1Api, workload_id: str
+) -> kubernetes.client.V1PodList:
   """List all pods for the given workload."""
   logging.info(f"Getting pods for workload_id: {workload_id}")
   pods = core_api.list_namespaced_pod(